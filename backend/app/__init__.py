@@ -1,9 +1,19 @@
+import os
+from functools import lru_cache
 from pathlib import Path
 import tomllib  # wbudowane w Pythonie 3.11+
 
+# Trwałe dane (stan zadań, wyniki analiz) – w obrazie Dockera wolumen /data
+DATA_DIR = os.environ.get("DATA_DIR") or os.path.join(
+    os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share"),
+    "navidrome-toolbox",
+)
+
+@lru_cache(maxsize=1)
 def get_version() -> str:
+    # Wersja nie zmienia się w trakcie działania – pyproject czytamy raz
     pyproject_path = Path(__file__).resolve().parent / "pyproject.toml"
     data = tomllib.loads(pyproject_path.read_text(encoding="utf-8"))
     return data["project"]["version"]
 
-__all__ = ["get_version"]
+__all__ = ["DATA_DIR", "get_version"]
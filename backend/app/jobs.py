@@ -0,0 +1,331 @@
+"""
+In-memory registry of long-running library jobs (duplicate scans, bulk edits...).
+
+A job runs its function in a background thread pool and reports progress
+through `Job.update`. Watchers poll `to_dict()` or block on `wait()` until the
+version counter moves. Finished jobs stay in a ring buffer for inspection.
+
+With several workers (app.shared_state) every job is also published to the
+shared database: other workers see it as a `RemoteJob` snapshot, and exclusive
+jobs are exclusive across all workers.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Optional
+
+from app import shared_state
+from app.metrics import CallbackMetric
+from app.services.executors import get_thread_pool, lower_thread_priority
+
+logger = logging.getLogger(__name__)
+
+JOB_HISTORY_SIZE = int(os.environ.get("JOB_HISTORY_SIZE", "100"))
+# Ile zadań różnego rodzaju może działać naraz
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+# Co ile sekund strumień /api/jobs/{id}/events sprawdza zmiany
+JOB_EVENTS_INTERVAL = float(os.environ.get("JOB_EVENTS_INTERVAL", "0.25"))
+
+
+class JobCancelled(Exception):
+    """Raised inside a job function when cancellation was requested."""
+
+
+class Job:
+    def __init__(self, kind: str, params: Optional[dict] = None, expose_result: bool = False):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params or {}
+        self.status = "queued"  # queued | running | completed | failed | cancelled
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+        self.progress: dict[str, Any] = {"done": 0, "total": 0}
+        self.result: Any = None
+        # Wynik trafia do API tylko gdy jest mały (np. podsumowanie), nie wewnętrzne dane
+        self.expose_result = expose_result
+        self.version = 0
+        self._cancel = threading.Event()
+        self._changed = threading.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    def _bump(self) -> None:
+        with self._changed:
+            self.version += 1
+            self._changed.notify_all()
+
+    def update(self, **progress) -> None:
+        """Merge progress fields (done, total, phase, ...) and wake watchers."""
+        self.progress.update(progress)
+        self._bump()
+
+    def advance(self, count: int = 1) -> None:
+        self.progress["done"] = self.progress.get("done", 0) + count
+        self._bump()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def check_cancelled(self) -> None:
+        """Call between work items; raises JobCancelled once cancel() was called."""
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    def wait(self, version: int, timeout: float) -> int:
+        """Block until the job changes past `version` (or timeout); returns the new version."""
+        with self._changed:
+            if self.version == version and not self.finished:
+                self._changed.wait(timeout)
+            return self.version
+
+    def to_dict(self) -> dict:
+        data = {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "params": self.params,
+            "progress": dict(self.progress),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.expose_result and self.finished:
+            data["result"] = self.result
+        return data
+
+    def _run(self, target: Callable[["Job"], Any]) -> None:
+        self.status = "running"
+        self.started_at = time.time()
+        self._bump()
+        try:
+            self.result = target(self)
+            self.status = "completed"
+        except JobCancelled:
+            self.status = "cancelled"
+        except Exception as e:
+            self.error = str(e)
+            self.status = "failed"
+        finally:
+            self.finished_at = time.time()
+            _store(self)
+            self._bump()
+            _publish(self)
+
+
+class RemoteJob:
+    """
+    A job of another worker process, as last published to the shared state.
+    Read-only apart from cancel(), which its worker picks up within
+    JOB_EVENTS_INTERVAL. A job whose worker died is reported as failed.
+    """
+
+    def __init__(self, row: dict):
+        data = dict(row["data"])
+        if row["orphaned"]:
+            data.update(status="failed", error="Worker process exited")
+        self._data = data
+        self.job_id: str = data["job_id"]
+        self.kind: str = data["kind"]
+        self.status: str = data["status"]
+        self.created_at: float = data["created_at"]
+        self.finished_at: Optional[float] = data["finished_at"]
+        self.version: int = row["version"]
+        self.cancel_requested: bool = row["cancel"]
+        self._result: Any = None
+        self._result_loaded = False
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    @property
+    def result(self) -> Any:
+        # Wynik (np. grupy duplikatów) bywa duży – czytany dopiero, gdy jest potrzebny
+        if not self._result_loaded:
+            self._result = shared_state.job_result(self.job_id)
+            self._result_loaded = True
+        return self._result
+
+    def cancel(self) -> None:
+        shared_state.request_cancel(self.job_id)
+
+    def to_dict(self) -> dict:
+        return dict(self._data)
+
+
+_history: deque[Job] = deque(maxlen=JOB_HISTORY_SIZE)
+_active: dict[str, Job] = {}
+_lock = threading.Lock()
+
+
+def _store(job: Job) -> None:
+    with _lock:
+        _active.pop(job.job_id, None)
+        _history.append(job)
+
+
+def _publish(job: Job) -> None:
+    """Snapshot of a job of this worker for the others (no-op with a single worker)."""
+    if not shared_state.enabled():
+        return
+    # Wersja przed danymi – opublikowany stan jest co najmniej tak nowy jak wersja
+    version = job.version
+    data = job.to_dict()
+    try:
+        if job.finished:
+            result = job.result if job.status == "completed" else None
+            shared_state.publish_job(job.job_id, version, data, result, keep=JOB_HISTORY_SIZE)
+        else:
+            shared_state.publish_job(job.job_id, version, data)
+    except Exception as e:
+        logger.warning(f"Publishing job {job.job_id} failed: {e}")
+
+
+_publisher: Optional[threading.Thread] = None
+
+
+def _publish_loop() -> None:
+    """
+    Publish progress of this worker's jobs every JOB_EVENTS_INTERVAL (only jobs
+    that changed) and pick up cancellations requested through other workers.
+    """
+    published: dict[str, int] = {}
+    while True:
+        time.sleep(JOB_EVENTS_INTERVAL)
+        with _lock:
+            running = list(_active.values())
+        for job in running:
+            if published.get(job.job_id) != job.version:
+                published[job.job_id] = job.version
+                _publish(job)
+        published = {job.job_id: published[job.job_id] for job in running}
+        try:
+            for job_id in shared_state.cancel_requests():
+                with _lock:
+                    job = _active.get(job_id)
+                if job is not None:
+                    job.cancel()
+        except Exception as e:
+            logger.warning(f"Reading job cancellations failed: {e}")
+
+
+def _start_publisher() -> None:
+    global _publisher
+    with _lock:
+        if _publisher is not None:
+            return
+        _publisher = threading.Thread(target=_publish_loop, name="jobs-publisher", daemon=True)
+    _publisher.start()
+
+
+def start_job(
+    kind: str,
+    target: Callable[[Job], Any],
+    params: Optional[dict] = None,
+    exclusive: bool = False,
+    expose_result: bool = False,
+) -> Job:
+    """
+    Queue `target(job)` in the background job pool.
+    With `exclusive`, a running job of the same kind (in any worker) is returned
+    instead of starting another.
+    With `expose_result`, the return value of `target` is included in to_dict() once finished.
+    """
+    with _lock:
+        if exclusive:
+            running = next((j for j in _active.values() if j.kind == kind), None)
+            if running is not None:
+                return running
+        job = Job(kind, params, expose_result)
+        if shared_state.enabled():
+            other = shared_state.claim_job(
+                job.job_id, kind, job.created_at, job.to_dict(), exclusive
+            )
+            if other is not None:
+                return RemoteJob(other)
+        _active[job.job_id] = job
+    if shared_state.enabled():
+        _start_publisher()
+    pool = get_thread_pool("jobs", JOB_WORKERS, initializer=lower_thread_priority)
+    pool.submit(job._run, target)
+    return job
+
+
+def get_job(job_id: str) -> Optional[Job | RemoteJob]:
+    with _lock:
+        if job_id in _active:
+            return _active[job_id]
+        job = next((j for j in _history if j.job_id == job_id), None)
+    if job is None and shared_state.enabled():
+        row = shared_state.load_job(job_id)
+        return RemoteJob(row) if row else None
+    return job
+
+
+def reload(job: Job | RemoteJob) -> Job | RemoteJob:
+    """Current state of `job`: a local Job is always current, a RemoteJob is read again."""
+    if isinstance(job, RemoteJob):
+        return get_job(job.job_id) or job
+    return job
+
+
+def _with_remote(jobs: list, kind: Optional[str], limit: int) -> list:
+    """Add jobs published by other workers (not already in `jobs`)."""
+    known = {j.job_id for j in jobs}
+    remote = [
+        RemoteJob(row)
+        for row in shared_state.load_jobs(kind, limit + len(known))
+        if row["data"]["job_id"] not in known
+    ]
+    return sorted(jobs + remote, key=lambda j: (j.finished, -j.created_at))
+
+
+def list_jobs(kind: Optional[str] = None, limit: int = 50) -> list[Job | RemoteJob]:
+    """Running jobs first, then finished ones, newest first."""
+    with _lock:
+        jobs = list(_active.values()) + list(reversed(_history))
+    if kind:
+        jobs = [j for j in jobs if j.kind == kind]
+    if shared_state.enabled():
+        jobs = _with_remote(jobs, kind, limit)
+    return jobs[:limit]
+
+
+def latest_job(kind: str, status: Optional[str] = None) -> Optional[Job | RemoteJob]:
+    """Most recently created job of `kind` (optionally with the given status)."""
+    with _lock:
+        jobs = [j for j in list(_active.values()) + list(_history) if j.kind == kind]
+    if shared_state.enabled():
+        jobs = _with_remote(jobs, kind, JOB_HISTORY_SIZE)
+    if status:
+        jobs = [j for j in jobs if j.status == status]
+    return max(jobs, key=lambda j: j.created_at, default=None)
+
+
+def _active_counts() -> dict[tuple[str, ...], int]:
+    with _lock:
+        counts: dict[tuple[str, ...], int] = {}
+        for job in _active.values():
+            counts[(job.kind,)] = counts.get((job.kind,), 0) + 1
+        return counts
+
+
+CallbackMetric(
+    "toolbox_library_jobs_active",
+    "Library jobs queued or running, per kind",
+    _active_counts,
+    ("kind",),
+)
@@ -0,0 +1,143 @@
+"""
+Deferred imports of heavy dependencies.
+
+yt-dlp (hundreds of extractor modules), NumPy and mutagen's format modules
+are most of the app's own import time, while most requests (/health, file
+listings served from the catalog) never touch them. Modules that use them
+hold stand-ins from `lazy_module` / `lazy_attr` instead; the real import runs
+on first use (importlib's module lock makes that thread-safe). After startup
+`start_preload()` imports everything registered in a background thread, so the
+server answers at once and the first request needing yt-dlp rarely waits.
+"""
+
+import importlib
+import importlib.util
+import logging
+import os
+import threading
+import time
+from typing import Any, Optional
+
+from app.metrics import CallbackMetric
+
+logger = logging.getLogger(__name__)
+
+# Import w tle po starcie (0 = dopiero przy pierwszym użyciu)
+PRELOAD_IMPORTS = os.environ.get("PRELOAD_IMPORTS", "1") != "0"
+
+# Moduł -> czas importu (s); None = jeszcze nie zaimportowany
+_imports: dict[str, Optional[float]] = {}
+_lock = threading.Lock()
+
+CallbackMetric(
+    "toolbox_lazy_import_seconds",
+    "Import time of deferred heavy modules (only modules imported so far)",
+    lambda: {(name,): seconds for name, seconds in import_times().items() if seconds is not None},
+    ("module",),
+)
+
+
+def _import(name: str):
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    with _lock:
+        if _imports.get(name) is None:
+            _imports[name] = time.perf_counter() - started
+    return module
+
+
+class LazyModule:
+    """Module stand-in; the first attribute access imports the module."""
+
+    def __init__(self, name: str):
+        self._lazy_name = name
+        self._lazy_target = None
+
+    def __getattr__(self, attr: str) -> Any:
+        module = self._lazy_target
+        if module is None:
+            module = self._lazy_target = _import(self._lazy_name)
+        # Atrybuty nie są kopiowane – podmiany w module (np. benchmarks.offline_youtube) działają
+        return getattr(module, attr)
+
+    def __repr__(self) -> str:
+        return f"<lazy module {self._lazy_name}>"
+
+
+class LazyAttr:
+    """Class or function of a lazily imported module, called and read like the original."""
+
+    def __init__(self, module: str, attr: str):
+        self._lazy_module = module
+        self._lazy_attr = attr
+        self._lazy_target = None
+
+    def _load(self) -> Any:
+        target = self._lazy_target
+        if target is None:
+            target = self._lazy_target = getattr(_import(self._lazy_module), self._lazy_attr)
+        return target
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    def __repr__(self) -> str:
+        return f"<lazy {self._lazy_module}.{self._lazy_attr}>"
+
+
+def lazy_module(name: str, optional: bool = False) -> Optional[LazyModule]:
+    """
+    Stand-in for `import name`. With `optional`, None when the package is not
+    installed (checked without importing it), like `except ImportError`.
+    """
+    if optional and importlib.util.find_spec(name) is None:
+        return None
+    with _lock:
+        _imports.setdefault(name, None)
+    return LazyModule(name)
+
+
+def lazy_attr(module: str, attr: str) -> LazyAttr:
+    """Stand-in for `from module import attr`."""
+    with _lock:
+        _imports.setdefault(module, None)
+    return LazyAttr(module, attr)
+
+
+def preload() -> dict[str, float]:
+    """Import every registered module now; returns import times of the ones loaded here."""
+    loaded = {}
+    for name in sorted(_imports):
+        if _imports[name] is not None:
+            continue
+        try:
+            _import(name)
+        except Exception as e:
+            logger.warning(f"Preloading {name} failed: {e}")
+            continue
+        loaded[name] = _imports[name]
+    return loaded
+
+
+def start_preload() -> Optional[threading.Thread]:
+    """Run preload() in a background thread (if PRELOAD_IMPORTS is on)."""
+    if not PRELOAD_IMPORTS:
+        return None
+
+    def run():
+        started = time.perf_counter()
+        loaded = preload()
+        logger.info(f"Preloaded {len(loaded)} modules in {time.perf_counter() - started:.2f}s")
+
+    thread = threading.Thread(target=run, name="preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def import_times() -> dict[str, Optional[float]]:
+    """Registered modules and how long their import took (None = not imported yet)."""
+    with _lock:
+        return dict(_imports)
@@ -1,11 +1,50 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
-from app.routers import health, youtube, files
+from app import lazy
+from app.routers import (
+    autofill,
+    debug,
+    duplicates,
+    files,
+    health,
+    integrity,
+    jobs,
+    loudness,
+    metrics,
+    transcode,
+    youtube,
+)
+from app.services import catalog_service, integrity_service
+from app.services.executors import shutdown_pools
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Katalog ładuje się w tle – /health odpowiada od razu, /ready dopiero po skanie
+    if catalog_service.CATALOG_WARM_UP:
+        catalog_service.start_warm_up()
+    integrity_service.start_scheduler()
+    # yt-dlp, NumPy i mutagen są importowane leniwie – tu w tle, zanim przyjdzie pierwsze żądanie
+    lazy.start_preload()
+    yield
+    shutdown_pools(wait=False)
+
 
 app = FastAPI(
     title="Navidrome Toolbox API",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 app.include_router(health.router)
+app.include_router(metrics.router)
 app.include_router(youtube.router, prefix="/api/youtube", tags=["youtube"])
 app.include_router(files.router, prefix="/api/files", tags=["files"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
+app.include_router(duplicates.router, prefix="/api/duplicates", tags=["duplicates"])
+app.include_router(integrity.router, prefix="/api/integrity", tags=["integrity"])
+app.include_router(transcode.router, prefix="/api/transcode", tags=["transcode"])
+app.include_router(loudness.router, prefix="/api/loudness", tags=["loudness"])
+app.include_router(autofill.router, prefix="/api/autofill", tags=["autofill"])
+app.include_router(debug.router, prefix="/api/debug", tags=["debug"])
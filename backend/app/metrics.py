@@ -0,0 +1,255 @@
+"""
+Minimal Prometheus metrics registry (text exposition format 0.0.4).
+
+Counters, gauges and histograms keep their samples in process memory; callback
+metrics read live values (pool depths, cache counters) at scrape time.
+"""
+
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+LabelValues = tuple[str, ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_registry: list["_Metric"] = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels: dict) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # etykiety -> (liczniki kubełków, suma, liczba obserwacji)
+        self._values: dict[LabelValues, tuple[list[int], float, int]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total, count = self._values.get(
+                key, ([0] * len(self.buckets), 0.0, 0)
+            )
+            if index < len(counts):
+                counts[index] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def timed(self, func: Callable) -> Callable:
+        """Decorator observing the wall time of every call."""
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.time():
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            items = [(k, (list(c), t, n)) for k, (c, t, n) in self._values.items()]
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            yield f"{self.name}_bucket{labels} {count}"
+            plain = _format_labels(self.labelnames, key)
+            yield f"{self.name}_sum{plain} {_format_value(total)}"
+            yield f"{self.name}_count{plain} {count}"
+
+
+class CallbackMetric(_Metric):
+    """Gauge or counter whose samples are read from a callback at scrape time."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], dict[LabelValues, float]],
+        labelnames: tuple[str, ...] = (),
+        type_name: str = "gauge",
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+        self.type_name = type_name
+
+    def samples(self) -> Iterator[str]:
+        try:
+            values = self.callback()
+        except Exception:
+            return
+        for key, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+def render(registry: Optional[list[_Metric]] = None) -> str:
+    """Render every registered metric in Prometheus text format."""
+    with _registry_lock:
+        metrics = list(registry if registry is not None else _registry)
+    return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+# --- Metryki wspólne dla serwisów ---
+
+FILE_SCAN_SECONDS = Histogram(
+    "toolbox_file_scan_seconds", "Time spent walking the music directory"
+)
+FILE_SCAN_FILES = Gauge(
+    "toolbox_file_scan_files", "Music files found by the last directory walk"
+)
+METADATA_EXTRACT_SECONDS = Histogram(
+    "toolbox_metadata_extract_seconds",
+    "Time spent parsing tags of one file with mutagen",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+METADATA_EXTRACT_ERRORS = Counter(
+    "toolbox_metadata_extract_errors_total",
+    "Files whose tags could not be parsed",
+    ("format",),
+)
+COVER_EXTRACT_SECONDS = Histogram(
+    "toolbox_cover_extract_seconds",
+    "Time spent extracting embedded cover art",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+YTDLP_SECONDS = Histogram(
+    "toolbox_ytdlp_seconds",
+    "Duration of yt-dlp operations",
+    ("operation",),
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600),
+)
+YTDLP_ERRORS = Counter(
+    "toolbox_ytdlp_errors_total", "Failed yt-dlp operations", ("operation",)
+)
+JOBS_IN_FLIGHT = Gauge(
+    "toolbox_jobs_in_flight", "Jobs currently being processed", ("kind",)
+)
+
+# nazwa cache -> funkcja zwracająca (trafienia, chybienia)
+_caches: dict[str, Callable[[], tuple[int, int]]] = {}
+
+
+def register_cache(name: str, stats: Callable[[], tuple[int, int]]) -> None:
+    """Expose hit/miss counters of a cache under the `cache` label."""
+    _caches[name] = stats
+
+
+CallbackMetric(
+    "toolbox_cache_hits_total",
+    "Cache lookups answered from the cache",
+    lambda: {(name,): stats()[0] for name, stats in list(_caches.items())},
+    ("cache",),
+    type_name="counter",
+)
+CallbackMetric(
+    "toolbox_cache_misses_total",
+    "Cache lookups that had to compute or fetch the value",
+    lambda: {(name,): stats()[1] for name, stats in list(_caches.items())},
+    ("cache",),
+    type_name="counter",
+)
@@ -0,0 +1,129 @@
+"""
+Fast response encoding for large payloads.
+
+Trusted data (catalog rows) is encoded straight to bytes with orjson, without
+pydantic revalidation, and compressed with brotli or gzip when the client
+accepts it. MessagePack is available when `msgpack` is installed.
+"""
+
+import gzip
+import json
+import os
+from typing import Any, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson jest w requirements.txt
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Mniejsze odpowiedzi nie są kompresowane – narzut nagłówków i CPU się nie opłaca
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.environ.get("RESPONSE_GZIP_LEVEL", "5"))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get("RESPONSE_BROTLI_QUALITY", "4"))
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+}
+
+
+def json_bytes(payload: Any) -> bytes:
+    """Encode plain JSON-compatible data (dicts, lists, str, numbers, None)."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def msgpack_bytes(payload: Any) -> bytes:
+    if msgpack is None:
+        raise ValueError("MessagePack support is not installed (pip install msgpack)")
+    return msgpack.packb(payload, use_bin_type=True)
+
+
+def _accepted_encodings(header: Optional[str]) -> set[str]:
+    accepted = set()
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name and quality > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def compress(body: bytes, accept_encoding: Optional[str]) -> tuple[bytes, Optional[str]]:
+    """Compress `body` with the best encoding the client accepts (brotli, then gzip)."""
+    if len(body) < RESPONSE_COMPRESS_MIN_BYTES:
+        return body, None
+    accepted = _accepted_encodings(accept_encoding)
+    if brotli is not None and "br" in accepted:
+        return brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY), "br"
+    if "gzip" in accepted or "*" in accepted:
+        return gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL, mtime=0), "gzip"
+    return body, None
+
+
+def encoded_response(
+    payload: Any,
+    request: Optional[Request] = None,
+    fmt: str = "json",
+    status_code: int = 200,
+    headers: Optional[dict[str, str]] = None,
+) -> Response:
+    """
+    Build a response from already-trusted data, skipping response_model validation.
+    `fmt` is "json" or "msgpack"; the body is compressed when the client allows it.
+    """
+    if fmt == "msgpack":
+        body = msgpack_bytes(payload)
+    else:
+        body = json_bytes(payload)
+
+    accept_encoding = request.headers.get("accept-encoding") if request else None
+    body, encoding = compress(body, accept_encoding)
+
+    response_headers = {"Vary": "Accept-Encoding", **(headers or {})}
+    if encoding:
+        response_headers["Content-Encoding"] = encoding
+    return Response(
+        content=body,
+        status_code=status_code,
+        media_type=MEDIA_TYPES.get(fmt, MEDIA_TYPES["json"]),
+        headers=response_headers,
+    )
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True when If-None-Match lists `etag` (weak comparison) or is `*`."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    wanted = etag.removeprefix("W/")
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == wanted:
+            return True
+    return False
+
+
+def not_modified(headers: dict[str, str]) -> Response:
+    return Response(status_code=304, headers=headers)
@@ -0,0 +1,50 @@
+from fastapi import APIRouter, HTTPException
+
+from app.schemas.autofill import AutofillApplyRequest, AutofillRequest, AutofillSources
+from app.schemas.jobs import JobInfo
+from app.services import autofill_service
+
+router = APIRouter()
+
+
+@router.post("", response_model=JobInfo, status_code=202)
+async def start_autofill(payload: AutofillRequest):
+    """
+    Build tag proposals for files with missing tags as a background job.
+    Nothing is written yet – the proposals are the job result
+    (/api/jobs/{job_id}); accept them with /api/autofill/apply.
+    """
+    try:
+        job = autofill_service.start_autofill(ids=payload.ids or None, source=payload.source)
+        return JobInfo(**job.to_dict())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/sources", response_model=AutofillSources)
+async def get_autofill_sources():
+    return AutofillSources(
+        sources=autofill_service.sources(),
+        patterns=[p.strip() for p in autofill_service.AUTOFILL_PATTERNS.split(";") if p.strip()],
+    )
+
+
+@router.post("/apply", response_model=JobInfo, status_code=202)
+async def apply_autofill(payload: AutofillApplyRequest):
+    """
+    Write the accepted proposals as one bulk tag job (the same as /api/files/tags).
+    """
+    try:
+        job = autofill_service.apply_proposals(
+            payload.job_id,
+            ids=payload.ids,
+            edits={e.id: e.tags.model_dump(exclude_unset=True) for e in payload.edits},
+            rollback_on_error=payload.rollback_on_error,
+        )
+        return JobInfo(**job.to_dict())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
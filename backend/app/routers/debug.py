@@ -0,0 +1,36 @@
+from typing import Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from app import tracing
+from app.schemas.debug import TraceInfo, TraceListResponse
+
+router = APIRouter()
+
+
+@router.get("/traces", response_model=TraceListResponse)
+async def list_traces(
+    operation: Optional[str] = Query(
+        None, description="search, formats, formats_prefetch, playlist or download"
+    ),
+    order: Literal["slowest", "recent"] = Query("slowest"),
+    limit: int = Query(20, ge=1, le=500),
+    include_running: bool = Query(False, description="Include unfinished traces"),
+):
+    """
+    Recent yt-dlp operations with per-phase timings, slowest first by default.
+    """
+    traces = tracing.list_traces(
+        operation=operation, order=order, limit=limit, include_running=include_running
+    )
+    return TraceListResponse(
+        traces=[TraceInfo(**trace.to_dict()) for trace in traces], count=len(traces)
+    )
+
+
+@router.get("/traces/{trace_id}", response_model=TraceInfo)
+async def get_trace(trace_id: str):
+    trace = tracing.get_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return TraceInfo(**trace.to_dict())
@@ -0,0 +1,51 @@
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Query
+
+from app.schemas.duplicates import DuplicatesResponse
+from app.schemas.jobs import JobInfo
+from app.services.duplicate_service import latest_result, start_scan
+
+router = APIRouter()
+
+
+@router.post("/scan", response_model=JobInfo, status_code=202)
+async def scan_duplicates(
+    tags: bool = Query(False, description="Also match tracks by normalised artist and title"),
+):
+    """
+    Start a duplicate scan in the background (or return the one already running).
+    Poll GET /api/duplicates or /api/jobs/{job_id} for progress.
+    """
+    return JobInfo(**start_scan(tags=tags).to_dict())
+
+
+@router.get("", response_model=DuplicatesResponse)
+async def get_duplicates(
+    kind: Optional[Literal["exact", "tags"]] = Query(None),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=1000),
+):
+    """
+    Duplicate groups from the last completed scan, largest waste first,
+    with file metadata taken from the current catalog.
+    """
+    job, result = latest_result(kind)
+    job_info = JobInfo(**job.to_dict()) if job else None
+    if result is None:
+        return DuplicatesResponse(job=job_info, offset=offset, limit=limit)
+    groups = sorted(
+        result["groups"],
+        key=lambda g: sum(f["file_size"] for f in g["files"][1:]),
+        reverse=True,
+    )
+    return DuplicatesResponse(
+        job=job_info,
+        scanned_at=result["scanned_at"],
+        stats=result["stats"],
+        wasted_bytes=result["wasted_bytes"],
+        total=len(groups),
+        offset=offset,
+        limit=limit,
+        groups=groups[offset : offset + limit],
+    )
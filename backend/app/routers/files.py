@@ -1,12 +1,28 @@
 import base64
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import StreamingResponse
+import os
+from stat import S_ISREG
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from typing import Optional
 
-from app.schemas.files import FileItem, FileListRequest, FileListResponse
+from app.responses import encoded_response, etag_matches, not_modified
+from app.schemas.jobs import JobInfo
+from app.services import catalog_service, preview_service, tag_service, waveform_service
+from app.services.export_service import (
+    EXPORT_FORMATS,
+    export_catalog,
+    parse_fields,
+    parse_missing,
+)
+from app.schemas.files import (
+    BulkTagRequest,
+    FileChangesResponse,
+    FileItem,
+    FileListRequest,
+    FileListResponse,
+)
 from app.services.file_service import (
     list_files,
-    get_file_by_id,
     get_cover_art,
     get_cover_mime_type,
 )
@@ -16,11 +32,20 @@ router = APIRouter()
 
 @router.get("", response_model=FileListResponse)
 async def get_files(
+    request: Request,
     offset: int = Query(0, ge=0, description="Offset for pagination"),
     limit: int = Query(50, ge=1, le=1000, description="Number of items to fetch"),
     search: Optional[str] = Query(
         None, description="Search query for title, artist, album, or filename"
     ),
+    response_format: str = Query(
+        "json", alias="format", pattern="^(json|msgpack)$", description="json or msgpack"
+    ),
+    layout: str = Query(
+        "rows",
+        pattern="^(rows|columns)$",
+        description="rows = list of items, columns = one list per field",
+    ),
 ):
     """
     Get list of music files with pagination and optional search.
@@ -30,21 +55,102 @@ async def get_files(
     - ID3 tags (title, artist, album, year, track_number, genre)
     - Audio properties (duration, bitrate)
     - Cover art indicator (has_cover)
+
+    Rows come from the trusted catalog, so they are encoded directly
+    (gzip/brotli when accepted) instead of being revalidated as FileItem.
+    The ETag is the catalog generation: If-None-Match answers 304 until any file changes.
+    """
+    try:
+        headers = _generation_headers(catalog_service.generation())
+        if etag_matches(request, headers["ETag"]):
+            return not_modified(headers)
+        result = list_files(offset=offset, limit=limit, search=search, layout=layout)
+        return encoded_response(result, request, fmt=response_format, headers=headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _generation_headers(generation: int) -> dict[str, str]:
+    return {
+        "ETag": f'W/"{generation}"',
+        "X-Catalog-Generation": str(generation),
+        "Cache-Control": "no-cache",
+    }
+
+
+@router.get("/changes", response_model=FileChangesResponse)
+async def get_changes(
+    request: Request,
+    since: int = Query(..., ge=0, description="Catalog generation the client already has"),
+):
+    """
+    Files added or changed after generation `since` and IDs of removed files.
+    `reset: true` means the delta is no longer available – reload /api/files or /export.
     """
     try:
-        result = list_files(offset=offset, limit=limit, search=search)
-        return FileListResponse(
-            items=result["items"],
-            total=result["total"],
-            offset=result["offset"],
-            limit=result["limit"],
-            has_more=result["has_more"],
-            search=result["search"],
+        generation, reset, changed, removed = catalog_service.changes_since(since)
+        return encoded_response(
+            {
+                "generation": generation,
+                "since": since,
+                "reset": reset,
+                "changed": changed.to_dicts(),
+                "removed": removed,
+            },
+            request,
+            headers={"X-Catalog-Generation": str(generation)},
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/export")
+async def export_files(
+    response_format: str = Query(
+        "ndjson", alias="format", pattern="^(ndjson|csv|msgpack)$", description="ndjson, csv or msgpack"
+    ),
+    fields: Optional[str] = Query(None, description="Comma-separated fields (default: all)"),
+    search: Optional[str] = Query(None, description="Same search as /api/files"),
+    audio_format: Optional[str] = Query(
+        None, description="Comma-separated file formats to include, e.g. mp3,flac"
+    ),
+    missing: Optional[str] = Query(
+        None, description="Only files with at least one of these tags empty (or 'tags' for any)"
+    ),
+    has_cover: Optional[bool] = Query(None, description="Filter by embedded cover art"),
+):
+    """
+    Stream the whole catalog in one response.
+    Rows are encoded in batches, so memory use does not depend on library size.
+    """
+    try:
+        stream = export_catalog(
+            fmt=response_format,
+            fields=parse_fields(fields),
+            search=search,
+            formats={f.strip().lower().lstrip(".") for f in audio_format.split(",") if f.strip()}
+            if audio_format
+            else None,
+            missing=parse_missing(missing),
+            has_cover=has_cover,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    media_type, extension = EXPORT_FORMATS[response_format]
+    return StreamingResponse(
+        stream,
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="library.{extension}"',
+            # Eksport zaczyna się od tej generacji – dalej wystarczy /changes?since=
+            "X-Catalog-Generation": str(catalog_service.generation()),
+        },
+    )
+
+
 @router.get("/thumbnail")
 async def get_thumbnail(
     path: str = Query(..., description="Base64 encoded full path to the music file"),
@@ -84,22 +190,141 @@ async def get_thumbnail(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/tags", response_model=JobInfo, status_code=202)
+async def edit_tags(payload: BulkTagRequest):
+    """
+    Apply a tag patch to many files at once as a background job.
+    Follow progress at /api/jobs/{job_id}/events; the final event carries the summary.
+    """
+    try:
+        job = tag_service.start_batch(
+            ids=payload.ids,
+            patch=payload.tags.model_dump(exclude_unset=True),
+            edits={e.id: e.tags.model_dump(exclude_unset=True) for e in payload.edits},
+            renumber=payload.renumber_tracks,
+            rollback_on_error=payload.rollback_on_error,
+        )
+        return JobInfo(**job.to_dict())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/{file_id}", response_model=FileItem)
-async def get_file(file_id: str):
+async def get_file(request: Request, file_id: str):
     """
     Get a single music file by ID.
 
     Returns detailed metadata for the specified file.
-    Returns 404 if file is not found.
+    Returns 404 if file is not found. The ETag changes only when this file changes.
     """
     try:
-        file = get_file_by_id(file_id)
+        row = catalog_service.get(file_id)
 
-        if not file:
+        if row is None:
             raise HTTPException(status_code=404, detail="File not found")
 
-        return FileItem(**file)
+        headers = {"ETag": f'W/"{row.generation}"', "Cache-Control": "no-cache"}
+        if etag_matches(request, headers["ETag"]):
+            return not_modified(headers)
+        return encoded_response(row.to_dict(), request, headers=headers)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/{file_id}/stream")
+async def stream_file(
+    file_id: str,
+    transcode: Optional[bool] = Query(
+        None,
+        description="Force (true) or forbid (false) a low-bitrate transcode; "
+        "by default only formats browsers can't play are transcoded",
+    ),
+    start: float = Query(0.0, ge=0, description="Start offset in seconds (transcoded streams only)"),
+):
+    """
+    Stream a library file for preview.
+
+    Browser-playable formats are sent as the file itself with Range support
+    (206 partial responses), so seeking reads only the requested bytes.
+    Other formats are transcoded on the fly; seek those with `start`.
+    """
+    row = catalog_service.get(file_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    media_type = preview_service.media_type(row.format)
+    if transcode is False and media_type is None:
+        raise HTTPException(
+            status_code=415, detail=f"Format {row.format} can't be streamed without transcoding"
+        )
+
+    if not transcode and media_type is not None:
+        # FileResponse sprawdza plik dopiero przy wysyłaniu – brak pliku byłby wtedy błędem 500.
+        # Ten sam stat służy do walidacji Range (416 dla zakresu poza plikiem).
+        try:
+            stat = os.stat(row.path)
+        except OSError:
+            raise HTTPException(status_code=404, detail="File not found")
+        if not S_ISREG(stat.st_mode):
+            raise HTTPException(status_code=404, detail="File not found")
+        return FileResponse(
+            row.path,
+            media_type=media_type,
+            headers={"Cache-Control": "no-cache"},
+            content_disposition_type="inline",
+            filename=row.filename,
+            stat_result=stat,
+        )
+
+    try:
+        chunks = await preview_service.transcode(row.path, start)
+    except preview_service.PreviewBusy:
+        raise HTTPException(
+            status_code=503, detail="Too many previews being transcoded", headers={"Retry-After": "5"}
+        )
+    except preview_service.PreviewUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return StreamingResponse(
+        chunks,
+        media_type=preview_service.transcode_media_type(),
+        headers={"Accept-Ranges": "none", "Cache-Control": "no-store"},
+    )
+
+
+@router.get("/{file_id}/waveform")
+async def get_waveform(
+    request: Request,
+    file_id: str,
+    resolution: int = Query(512, description="Points per track, one of WAVEFORM_RESOLUTIONS"),
+):
+    """
+    Peak and RMS envelope of a file (0-255, 255 = full scale) for a waveform view.
+
+    Envelopes are computed once per file version in a background pool and
+    cached on disk. Until then the endpoint answers 202 with Retry-After.
+    """
+    row = catalog_service.get(file_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    try:
+        waveform = waveform_service.get_waveform(
+            row.id, row.path, row.file_size, row.mtime_ns, resolution
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if waveform is None:
+        return JSONResponse(
+            {"id": file_id, "status": "pending"}, status_code=202, headers={"Retry-After": "1"}
+        )
+    # Treść zależy tylko od wersji pliku – przeglądarka może ją trzymać
+    headers = {"ETag": f'"{waveform_service.cache_key(row.id, row.file_size, row.mtime_ns)}"'}
+    if etag_matches(request, headers["ETag"]):
+        return not_modified(headers)
+    return encoded_response(waveform, request, headers=headers)
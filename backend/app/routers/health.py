@@ -1,14 +1,33 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
 from datetime import datetime
 from app import get_version
+from app.services import catalog_service
 
 router = APIRouter()
 
 @router.get("/health")
 async def health_check():
+    """Liveness: the process answers. Never touches the disk or the catalog."""
     return {
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat(),
         "service": "navidrome-toolbox-api",
         "version": get_version(),
     }
+
+
+@router.get("/ready")
+async def readiness_check():
+    """
+    Readiness: 200 once the library catalog has been loaded, 503 while it is still warming up.
+    """
+    catalog = catalog_service.scan_status()
+    return JSONResponse(
+        status_code=200 if catalog["ready"] else 503,
+        content={
+            "status": "ready" if catalog["ready"] else "warming_up",
+            "timestamp": datetime.utcnow().isoformat(),
+            "catalog": catalog,
+        },
+    )
@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Query
+
+from app.schemas.integrity import BrokenFileListResponse, IntegritySummary
+from app.schemas.jobs import JobInfo
+from app.services import integrity_service
+
+router = APIRouter()
+
+
+@router.post("/check", response_model=JobInfo, status_code=202)
+async def check_integrity(
+    full: bool = Query(False, description="Decode every file, not only new or changed ones"),
+):
+    """
+    Start a full-decode integrity check in the background (or return the running one).
+    Only files whose mtime or size changed since their last check are decoded.
+    """
+    return JobInfo(**integrity_service.start_check(full=full).to_dict())
+
+
+@router.get("", response_model=IntegritySummary)
+async def get_integrity_summary():
+    summary = integrity_service.summary()
+    job = summary.pop("job")
+    return IntegritySummary(**summary, job=JobInfo(**job.to_dict()) if job else None)
+
+
+@router.get("/broken", response_model=BrokenFileListResponse)
+async def get_broken_files(
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=1000),
+):
+    """Files that failed their last decode, with the decoder error."""
+    total, items = integrity_service.broken_files(offset=offset, limit=limit)
+    return BrokenFileListResponse(items=items, total=total, offset=offset, limit=limit)
@@ -0,0 +1,72 @@
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from app import jobs
+from app.responses import json_bytes
+from app.schemas.jobs import JobInfo, JobListResponse
+
+router = APIRouter()
+
+
+@router.get("", response_model=JobListResponse)
+async def list_jobs(
+    kind: Optional[str] = Query(None, description="Job kind, e.g. duplicates"),
+    limit: int = Query(50, ge=1, le=500),
+):
+    """Running library jobs first, then recently finished ones."""
+    found = jobs.list_jobs(kind=kind, limit=limit)
+    return JobListResponse(jobs=[JobInfo(**job.to_dict()) for job in found], count=len(found))
+
+
+@router.get("/{job_id}", response_model=JobInfo)
+async def get_job(job_id: str):
+    job = jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobInfo(**job.to_dict())
+
+
+@router.get("/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    SSE stream of job snapshots: one event per change (throttled), the last one
+    when the job has finished.
+    """
+    job = jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_generator():
+        current = job
+        version = -1
+        while True:
+            if current.version != version:
+                version = current.version
+                yield b"data: " + json_bytes(current.to_dict()) + b"\n\n"
+                if current.finished:
+                    break
+            await asyncio.sleep(jobs.JOB_EVENTS_INTERVAL)
+            # Zadanie innego workera – odczyt jego ostatniej publikacji
+            current = jobs.reload(current)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        },
+    )
+
+
+@router.post("/{job_id}/cancel", response_model=JobInfo)
+async def cancel_job(job_id: str):
+    """Ask a running job to stop after its current work item."""
+    job = jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job.cancel()
+    return JobInfo(**job.to_dict())
@@ -0,0 +1,29 @@
+from fastapi import APIRouter, HTTPException, Query
+
+from app.schemas.jobs import JobInfo
+from app.schemas.loudness import LoudnessSummary
+from app.services import loudness_service
+
+router = APIRouter()
+
+
+@router.post("/analyze", response_model=JobInfo, status_code=202)
+async def analyze_loudness(
+    full: bool = Query(False, description="Analyse every file, not only new or changed ones"),
+):
+    """
+    Measure EBU R128 loudness in the background (or return the running job) and
+    write ReplayGain track and album tags. Only new or changed files are decoded;
+    albums are gated again from cached measurements.
+    """
+    try:
+        return JobInfo(**loudness_service.start_analysis(full=full).to_dict())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("", response_model=LoudnessSummary)
+async def get_loudness_summary():
+    summary = loudness_service.summary()
+    job = summary.pop("job")
+    return LoudnessSummary(**summary, job=JobInfo(**job.to_dict()) if job else None)
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, HTTPException
+
+from app.schemas.jobs import JobInfo
+from app.schemas.transcode import TranscodeRequest
+from app.services import transcode_service
+
+router = APIRouter()
+
+
+@router.post("", response_model=JobInfo, status_code=202)
+async def start_transcode(payload: TranscodeRequest):
+    """
+    Convert the selected files to another format as a background job.
+    Outputs newer than their source are skipped, so a repeated request only
+    converts what is missing. Follow progress at /api/jobs/{job_id}/events.
+    """
+    try:
+        job = transcode_service.start_transcode(
+            target=payload.target,
+            search=payload.search,
+            formats=payload.formats,
+            directory=payload.directory,
+            ids=payload.ids,
+            output_dir=payload.output_dir,
+            bitrate=payload.bitrate,
+            delete_source=payload.delete_source,
+        )
+        return JobInfo(**job.to_dict())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
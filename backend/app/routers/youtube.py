@@ -1,5 +1,5 @@
 from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
 import asyncio
 import json
 
@@ -13,12 +13,17 @@ from app.schemas.youtube import (
     YouTubeSearchResponse,
 )
 from app.services.youtube_service import (
-    download,
-    download_with_progress,
     get_formats,
     get_playlist_info,
     get_playlist_info_chunked,
+    prefetch_formats,
     search_youtube,
+    start_download,
+)
+from app.services.thumbnail_service import (
+    DEFAULT_VARIANT,
+    ThumbnailNotFound,
+    get_thumbnail,
 )
 
 router = APIRouter()
@@ -31,7 +36,11 @@ async def search_videos(
     music_only: bool = Query(True, description="Prefer YouTube Music / topic results"),
 ):
     try:
-        results, is_direct_url = search_youtube(q, limit, music_only)
+        # yt-dlp blokuje na czas zapytania sieciowego – poza pętlą zdarzeń
+        loop = asyncio.get_event_loop()
+        results, is_direct_url = await loop.run_in_executor(None, search_youtube, q, limit, music_only)
+        # Rozgrzej /formats dla najwyższych wyników (jeśli włączone)
+        prefetch_formats([result.url for result in results])
         return YouTubeSearchResponse(
             results=results, count=len(results), is_direct_url=is_direct_url
         )
@@ -41,6 +50,32 @@ async def search_videos(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/thumbnail/{video_id}")
+async def get_video_thumbnail(
+    video_id: str,
+    variant: str = Query(DEFAULT_VARIANT, description="YouTube thumbnail variant"),
+):
+    """
+    Cached proxy for YouTube thumbnails (i.ytimg.com).
+    Images are immutable per video, so browsers may keep them for a long time.
+    """
+    try:
+        loop = asyncio.get_event_loop()
+        data = await loop.run_in_executor(None, get_thumbnail, video_id, variant)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ThumbnailNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+    return Response(
+        content=data,
+        media_type="image/jpeg",
+        headers={"Cache-Control": "public, max-age=604800, immutable"},
+    )
+
+
 @router.post("/playlist", response_model=PlaylistResponse)
 async def get_playlist(payload: PlaylistRequest):
     """
@@ -56,8 +91,9 @@ async def get_playlist(payload: PlaylistRequest):
 
     try:
         # Use chunked loading with parallel processing
-        playlist_data = get_playlist_info_chunked(
-            payload.url, offset=payload.offset, limit=payload.limit
+        loop = asyncio.get_event_loop()
+        playlist_data = await loop.run_in_executor(
+            None, get_playlist_info_chunked, payload.url, payload.offset, payload.limit
         )
         return PlaylistResponse(**playlist_data)
     except ValueError as e:
@@ -71,7 +107,8 @@ async def get_playlist(payload: PlaylistRequest):
 @router.post("/formats", response_model=QualityResponse)
 async def get_quality(payload: QualityRequest):
     try:
-        return get_formats(payload.url)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, get_formats, payload.url)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -86,9 +123,11 @@ async def download_video(payload: DownloadRequest):
     """
     try:
         loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(
-            None, download, payload.url, payload.format_id, payload.output_template
+        # Wątek sieciowy kończy pracę po pobraniu, post-processing czekamy asynchronicznie
+        processing = await loop.run_in_executor(
+            None, start_download, payload.url, payload.format_id, payload.output_template
         )
+        result = await asyncio.wrap_future(processing)
         if not result.success:
             raise HTTPException(status_code=500, detail=result.message)
         return result
@@ -115,8 +154,8 @@ async def download_stream(payload: DownloadRequest):
             except Exception:
                 pass
 
-        def run_download() -> DownloadResponse:
-            return download_with_progress(
+        def run_download():
+            return start_download(
                 url=payload.url,
                 format_id=payload.format_id,
                 output_template=payload.output_template,
@@ -125,13 +164,16 @@ async def download_stream(payload: DownloadRequest):
 
         task = loop.run_in_executor(None, run_download)
 
+        async def wait_result() -> DownloadResponse:
+            return await asyncio.wrap_future(await task)
+
         while True:
             try:
                 progress = await asyncio.wait_for(queue.get(), timeout=0.5)
                 yield f"data: {json.dumps(progress)}\n\n"
 
                 if progress.get("status") == "finished":
-                    result = await task
+                    result = await wait_result()
                     yield (
                         "data: "
                         + json.dumps(
@@ -139,6 +181,7 @@ async def download_stream(payload: DownloadRequest):
                                 "status": "complete",
                                 "success": result.success,
                                 "file_path": result.file_path,
+                                "trace_id": result.trace_id,
                             }
                         )
                         + "\n\n"
@@ -147,7 +190,7 @@ async def download_stream(payload: DownloadRequest):
 
             except asyncio.TimeoutError:
                 if task.done():
-                    result = await task
+                    result = await wait_result()
                     yield (
                         "data: "
                         + json.dumps(
@@ -155,6 +198,7 @@ async def download_stream(payload: DownloadRequest):
                                 "status": "complete",
                                 "success": result.success,
                                 "file_path": result.file_path,
+                                "trace_id": result.trace_id,
                             }
                         )
                         + "\n\n"
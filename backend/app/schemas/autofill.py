@@ -0,0 +1,30 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+from app.schemas.files import FileTagEdit
+
+
+class AutofillRequest(BaseModel):
+    ids: list[str] = Field(
+        default_factory=list, description="Files to fill; empty = every file missing title, artist or album"
+    )
+    source: Optional[str] = Field(
+        default="catalog", description="Metadata source for the remaining tags; null = file names only"
+    )
+
+
+class AutofillApplyRequest(BaseModel):
+    job_id: str = Field(description="Completed autofill job whose proposals are written")
+    ids: Optional[list[str]] = Field(default=None, description="Accepted proposals; null = all of them")
+    edits: list[FileTagEdit] = Field(
+        default_factory=list, description="Corrections applied over single proposals"
+    )
+    rollback_on_error: bool = Field(
+        default=False, description="Restore every written file if any file fails"
+    )
+
+
+class AutofillSources(BaseModel):
+    sources: list[str]
+    patterns: list[str] = Field(description="File name patterns, tried in this order")
@@ -0,0 +1,24 @@
+from pydantic import BaseModel, Field
+
+
+class SpanInfo(BaseModel):
+    name: str
+    offset_ms: float = Field(description="Start of the span relative to the trace start")
+    duration_ms: float
+    attributes: dict = {}
+
+
+class TraceInfo(BaseModel):
+    trace_id: str
+    operation: str
+    status: str
+    error: str | None = None
+    started_at: float = Field(description="Unix timestamp of the trace start")
+    duration_ms: float
+    attributes: dict = {}
+    spans: list[SpanInfo]
+
+
+class TraceListResponse(BaseModel):
+    traces: list[TraceInfo]
+    count: int
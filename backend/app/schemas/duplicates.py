@@ -0,0 +1,37 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+from app.schemas.files import FileItem
+from app.schemas.jobs import JobInfo
+
+
+class DuplicateGroup(BaseModel):
+    kind: str = Field(description="exact (identical content) or tags (same artist/title)")
+    hash: Optional[str] = None
+    artist: Optional[str] = None
+    title: Optional[str] = None
+    files: list[FileItem]
+
+
+class DuplicateScanStats(BaseModel):
+    files: int
+    bytes_total: int
+    bytes_read: int
+    read_ratio: float
+    unreadable: int = 0
+    candidates_size: int = Field(description="Files sharing size and duration with another file")
+    candidates_partial: int = Field(description="Files left after the head/tail hash")
+    candidates_full: int = Field(description="Files with identical full content")
+    groups: int
+
+
+class DuplicatesResponse(BaseModel):
+    job: Optional[JobInfo] = Field(default=None, description="Newest scan job (possibly still running)")
+    scanned_at: Optional[float] = None
+    stats: Optional[DuplicateScanStats] = None
+    wasted_bytes: int = 0
+    total: int = 0
+    offset: int = 0
+    limit: int = 50
+    groups: list[DuplicateGroup] = []
@@ -17,6 +17,9 @@ class FileItem(BaseModel):
     format: str
     file_size: int  # w bajtach
     has_cover: bool = False
+    integrity: Optional[str] = Field(
+        default=None, description="ok / broken after an integrity check, null if not checked"
+    )
 
 
 class FileListRequest(BaseModel):
@@ -36,3 +39,47 @@ class FileListResponse(BaseModel):
     limit: int = 50
     has_more: bool = False
     search: Optional[str] = None
+
+
+class FileChangesResponse(BaseModel):
+    generation: int
+    since: int
+    reset: bool = Field(
+        default=False,
+        description="True when the delta is unavailable and the client must reload the list",
+    )
+    changed: list[FileItem]
+    removed: list[str]
+
+
+class TagPatch(BaseModel):
+    """Tags to change; fields left out stay untouched, explicit null removes the tag."""
+
+    title: Optional[str] = None
+    artist: Optional[str] = None
+    album: Optional[str] = None
+    album_artist: Optional[str] = None
+    year: Optional[int] = Field(default=None, ge=0, le=9999)
+    track_number: Optional[int] = Field(default=None, ge=0)
+    disc_number: Optional[int] = Field(default=None, ge=0)
+    genre: Optional[str] = None
+
+
+class FileTagEdit(BaseModel):
+    id: str
+    tags: TagPatch
+
+
+class BulkTagRequest(BaseModel):
+    ids: list[str] = Field(default_factory=list, description="Files that get the shared `tags` patch")
+    tags: TagPatch = Field(default_factory=TagPatch)
+    edits: list[FileTagEdit] = Field(
+        default_factory=list, description="Per-file patches, applied over the shared one"
+    )
+    renumber_tracks: bool = Field(
+        default=False,
+        description="Number tracks 1..n per album directory, in their current order",
+    )
+    rollback_on_error: bool = Field(
+        default=True, description="Restore every written file if any file fails"
+    )
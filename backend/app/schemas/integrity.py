@@ -0,0 +1,26 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+from app.schemas.files import FileItem
+from app.schemas.jobs import JobInfo
+
+
+class IntegritySummary(BaseModel):
+    files: int
+    ok: int
+    broken: int
+    unchecked: int = Field(description="New or changed files not verified yet")
+    last_check_at: Optional[float] = None
+    job: Optional[JobInfo] = Field(default=None, description="Newest check job")
+
+
+class BrokenFile(FileItem):
+    error: Optional[str] = Field(default=None, description="Last lines of the ffmpeg error output")
+
+
+class BrokenFileListResponse(BaseModel):
+    items: list[BrokenFile]
+    total: int
+    offset: int = 0
+    limit: int = 50
@@ -0,0 +1,25 @@
+from typing import Any, Optional
+
+from pydantic import BaseModel, Field
+
+
+class JobInfo(BaseModel):
+    job_id: str
+    kind: str
+    status: str = Field(description="queued, running, completed, failed or cancelled")
+    params: dict = {}
+    progress: dict[str, Any] = Field(
+        default_factory=dict, description="done / total plus job-specific fields such as phase"
+    )
+    error: Optional[str] = None
+    created_at: float = Field(description="Unix timestamp")
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[Any] = Field(
+        default=None, description="Summary of a finished job (only for job kinds that report one)"
+    )
+
+
+class JobListResponse(BaseModel):
+    jobs: list[JobInfo]
+    count: int
@@ -0,0 +1,16 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+from app.schemas.jobs import JobInfo
+
+
+class LoudnessSummary(BaseModel):
+    files: int
+    analysed: int = Field(description="Files with up-to-date ReplayGain tags")
+    silent: int = Field(description="Analysed files without audible content (left untagged)")
+    failed: int = Field(description="Files that could not be decoded")
+    pending: int = Field(description="New or changed files not analysed yet")
+    albums: int
+    last_run_at: Optional[float] = None
+    job: Optional[JobInfo] = Field(default=None, description="Newest analysis job")
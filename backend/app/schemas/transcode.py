@@ -0,0 +1,19 @@
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field
+
+
+class TranscodeRequest(BaseModel):
+    target: Literal["opus", "ogg", "mp3", "m4a", "flac"]
+    bitrate: Optional[int] = Field(
+        default=None, ge=32, le=512, description="kbps for lossy targets (default per format)"
+    )
+    search: Optional[str] = Field(default=None, description="Same phrase search as GET /api/files")
+    formats: list[str] = Field(default_factory=list, description="Only these source formats, e.g. ['flac']")
+    directory: Optional[str] = Field(default=None, description="Only files under this directory (relative to the library)")
+    ids: list[str] = Field(default_factory=list, description="Only these file IDs")
+    output_dir: Optional[str] = Field(
+        default=None,
+        description="Write outputs under this directory mirroring the library layout; next to the source if omitted",
+    )
+    delete_source: bool = Field(default=False, description="Remove each source file once its output is in place")
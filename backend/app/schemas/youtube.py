@@ -52,6 +52,7 @@ class DownloadResponse(BaseModel):
     success: bool
     file_path: str
     message: str
+    trace_id: str | None = None
 
 
 class PlaylistRequest(BaseModel):
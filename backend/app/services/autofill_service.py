@@ -0,0 +1,332 @@
+"""
+Metadata autofill for files with missing tags.
+
+Proposals are built in two steps. The path of every file missing a title,
+artist or album is matched against AUTOFILL_PATTERNS – yt-dlp style templates
+such as the default download template `%(artist)s - %(title)s` – which fills
+what the file name carries. A metadata source is then asked for the rest
+(album, year, genre) per distinct artist and title. Sources are pluggable
+(register_source): "catalog" borrows tags from tagged copies of the same track
+in the library, "youtube" uses the YouTube search. Lookups are cached and run
+in a bounded thread pool.
+
+The job only proposes and never touches files. Proposals are applied in bulk
+by tag_service (atomic writes, optional rollback) through apply_proposals.
+"""
+
+import os
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, wait
+from difflib import SequenceMatcher
+from typing import Callable, Optional
+
+from app.jobs import Job, get_job, start_job
+from app.metrics import register_cache
+from app.services import catalog_service, tag_service, youtube_service
+from app.services.cache import TTLCache
+from app.services.executors import get_thread_pool
+
+# Wzorce ścieżek (od najbardziej szczegółowego), oddzielone ";"; "/" dopasowuje katalogi nadrzędne
+AUTOFILL_PATTERNS = os.environ.get(
+    "AUTOFILL_PATTERNS",
+    "%(artist)s/%(album)s/%(track_number)s - %(title)s;"
+    "%(track_number)s - %(artist)s - %(title)s;"
+    "%(track_number)s - %(title)s;"
+    "%(artist)s - %(title)s;"
+    "%(title)s",
+)
+# Ile zapytań do źródła metadanych może trwać jednocześnie
+AUTOFILL_LOOKUP_WORKERS = int(os.environ.get("AUTOFILL_LOOKUP_WORKERS", "4"))
+AUTOFILL_CACHE_SIZE = int(os.environ.get("AUTOFILL_CACHE_SIZE", "10000"))
+AUTOFILL_CACHE_TTL = float(os.environ.get("AUTOFILL_CACHE_TTL", "86400"))
+# Minimalne podobieństwo (0–1) wyniku wyszukiwania YouTube do szukanego utworu
+AUTOFILL_MIN_SCORE = float(os.environ.get("AUTOFILL_MIN_SCORE", "0.6"))
+
+JOB_KIND = "autofill"
+
+# Plik jest kandydatem, gdy brakuje mu któregoś z tych tagów
+AUTOFILL_FIELDS = ("title", "artist", "album")
+# Tagi, które autofill może zaproponować – te, których obecną wartość zna katalog
+AUTOFILL_TAGS = ("title", "artist", "album", "year", "track_number", "genre")
+
+# Pola szablonu -> wyrażenie; liczby nie mogą "zjeść" tytułu
+_FIELD_PATTERNS = {"track_number": r"\d{1,3}", "year": r"\d{4}"}
+_INT_FIELDS = ("year", "track_number")
+# Pola yt-dlp spotykane w szablonach pobierania -> tagi
+_ALIASES = {
+    "uploader": "artist",
+    "channel": "artist",
+    "creator": "artist",
+    "track": "title",
+    "release_year": "year",
+}
+_TEMPLATE_FIELD = re.compile(r"%\((\w+)(?:,[^)]*)?\)([sd])")
+
+# Brak wyniku jest zapamiętywany jako {}, żeby nie pytać o ten sam utwór ponownie
+_lookups = TTLCache(AUTOFILL_CACHE_SIZE, AUTOFILL_CACHE_TTL, namespace="autofill")
+
+register_cache("autofill", lambda: (_lookups.hits, _lookups.misses))
+
+# Nazwa źródła -> (funkcja (artysta, tytuł) -> tagi albo None, czy wyniki cache'ować)
+_sources: dict[str, tuple[Callable[[Optional[str], str], Optional[dict]], bool]] = {}
+
+_index_lock = threading.Lock()
+# (generacja katalogu, (artysta, tytuł) -> tagi, tytuł -> tagi lub None gdy niejednoznaczny)
+_catalog_index: tuple[Optional[int], dict, dict] = (None, {}, {})
+
+
+def register_source(
+    name: str, lookup: Callable[[Optional[str], str], Optional[dict]], cached: bool = True
+) -> None:
+    """
+    Add a metadata source. `lookup(artist, title)` returns tags of the best
+    match or None (keys outside AUTOFILL_TAGS are ignored); it is called from
+    the lookup pool.
+    """
+    _sources[name] = (lookup, cached)
+
+
+def sources() -> list[str]:
+    return sorted(_sources)
+
+
+def compile_pattern(template: str) -> tuple[re.Pattern, int]:
+    """
+    Turn a yt-dlp output template into a regex over the last path components
+    (without extension). Returns (regex, number of components).
+    Raises ValueError for fields outside AUTOFILL_TAGS.
+    """
+    template = re.sub(r"\.%\(ext\)s$", "", template.strip())
+    parts = []
+    position = 0
+    for match in _TEMPLATE_FIELD.finditer(template):
+        name = _ALIASES.get(match.group(1), match.group(1))
+        if name not in AUTOFILL_TAGS:
+            raise ValueError(f"Unknown field in autofill pattern: {name}")
+        parts.append(re.escape(template[position : match.start()]))
+        # Pole powtórzone w szablonie musi mieć tę samą wartość
+        if f"(?P<{name}>" in "".join(parts):
+            parts.append(f"(?P={name})")
+        else:
+            parts.append(f"(?P<{name}>{_FIELD_PATTERNS.get(name, '[^/]+?')})")
+        position = match.end()
+    parts.append(re.escape(template[position:]))
+    return re.compile("".join(parts) + "$"), template.count("/") + 1
+
+
+_patterns = [compile_pattern(template) for template in AUTOFILL_PATTERNS.split(";") if template.strip()]
+
+
+def parse_path(file_path: str) -> dict:
+    """Tags read from the path by the first matching pattern (empty if none matches)."""
+    root = next((r for r in catalog_service.ROOTS if r.contains(file_path)), None)
+    relative = os.path.relpath(file_path, root.abspath) if root else os.path.basename(file_path)
+    components = os.path.splitext(relative.replace(os.sep, "/"))[0].split("/")
+    for regex, depth in _patterns:
+        # Wzorzec z katalogami nie sięga ponad katalog biblioteki
+        if depth > len(components):
+            continue
+        match = regex.match("/".join(components[-depth:]))
+        if match is None:
+            continue
+        tags = {}
+        for name, value in match.groupdict().items():
+            value = value.strip()
+            if not value:
+                continue
+            tags[name] = int(value) if name in _INT_FIELDS else value
+        if "title" in tags or len(tags) > 1:
+            return tags
+    return {}
+
+
+def _normalize(value: Optional[str]) -> str:
+    return " ".join((value or "").casefold().split())
+
+
+def _catalog_lookup(artist: Optional[str], title: str) -> Optional[dict]:
+    """Tags of an already tagged file with the same artist and title (title alone if unambiguous)."""
+    global _catalog_index
+    generation = catalog_service.generation()
+    with _index_lock:
+        if _catalog_index[0] != generation:
+            by_track: dict[tuple[str, str], dict] = {}
+            by_title: dict[str, Optional[dict]] = {}
+            fields = ("title", "artist", "album", "year", "genre")
+            columns = catalog_service.query().to_columns(fields)
+            for values in zip(*(columns[field] for field in fields)):
+                tags = dict(zip(fields, values))
+                if not all(tags[field] for field in AUTOFILL_FIELDS):
+                    continue
+                tags = {k: v for k, v in tags.items() if v is not None}
+                key = _normalize(tags["title"])
+                by_track.setdefault((_normalize(tags["artist"]), key), tags)
+                known = by_title.get(key, tags)
+                by_title[key] = tags if known is not None and known["artist"] == tags["artist"] else None
+            _catalog_index = (generation, by_track, by_title)
+        _, by_track, by_title = _catalog_index
+    if artist:
+        return by_track.get((_normalize(artist), _normalize(title)))
+    return by_title.get(_normalize(title))
+
+
+def _youtube_lookup(artist: Optional[str], title: str) -> Optional[dict]:
+    """Artist and title of the closest YouTube Music result ("Artist - Topic" channels)."""
+    query = f"{artist} {title}" if artist else title
+    results, _ = youtube_service.search_youtube(query, 5, music_only=True)
+    best, best_score = None, AUTOFILL_MIN_SCORE
+    for video in results:
+        uploader = re.sub(r"\s+-\s+Topic$", "", video.uploader or "")
+        wanted = _normalize(title if not artist else f"{artist} {title}")
+        found = _normalize(video.title if not artist else f"{uploader} {video.title}")
+        score = SequenceMatcher(None, wanted, found).ratio()
+        if score > best_score:
+            best, best_score = {"artist": uploader or None, "title": video.title}, score
+    return {k: v for k, v in best.items() if v} if best else None
+
+
+register_source("catalog", _catalog_lookup, cached=False)
+register_source("youtube", _youtube_lookup)
+
+
+def _lookup(source: str, artist: Optional[str], title: str) -> dict:
+    lookup, cached = _sources[source]
+    key = f"{source}\n{_normalize(artist)}\n{_normalize(title)}"
+    if cached:
+        found = _lookups.get(key)
+        if found is not None:
+            return found
+    tags = lookup(artist, title) or {}
+    tags = {k: v for k, v in tags.items() if k in AUTOFILL_TAGS and v is not None}
+    if cached:
+        _lookups.set(key, tags)
+    return tags
+
+
+def propose(job: Job, ids: Optional[list[str]] = None, source: Optional[str] = "catalog") -> dict:
+    """
+    Job body: build tag proposals for files missing AUTOFILL_FIELDS (only the
+    given `ids` if set). Existing tags are never overwritten.
+    """
+    fields = ("id", "path", *AUTOFILL_TAGS)
+    if ids:
+        rows = [catalog_service.get(file_id) for file_id in dict.fromkeys(ids)]
+        columns = {field: [getattr(row, field) for row in rows if row is not None] for field in fields}
+    else:
+        columns = catalog_service.query().to_columns(fields)
+    candidates = []
+    for values in zip(*(columns[field] for field in fields)):
+        row = dict(zip(fields, values))
+        if any(row[field] is None for field in AUTOFILL_FIELDS):
+            candidates.append(row)
+
+    job.update(phase="parsing", done=0, total=len(candidates))
+    # Zapytania do źródła – jedno na różną parę (artysta, tytuł)
+    queries: dict[tuple[str, str], tuple[Optional[str], str]] = {}
+    parsed = []
+    for row in candidates:
+        tags = parse_path(row["path"])
+        title = row["title"] or tags.get("title")
+        artist = row["artist"] or tags.get("artist")
+        key = None
+        if source is not None and title:
+            key = (_normalize(artist), _normalize(title))
+            queries.setdefault(key, (artist, title))
+        parsed.append((row, tags, key))
+
+    found: dict[tuple[str, str], dict] = {}
+    failures = 0
+    if queries:
+        job.update(phase="lookup", done=0, total=len(queries), failed=0)
+        pool = get_thread_pool("autofill-lookups", AUTOFILL_LOOKUP_WORKERS)
+        pending: dict = {}
+        queue = iter(queries.items())
+        try:
+            # Okno zapytań – anulowanie nie czeka na tysiące zaplanowanych
+            window = AUTOFILL_LOOKUP_WORKERS * 4
+            while True:
+                for key, (artist, title) in queue:
+                    pending[pool.submit(_lookup, source, artist, title)] = key
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = pending.pop(future)
+                    try:
+                        found[key] = future.result()
+                    except Exception as e:
+                        failures += 1
+                        job.update(failed=failures, last_error=str(e))
+                    job.update(done=job.progress["done"] + 1)
+                job.check_cancelled()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    proposals = []
+    for row, tags, key in parsed:
+        origin = {name: "path" for name in tags}
+        for name, value in found.get(key, {}).items():
+            if name not in tags:
+                tags[name], origin[name] = value, source
+        # Tylko brakujące tagi – istniejące zostają nietknięte
+        tags = {name: value for name, value in tags.items() if row.get(name) is None}
+        if tags:
+            proposals.append(
+                {
+                    "id": row["id"],
+                    "path": row["path"],
+                    "current": {field: row[field] for field in AUTOFILL_FIELDS},
+                    "tags": tags,
+                    "sources": {name: origin[name] for name in tags},
+                }
+            )
+
+    job.update(phase="done")
+    return {
+        "files": len(candidates),
+        "proposed": len(proposals),
+        "unmatched": len(candidates) - len(proposals),
+        "lookups": len(queries),
+        "lookup_failures": failures,
+        "proposals": proposals,
+    }
+
+
+def start_autofill(ids: Optional[list[str]] = None, source: Optional[str] = "catalog") -> Job:
+    """Validate the source (ValueError) and build proposals as a background job."""
+    if source is not None and source not in _sources:
+        raise ValueError(f"Unknown metadata source: {source}. Available: {', '.join(sources())}")
+    return start_job(
+        JOB_KIND,
+        lambda job: propose(job, ids, source),
+        {"files": len(ids) if ids else None, "source": source},
+        expose_result=True,
+    )
+
+
+def apply_proposals(
+    job_id: str,
+    ids: Optional[list[str]] = None,
+    edits: Optional[dict[str, dict]] = None,
+    rollback_on_error: bool = False,
+) -> Job:
+    """
+    Write the proposals of a completed autofill job (only `ids` if given,
+    `edits` override single proposals) as one tag_service batch.
+    """
+    job = get_job(job_id)
+    if job is None or job.kind != JOB_KIND:
+        raise ValueError(f"Autofill job not found: {job_id}")
+    if job.status != "completed":
+        raise ValueError(f"Autofill job {job_id} is {job.status}")
+    proposals = {item["id"]: item["tags"] for item in job.result["proposals"]}
+    selected = list(dict.fromkeys(ids)) if ids is not None else list(proposals)
+    unknown = [file_id for file_id in selected if file_id not in proposals]
+    if unknown:
+        raise ValueError(f"No proposal for: {', '.join(unknown[:10])}")
+    plan = {file_id: {**proposals[file_id], **(edits or {}).get(file_id, {})} for file_id in selected}
+    return tag_service.start_batch([], {}, plan, rollback_on_error=rollback_on_error)
@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from app import shared_state
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with per-entry expiry.
+    Keeps hit/miss counters so callers can report cache efficiency.
+    With a `namespace` and several workers (app.shared_state), entries are also
+    stored in the shared database: a value one worker computed is a hit in the others.
+    """
+
+    def __init__(self, max_size: int, ttl: float, namespace: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.namespace = namespace if shared_state.enabled() else None
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] >= time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._data[key]
+        shared = self._shared_get(key)
+        with self._lock:
+            if shared is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return shared
+
+    def _shared_get(self, key: Hashable) -> Optional[Any]:
+        """Entry stored by another worker, copied into this cache until it expires there."""
+        if self.namespace is None:
+            return None
+        found = shared_state.cache_get(self.namespace, str(key))
+        if found is None:
+            return None
+        value, expires_at = found
+        remaining = self.ttl if expires_at is None else expires_at - time.time()
+        self._put(key, value, remaining)
+        return value
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] >= time.monotonic():
+                return True
+        return self._shared_get(key) is not None
+
+    def _put(self, key: Hashable, value: Any, ttl: float) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._put(key, value, self.ttl)
+        if self.namespace is not None:
+            shared_state.cache_set(self.namespace, str(key), value, self.ttl)
+
+    def clear(self) -> None:
+        """Clear this worker's entries (shared ones expire on their own)."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,1196 @@
+"""
+In-memory library catalog kept in a compact, column-oriented form.
+
+Every track is a row index into parallel columns: numbers live in `array`
+columns, repeated strings (directory, artist, album, genre, format) are
+interned once in a string pool and stored as integer references. Only titles
+and filenames are per-row Python strings. Rows are exposed through `Row`
+views; dicts (or `FileItem`s) are built only for the rows actually returned.
+
+The library may span several roots (MUSIC_DIRS). Each root is refreshed on
+its own schedule by its own worker, with its own stat/parse concurrency, and
+merged into the one catalog as soon as its scan finishes – a slow network
+mount never holds back the rows of a fast local disk.
+
+Every change goes through `_commit`. With several workers (app.shared_state)
+a change is appended to the shared change log and each worker replays the log
+in order, using the log position as its generation – so generations, ETags
+and deltas agree whichever worker answers. Each worker loads the catalog from
+disk once at startup; later rescans run only in the leader.
+"""
+
+import bisect
+import logging
+import math
+import os
+import threading
+import time
+from array import array
+from collections import deque
+from concurrent.futures import wait
+from pathlib import Path
+from typing import Callable, Iterator, Optional, Sequence
+from urllib.parse import parse_qsl
+
+from app import shared_state
+from app.metrics import CallbackMetric
+from app.services.executors import get_thread_pool
+from app.services.file_service import (
+    MUSIC_DIR,
+    MUSIC_DIRS,
+    SUPPORTED_EXTENSIONS,
+    extract_metadata,
+    get_file_id,
+    scan_music_directory,
+)
+
+logger = logging.getLogger(__name__)
+
+# Co ile sekund katalog jest porównywany z dyskiem (zmiany spoza toolboxa)
+CATALOG_REFRESH_INTERVAL = float(os.environ.get("CATALOG_REFRESH_INTERVAL", "60"))
+# Wczytanie katalogu w tle przy starcie serwera
+CATALOG_WARM_UP = os.environ.get("CATALOG_WARM_UP", "1") == "1"
+# Ile ostatnich usunięć pamiętamy na potrzeby /api/files/changes
+CATALOG_CHANGELOG_SIZE = int(os.environ.get("CATALOG_CHANGELOG_SIZE", "100000"))
+# Domyślna liczba wątków stat/parsowania na katalog biblioteki (opcja "workers" w MUSIC_DIRS)
+CATALOG_SCAN_WORKERS = int(os.environ.get("CATALOG_SCAN_WORKERS", "4"))
+
+# Ścieżki sprawdzane przez os.stat w jednym zadaniu puli
+_STAT_CHUNK = 512
+
+# Pola elementu katalogu – te same co w FileItem
+FIELDS = (
+    "id",
+    "path",
+    "filename",
+    "title",
+    "artist",
+    "album",
+    "year",
+    "track_number",
+    "genre",
+    "duration",
+    "bitrate",
+    "format",
+    "file_size",
+    "has_cover",
+    "integrity",
+)
+
+# Wynik weryfikacji pliku (integrity_service) – indeks w kolumnie `checks`
+INTEGRITY_STATES = (None, "ok", "broken")
+
+# Wartość oznaczająca brak liczby w kolumnach całkowitych
+_MISSING = -(2**31)
+_INT_MAX = 2**31 - 1
+
+
+def _int_or_missing(value: Optional[int]) -> int:
+    if value is None or not _MISSING < value <= _INT_MAX:
+        return _MISSING
+    return int(value)
+
+
+class StringPool:
+    """Interns repeated strings; index 0 stands for None."""
+
+    __slots__ = ("_values", "_index")
+
+    def __init__(self):
+        self._values: list[Optional[str]] = [None]
+        self._index: dict[str, int] = {}
+
+    def intern(self, value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        index = self._index.get(value)
+        if index is None:
+            index = self._index[value] = len(self._values)
+            self._values.append(value)
+        return index
+
+    def get(self, index: int) -> Optional[str]:
+        return self._values[index]
+
+    def __len__(self) -> int:
+        return len(self._values) - 1
+
+
+class _Columns:
+    """
+    Column storage for catalog rows. Rows are appended and tombstoned, never
+    reused, so a `Row` view stays valid until the columns are compacted –
+    compaction builds a new `_Columns` and old views keep the old one.
+    """
+
+    __slots__ = (
+        "strings",
+        "dirs",
+        "names",
+        "titles",
+        "artists",
+        "albums",
+        "genres",
+        "formats",
+        "years",
+        "tracks",
+        "durations",
+        "bitrates",
+        "sizes",
+        "covers",
+        "mtimes",
+        "checks",
+        "gens",
+        "ids",
+        "alive",
+        "order",
+        "id_order",
+        "dead",
+        "_search_blob",
+        "_search_offsets",
+    )
+
+    def __init__(self):
+        self.strings = StringPool()
+        self.dirs = array("I")
+        self.names: list[str] = []
+        self.titles: list[Optional[str]] = []
+        self.artists = array("I")
+        self.albums = array("I")
+        self.genres = array("I")
+        self.formats = array("I")
+        self.years = array("i")
+        self.tracks = array("i")
+        self.durations = array("d")
+        self.bitrates = array("i")
+        self.sizes = array("q")
+        self.covers = array("b")
+        self.mtimes = array("q")
+        # indeks w INTEGRITY_STATES; zerowany, gdy plik zmieni mtime lub rozmiar
+        self.checks = array("b")
+        # generacja katalogu, w której wiersz ostatnio się zmienił
+        self.gens = array("Q")
+        self.ids = array("Q")
+        self.alive = array("b")
+        # żywe wiersze posortowane po ścieżce – ta sama kolejność co scan_music_directory
+        self.order = array("I")
+        # żywe wiersze posortowane po ID – wyszukiwanie binarne zamiast słownika
+        self.id_order = array("I")
+        self.dead = 0
+        self._search_blob: Optional[str] = None
+        self._search_offsets: Optional[array] = None
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def path(self, row: int) -> str:
+        return os.path.join(self.strings.get(self.dirs[row]), self.names[row])
+
+    def _set(
+        self, row: int, file_path: str, metadata: dict, mtime_ns: int, generation: int
+    ) -> None:
+        strings = self.strings
+        size = metadata.get("file_size") or 0
+        if self.mtimes[row] != mtime_ns or self.sizes[row] != size:
+            self.checks[row] = 0
+        self.dirs[row] = strings.intern(os.path.dirname(file_path))
+        self.names[row] = os.path.basename(file_path)
+        self.titles[row] = metadata.get("title")
+        self.artists[row] = strings.intern(metadata.get("artist"))
+        self.albums[row] = strings.intern(metadata.get("album"))
+        self.genres[row] = strings.intern(metadata.get("genre"))
+        self.formats[row] = strings.intern(metadata.get("format"))
+        self.years[row] = _int_or_missing(metadata.get("year"))
+        self.tracks[row] = _int_or_missing(metadata.get("track_number"))
+        duration = metadata.get("duration")
+        self.durations[row] = math.nan if duration is None else float(duration)
+        self.bitrates[row] = _int_or_missing(metadata.get("bitrate"))
+        self.sizes[row] = size
+        self.covers[row] = 1 if metadata.get("has_cover") else 0
+        self.mtimes[row] = mtime_ns
+        self.gens[row] = generation
+
+    def _append_row(self) -> int:
+        row = len(self.names)
+        for column in (self.dirs, self.artists, self.albums, self.genres, self.formats):
+            column.append(0)
+        for column in (self.years, self.tracks, self.bitrates):
+            column.append(_MISSING)
+        self.names.append("")
+        self.titles.append(None)
+        self.durations.append(math.nan)
+        self.sizes.append(0)
+        self.covers.append(0)
+        self.mtimes.append(0)
+        self.checks.append(0)
+        self.gens.append(0)
+        self.ids.append(0)
+        self.alive.append(1)
+        return row
+
+    def find_id(self, file_id: int) -> Optional[int]:
+        ids = self.ids
+        index = bisect.bisect_left(self.id_order, file_id, key=ids.__getitem__)
+        if index < len(self.id_order) and ids[self.id_order[index]] == file_id:
+            return self.id_order[index]
+        return None
+
+    def find(self, file_path: str) -> Optional[int]:
+        return self.find_id(int(get_file_id(file_path), 16))
+
+    def id_map(self) -> dict[int, int]:
+        """Temporary ID -> row mapping for bulk lookups (e.g. a full refresh)."""
+        ids = self.ids
+        return {ids[row]: row for row in self.id_order}
+
+    def put(
+        self,
+        file_path: str,
+        metadata: dict,
+        mtime_ns: int,
+        generation: int,
+        row: Optional[int] = None,
+        keep_order: bool = True,
+    ) -> int:
+        """
+        Insert or update the row of a file. Bulk callers pass the known `row`
+        (or -1 for a new file) and `keep_order=False`, then call `sort()` once.
+        """
+        file_id = int(get_file_id(file_path), 16)
+        if row is None:
+            row = self.find_id(file_id)
+        is_new = row is None or row < 0
+        if is_new:
+            row = self._append_row()
+            self.ids[row] = file_id
+        self._set(row, file_path, metadata, mtime_ns, generation)
+        if is_new and keep_order:
+            bisect.insort(self.order, row, key=self.path)
+            bisect.insort(self.id_order, row, key=self.ids.__getitem__)
+        self._search_blob = None
+        return row
+
+    def drop(self, row: int, keep_order: bool = True) -> bool:
+        if not self.alive[row]:
+            return False
+        self.alive[row] = 0
+        self.dead += 1
+        if keep_order:
+            for order, key in ((self.order, self.path), (self.id_order, self.ids.__getitem__)):
+                index = bisect.bisect_left(order, key(row), key=key)
+                if index < len(order) and order[index] == row:
+                    del order[index]
+        self._search_blob = None
+        return True
+
+    def sort(self) -> None:
+        """Rebuild both orderings after bulk changes."""
+        alive = self.alive
+        rows = [row for row in range(len(self.names)) if alive[row]]
+        self.id_order = array("I", sorted(rows, key=self.ids.__getitem__))
+        rows.sort(key=self.path)
+        self.order = array("I", rows)
+        self._search_blob = None
+
+    def row_dict(self, row: int) -> dict:
+        """FileItem fields of one row, read straight from the columns."""
+        get = self.strings.get
+        year, track, bitrate = self.years[row], self.tracks[row], self.bitrates[row]
+        duration = self.durations[row]
+        name = self.names[row]
+        return {
+            "id": f"{self.ids[row]:016x}",
+            "path": os.path.join(get(self.dirs[row]), name),
+            "filename": name,
+            "title": self.titles[row],
+            "artist": get(self.artists[row]),
+            "album": get(self.albums[row]),
+            "year": None if year == _MISSING else year,
+            "track_number": None if track == _MISSING else track,
+            "genre": get(self.genres[row]),
+            "duration": None if math.isnan(duration) else duration,
+            "bitrate": None if bitrate == _MISSING else bitrate,
+            "format": get(self.formats[row]),
+            "file_size": self.sizes[row],
+            "has_cover": bool(self.covers[row]),
+            "integrity": INTEGRITY_STATES[self.checks[row]],
+        }
+
+    def column(self, field: str, rows: Sequence[int]) -> list:
+        """Values of one field for `rows` – the columnar counterpart of row_dict."""
+        get = self.strings.get
+        if field == "id":
+            ids = self.ids
+            return [f"{ids[row]:016x}" for row in rows]
+        if field == "path":
+            # Prefiks katalogu liczony raz na katalog, nie raz na wiersz
+            prefixes: dict[int, str] = {}
+            dirs, names = self.dirs, self.names
+            values = []
+            for row in rows:
+                prefix = prefixes.get(dirs[row])
+                if prefix is None:
+                    prefix = prefixes[dirs[row]] = os.path.join(get(dirs[row]), "")
+                values.append(prefix + names[row])
+            return values
+        if field in ("filename", "title"):
+            values = self.names if field == "filename" else self.titles
+            return [values[row] for row in rows]
+        if field in ("artist", "album", "genre", "format"):
+            refs = getattr(self, field + "s")
+            return [get(refs[row]) for row in rows]
+        if field in ("year", "track_number", "bitrate"):
+            values = {"year": self.years, "track_number": self.tracks, "bitrate": self.bitrates}[field]
+            return [None if values[row] == _MISSING else values[row] for row in rows]
+        if field == "duration":
+            durations = self.durations
+            return [None if math.isnan(durations[row]) else durations[row] for row in rows]
+        if field == "file_size":
+            sizes = self.sizes
+            return [sizes[row] for row in rows]
+        if field == "has_cover":
+            covers = self.covers
+            return [bool(covers[row]) for row in rows]
+        if field == "integrity":
+            checks = self.checks
+            return [INTEGRITY_STATES[checks[row]] for row in rows]
+        # Pola wewnętrzne (nie ma ich w FileItem) – dla zadań porównujących stan pliku
+        if field == "mtime_ns":
+            mtimes = self.mtimes
+            return [mtimes[row] for row in rows]
+        raise KeyError(field)
+
+    def compacted(self) -> "_Columns":
+        """Copy of the live rows in path order, without tombstones."""
+        fresh = _Columns()
+        strings = self.strings
+        for row in self.order:
+            new = fresh._append_row()
+            fresh.ids[new] = self.ids[row]
+            fresh.dirs[new] = fresh.strings.intern(strings.get(self.dirs[row]))
+            fresh.names[new] = self.names[row]
+            fresh.titles[new] = self.titles[row]
+            fresh.artists[new] = fresh.strings.intern(strings.get(self.artists[row]))
+            fresh.albums[new] = fresh.strings.intern(strings.get(self.albums[row]))
+            fresh.genres[new] = fresh.strings.intern(strings.get(self.genres[row]))
+            fresh.formats[new] = fresh.strings.intern(strings.get(self.formats[row]))
+            fresh.years[new] = self.years[row]
+            fresh.tracks[new] = self.tracks[row]
+            fresh.durations[new] = self.durations[row]
+            fresh.bitrates[new] = self.bitrates[row]
+            fresh.sizes[new] = self.sizes[row]
+            fresh.covers[new] = self.covers[row]
+            fresh.mtimes[new] = self.mtimes[row]
+            fresh.checks[new] = self.checks[row]
+            fresh.gens[new] = self.gens[row]
+        fresh.order = array("I", range(len(fresh.names)))
+        fresh.id_order = array("I", sorted(fresh.order, key=fresh.ids.__getitem__))
+        return fresh
+
+    def search(self, phrase: str) -> array:
+        """
+        Rows (in path order) whose title, artist, album or filename contain `phrase`.
+        All searchable text is kept in one lowercase string, so matching runs at
+        `str.find` speed instead of a Python loop over every row.
+        """
+        if self._search_blob is None:
+            strings = self.strings
+            parts = []
+            offsets = array("q")
+            position = 0
+            for row in self.order:
+                text = "\x1f".join(
+                    (
+                        self.titles[row] or "",
+                        strings.get(self.artists[row]) or "",
+                        strings.get(self.albums[row]) or "",
+                        self.names[row],
+                    )
+                ).lower() + "\n"
+                offsets.append(position)
+                position += len(text)
+                parts.append(text)
+            self._search_blob = "".join(parts)
+            self._search_offsets = offsets
+
+        blob, offsets, order = self._search_blob, self._search_offsets, self.order
+        needle = phrase.lower()
+        matches = array("I")
+        start = blob.find(needle)
+        while start != -1:
+            position = bisect.bisect_right(offsets, start) - 1
+            matches.append(order[position])
+            if position + 1 >= len(offsets):
+                break
+            start = blob.find(needle, offsets[position + 1])
+        return matches
+
+
+class Row:
+    """Read-only view of one catalog row; `to_dict()` gives the FileItem fields."""
+
+    __slots__ = ("_columns", "_row")
+
+    def __init__(self, columns: _Columns, row: int):
+        self._columns = columns
+        self._row = row
+
+    @property
+    def id(self) -> str:
+        return f"{self._columns.ids[self._row]:016x}"
+
+    @property
+    def path(self) -> str:
+        return self._columns.path(self._row)
+
+    @property
+    def filename(self) -> str:
+        return self._columns.names[self._row]
+
+    @property
+    def title(self) -> Optional[str]:
+        return self._columns.titles[self._row]
+
+    @property
+    def artist(self) -> Optional[str]:
+        return self._columns.strings.get(self._columns.artists[self._row])
+
+    @property
+    def album(self) -> Optional[str]:
+        return self._columns.strings.get(self._columns.albums[self._row])
+
+    @property
+    def genre(self) -> Optional[str]:
+        return self._columns.strings.get(self._columns.genres[self._row])
+
+    @property
+    def format(self) -> Optional[str]:
+        return self._columns.strings.get(self._columns.formats[self._row])
+
+    @property
+    def year(self) -> Optional[int]:
+        value = self._columns.years[self._row]
+        return None if value == _MISSING else value
+
+    @property
+    def track_number(self) -> Optional[int]:
+        value = self._columns.tracks[self._row]
+        return None if value == _MISSING else value
+
+    @property
+    def duration(self) -> Optional[float]:
+        value = self._columns.durations[self._row]
+        return None if math.isnan(value) else value
+
+    @property
+    def bitrate(self) -> Optional[int]:
+        value = self._columns.bitrates[self._row]
+        return None if value == _MISSING else value
+
+    @property
+    def file_size(self) -> int:
+        return self._columns.sizes[self._row]
+
+    @property
+    def has_cover(self) -> bool:
+        return bool(self._columns.covers[self._row])
+
+    @property
+    def integrity(self) -> Optional[str]:
+        return INTEGRITY_STATES[self._columns.checks[self._row]]
+
+    @property
+    def mtime_ns(self) -> int:
+        return self._columns.mtimes[self._row]
+
+    @property
+    def generation(self) -> int:
+        return self._columns.gens[self._row]
+
+    def __getitem__(self, field: str):
+        if field not in FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def get(self, field: str, default=None):
+        return getattr(self, field) if field in FIELDS else default
+
+    def to_dict(self) -> dict:
+        return self._columns.row_dict(self._row)
+
+    def __repr__(self) -> str:
+        return f"Row({self.path!r})"
+
+
+class RowSequence(Sequence):
+    """Snapshot of matching rows; slicing is cheap and creates no row objects."""
+
+    __slots__ = ("_columns", "_rows")
+
+    def __init__(self, columns: _Columns, rows: array):
+        self._columns = columns
+        self._rows = rows
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return RowSequence(self._columns, self._rows[index])
+        return Row(self._columns, self._rows[index])
+
+    def to_dicts(self) -> list[dict]:
+        row_dict = self._columns.row_dict
+        return [row_dict(row) for row in self._rows]
+
+    def to_columns(self, fields: Sequence[str] = FIELDS) -> dict[str, list]:
+        """One list per field – smaller to encode than a list of row objects."""
+        return {field: self._columns.column(field, self._rows) for field in fields}
+
+    def __iter__(self) -> Iterator[Row]:
+        columns = self._columns
+        return (Row(columns, row) for row in self._rows)
+
+
+class LibraryRoot:
+    """One library directory with its own scan concurrency and refresh interval."""
+
+    def __init__(
+        self,
+        path: str,
+        workers: int = CATALOG_SCAN_WORKERS,
+        interval: float = CATALOG_REFRESH_INTERVAL,
+        name: Optional[str] = None,
+    ):
+        self.path = path
+        self.abspath = os.path.abspath(path)
+        self.workers = max(1, workers)
+        self.interval = interval
+        self.name = name or os.path.basename(self.abspath.rstrip(os.sep)) or self.abspath
+        # Jedno odświeżanie katalogu naraz – równoległe żądania nie skanują dysku podwójnie
+        self.lock = threading.Lock()
+        # Ostatni udany skan i ostatnia próba (także nieudana) – czas monotoniczny
+        self.last_refresh: Optional[float] = None
+        self.last_attempt: Optional[float] = None
+        self.scheduled = False
+        # Postęp bieżącego / ostatniego skanu (dla /ready)
+        self.scan: dict = {
+            "phase": "idle",  # idle | walking | parsing
+            "files_found": 0,
+            "files_to_parse": 0,
+            "files_parsed": 0,
+            "started_at": None,
+            "last_duration": None,
+            "last_error": None,
+        }
+
+    def contains(self, file_path: str) -> bool:
+        return os.path.commonpath([self.abspath, os.path.abspath(file_path)]) == self.abspath
+
+    def status(self) -> dict:
+        last = self.last_refresh
+        return {
+            "path": self.path,
+            "name": self.name,
+            "workers": self.workers,
+            "interval": self.interval,
+            "loaded": last is not None,
+            "last_refresh_age": time.monotonic() - last if last is not None else None,
+            **self.scan,
+        }
+
+    def __repr__(self) -> str:
+        return f"<LibraryRoot {self.path} workers={self.workers} interval={self.interval}>"
+
+
+def parse_roots(spec: str) -> list[LibraryRoot]:
+    """
+    Parse MUSIC_DIRS: paths separated by ";", each optionally followed by
+    "?workers=N&interval=S&name=X". Raises ValueError for unknown options.
+    """
+    roots = []
+    for entry in spec.split(";"):
+        entry = entry.strip()
+        if not entry:
+            continue
+        path, _, query = entry.partition("?")
+        options = dict(parse_qsl(query))
+        unknown = set(options) - {"workers", "interval", "name"}
+        if unknown:
+            raise ValueError(f"Unknown MUSIC_DIRS options for {path}: {', '.join(sorted(unknown))}")
+        roots.append(
+            LibraryRoot(
+                path.strip(),
+                workers=int(options.get("workers", CATALOG_SCAN_WORKERS)),
+                interval=float(options.get("interval", CATALOG_REFRESH_INTERVAL)),
+                name=options.get("name"),
+            )
+        )
+    return roots
+
+
+ROOTS: list[LibraryRoot] = parse_roots(MUSIC_DIRS or MUSIC_DIR)
+
+_lock = threading.RLock()
+_columns = _Columns()
+# Chwila, w której katalog był gotowy (każdy katalog biblioteki przeskanowany co najmniej raz)
+_last_refresh: Optional[float] = None
+# Wywoływane po pierwszym wczytaniu katalogu (np. przywrócenie zapisanych wyników zadań)
+_load_listeners: list[Callable[[], None]] = []
+
+# Numer generacji rośnie przy każdej zmianie katalogu. Start od czasu w ms,
+# więc po restarcie generacje są większe niż wszystkie wydane wcześniej.
+_generation = int(time.time() * 1000)
+# Najstarsza generacja, od której potrafimy podać pełną listę zmian
+_delta_floor = _generation
+# (generacja, ID) usuniętych plików
+_removed: deque[tuple[int, int]] = deque()
+# Czy generacja została już zrównana z dziennikiem zmian we wspólnej bazie
+_joined = False
+
+# Zmiana z tylu plików jest nakładana hurtowo (jedno sortowanie na końcu)
+_BULK_CHANGE = 64
+
+CallbackMetric(
+    "toolbox_catalog_files",
+    "Files currently held in the library catalog",
+    lambda: {(): len(_columns)},
+)
+CallbackMetric(
+    "toolbox_catalog_ready",
+    "1 once the library catalog has been loaded",
+    lambda: {(): int(_last_refresh is not None)},
+)
+CallbackMetric(
+    "toolbox_catalog_last_scan_seconds",
+    "Duration of the last completed catalog refresh, per library root",
+    lambda: {
+        (root.name,): root.scan["last_duration"]
+        for root in ROOTS
+        if root.scan["last_duration"] is not None
+    },
+    ("root",),
+)
+
+
+def _log_removal(generation: int, file_id: int) -> None:
+    global _delta_floor
+    _removed.append((generation, file_id))
+    if len(_removed) > CATALOG_CHANGELOG_SIZE:
+        dropped, _ = _removed.popleft()
+        _delta_floor = max(_delta_floor, dropped)
+
+
+def _stat_key(file_path: str) -> Optional[tuple[int, int]]:
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _root_of(file_path: str) -> Optional[LibraryRoot]:
+    """The innermost configured root containing `file_path`."""
+    matches = [root for root in ROOTS if root.contains(file_path)]
+    return max(matches, key=lambda root: len(root.abspath), default=None)
+
+
+def _is_library_path(file_path: str) -> bool:
+    root = _root_of(file_path)
+    if root is None:
+        return False
+    path = os.path.abspath(file_path)
+    relative = os.path.relpath(path, root.abspath)
+    # Ukryte katalogi (np. staging pobierań) nie należą do biblioteki
+    if any(part.startswith(".") for part in relative.split(os.sep)[:-1]):
+        return False
+    return Path(path).suffix.lower() in SUPPORTED_EXTENSIONS
+
+
+def _library_path(file_path: str) -> str:
+    root = _root_of(file_path)
+    if root is None:
+        return file_path
+    relative = os.path.relpath(os.path.abspath(file_path), root.abspath)
+    return os.path.join(root.path, relative)
+
+
+def _is_ready() -> bool:
+    """Every root was scanned at least once (successfully or not) and one of them loaded."""
+    return all(root.last_attempt is not None for root in ROOTS) and any(
+        root.last_refresh is not None for root in ROOTS
+    )
+
+
+def refresh(directory: Optional[str] = None, max_age: Optional[float] = None) -> None:
+    """
+    Synchronise the catalog with the disk – every root in parallel, or only
+    the root at `directory`. Only new or changed files (by mtime and size) are
+    parsed with mutagen. With `max_age`, a root refreshed less than `max_age`
+    seconds ago (e.g. by a scan this call waited for) is left alone.
+    Raises the scan error when no requested root could be scanned.
+    """
+    global _last_refresh
+
+    if directory is None:
+        roots = ROOTS
+    else:
+        roots = [r for r in ROOTS if r.abspath == os.path.abspath(directory)]
+        if not roots:
+            raise ValueError(f"Not a library root: {directory}")
+
+    if len(roots) == 1:
+        errors = [_refresh_root(roots[0], max_age)]
+    else:
+        # Każdy katalog w osobnym wątku – całość trwa tyle, co najwolniejszy
+        pool = get_thread_pool("catalog-roots", len(ROOTS))
+        futures = [pool.submit(_refresh_root, root, max_age) for root in roots]
+        wait(futures)
+        errors = [future.result() for future in futures]
+
+    with _lock:
+        ready = _is_ready()
+        first_load = ready and _last_refresh is None
+        if ready:
+            _last_refresh = time.monotonic()
+    # Poza blokadą – listener może sam czytać katalog
+    if first_load:
+        for listener in _load_listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.warning(f"Catalog load listener failed: {e}")
+    if all(error is not None for error in errors):
+        raise errors[0]
+
+
+def _refresh_root(root: LibraryRoot, max_age: Optional[float] = None) -> Optional[Exception]:
+    """Scan one root and merge it into the catalog; returns the error instead of raising."""
+    with root.lock:
+        if max_age is not None:
+            last = root.last_attempt
+            if last is not None and time.monotonic() - last < max_age:
+                return None
+        started = time.monotonic()
+        root.scan.update(
+            phase="walking",
+            files_found=0,
+            files_to_parse=0,
+            files_parsed=0,
+            started_at=time.time(),
+        )
+        try:
+            _refresh(root)
+        except Exception as e:
+            root.scan["last_error"] = str(e)
+            logger.warning(f"Scanning library root {root.path} failed: {e}")
+            return e
+        else:
+            root.scan["last_error"] = None
+            root.scan["last_duration"] = time.monotonic() - started
+            root.last_refresh = time.monotonic()
+            return None
+        finally:
+            root.last_attempt = time.monotonic()
+            root.scan["phase"] = "idle"
+
+
+def on_load(listener: Callable[[], None]) -> None:
+    """Call `listener` after every full (re)load of the catalog, e.g. at startup."""
+    _load_listeners.append(listener)
+
+
+def _stat_many(paths: Sequence[str]) -> list[Optional[tuple[int, int]]]:
+    return [_stat_key(path) for path in paths]
+
+
+def _refresh(root: LibraryRoot) -> None:
+    # Niezamontowany dysk wyglądałby jak pusty katalog – nie usuwamy wtedy jego plików
+    if not os.path.isdir(root.path):
+        raise OSError(f"Library root not available: {root.path}")
+    found = scan_music_directory(root.path)
+    # Katalog zagnieżdżony w innym katalogu biblioteki skanuje jego własny wątek
+    if any(other is not root and root.contains(other.path) for other in ROOTS):
+        found = [p for p in found if _root_of(p) is root]
+    found_ids = [int(get_file_id(p), 16) for p in found]
+    fresh: list[tuple[str, int, dict, int]] = []
+    root.scan.update(phase="parsing", files_found=len(found))
+
+    with _lock:
+        columns = _columns
+        known = columns.id_map()
+        # (mtime_ns, rozmiar) znanych plików – porównywane bez trzymania blokady
+        known_stats = {
+            file_id: (columns.mtimes[row], columns.sizes[row]) for file_id, row in known.items()
+        }
+
+    # stat i mutagen na dysku sieciowym czekają głównie na I/O – kilka wątków na katalog
+    pool = get_thread_pool(f"catalog-{root.name}", root.workers)
+    # Paczki ścieżek dla stat – tyle, żeby zająć wszystkie wątki, ale nie po jednej
+    size = max(1, min(_STAT_CHUNK, -(-len(found) // (root.workers * 4))))
+    chunks = [found[i : i + size] for i in range(0, len(found), size)]
+    stats = [stat for chunk in pool.map(_stat_many, chunks) for stat in chunk]
+    changed = []
+    for file_path, file_id, stat in zip(found, found_ids, stats):
+        if stat is not None and known_stats.get(file_id) != stat:
+            changed.append((file_path, file_id, stat[0]))
+    root.scan["files_to_parse"] = len(changed)
+    parsed = pool.map(extract_metadata, [file_path for file_path, _, _ in changed])
+    for count, ((file_path, file_id, mtime_ns), metadata) in enumerate(zip(changed, parsed), 1):
+        fresh.append((file_path, file_id, metadata, mtime_ns))
+        root.scan["files_parsed"] = count
+
+    with _lock:
+        if columns is not _columns:
+            columns = _columns
+            known = columns.id_map()
+        found_set = set(found_ids)
+        # Usuwane są tylko pliki tego katalogu biblioteki – pozostałe skanują własne wątki
+        in_root: dict[int, bool] = {}
+        removed = []
+        for file_id, row in known.items():
+            if file_id in found_set:
+                continue
+            directory = columns.dirs[row]
+            if directory not in in_root:
+                in_root[directory] = _root_of(columns.strings.get(directory)) is root
+            if in_root[directory]:
+                removed.append(file_id)
+    if removed or fresh:
+        # Pierwsze wczytanie katalogu robi każdy worker sam – nie trafia do dziennika zmian
+        _commit(
+            {
+                "put": [(file_path, metadata, mtime_ns) for file_path, _, metadata, mtime_ns in fresh],
+                "drop": removed,
+            },
+            local=root.last_refresh is None,
+        )
+
+
+def _schedule(root: LibraryRoot) -> None:
+    """Refresh a stale root in the background; requests keep using the current rows."""
+
+    def run():
+        try:
+            _refresh_root(root, max_age=root.interval)
+        finally:
+            root.scheduled = False
+
+    with _lock:
+        if root.scheduled or root.lock.locked():
+            return
+        root.scheduled = True
+    get_thread_pool("catalog-roots", len(ROOTS)).submit(run)
+
+
+def ensure_fresh() -> None:
+    """
+    Load the catalog if it was never loaded (waiting for a warm-up in progress),
+    and start a background refresh of every root whose own interval elapsed.
+    With several workers, first replay the changes logged by the others; only
+    the leader rescans the disk.
+    """
+    if shared_state.enabled():
+        _sync()
+    with _lock:
+        ready = _last_refresh is not None
+    if not ready:
+        refresh(max_age=CATALOG_REFRESH_INTERVAL)
+        return
+    # Katalog, którego ten worker jeszcze nie wczytał, wczytuje sam także poza liderem
+    leader = shared_state.is_leader()
+    now = time.monotonic()
+    for root in ROOTS:
+        last = root.last_attempt
+        if (last is None or now - last >= root.interval) and (leader or root.last_refresh is None):
+            _schedule(root)
+
+
+def start_warm_up() -> threading.Thread:
+    """Load the catalog in a background thread so the first requests find it warm."""
+
+    def warm_up():
+        started = time.monotonic()
+        try:
+            refresh(max_age=CATALOG_REFRESH_INTERVAL)
+            logger.info(
+                f"Catalog ready: {len(_columns)} files from {len(ROOTS)} root(s) "
+                f"in {time.monotonic() - started:.1f}s"
+            )
+        except Exception as e:
+            logger.warning(f"Catalog warm-up failed: {e}")
+
+    thread = threading.Thread(target=warm_up, name="catalog-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def scan_status() -> dict:
+    """
+    Readiness of the catalog: whether it was loaded, its size, overall scan
+    progress (summed over roots) and the state of every root.
+    """
+    with _lock:
+        ready = _last_refresh is not None
+        files = len(_columns)
+        age = time.monotonic() - _last_refresh if ready else None
+    roots = [root.status() for root in ROOTS]
+    phases = {root["phase"] for root in roots}
+    errors = [f"{root['path']}: {root['last_error']}" for root in roots if root["last_error"]]
+    durations = [root["last_duration"] for root in roots if root["last_duration"] is not None]
+    started = [root["started_at"] for root in roots if root["started_at"] is not None]
+    return {
+        "ready": ready,
+        "files": files,
+        "last_refresh_age": age,
+        "phase": next((p for p in ("parsing", "walking") if p in phases), "idle"),
+        "files_found": sum(root["files_found"] for root in roots),
+        "files_to_parse": sum(root["files_to_parse"] for root in roots),
+        "files_parsed": sum(root["files_parsed"] for root in roots),
+        "started_at": min(started) if started else None,
+        "last_duration": max(durations) if durations else None,
+        "last_error": "; ".join(errors) or None,
+        "roots": roots,
+    }
+
+
+def upsert(file_path: str) -> Optional[dict]:
+    """
+    Add or update a single file without walking the directory.
+    Used when the toolbox itself creates or modifies a file.
+    """
+    if not _is_library_path(file_path):
+        return None
+    # Ta sama postać ścieżki co z os.walk, żeby ID pliku było stabilne
+    file_path = _library_path(file_path)
+    stat = _stat_key(file_path)
+    if stat is None:
+        remove(file_path)
+        return None
+    metadata = extract_metadata(file_path)
+    _commit({"put": [(file_path, metadata, stat[0])]})
+    with _lock:
+        row = _columns.find(file_path)
+        return Row(_columns, row).to_dict() if row is not None else None
+
+
+def upsert_many(
+    file_paths: Sequence[str], metadata: Optional[dict[str, dict]] = None
+) -> list[dict]:
+    """
+    Add or update many files as one catalog change (a single generation bump).
+    `metadata` may carry already extracted tags per path; others are read here.
+    """
+    fresh = []
+    gone = []
+    for file_path in file_paths:
+        if not _is_library_path(file_path):
+            continue
+        library_path = _library_path(file_path)
+        stat = _stat_key(library_path)
+        if stat is None:
+            gone.append(int(get_file_id(library_path), 16))
+            continue
+        known = (metadata or {}).get(file_path)
+        fresh.append((library_path, known or extract_metadata(library_path), stat[0]))
+
+    _commit({"put": fresh, "drop": gone})
+    with _lock:
+        rows = [_columns.find(path) for path, _, _ in fresh]
+        return [Row(_columns, row).to_dict() for row in rows if row is not None]
+
+
+def set_integrity(
+    results: Sequence[tuple[str, int, int, Optional[bool]]], local: bool = False
+) -> int:
+    """
+    Record verification results as (file ID, mtime_ns, size, ok) – ok=None clears it.
+    Rows whose file changed since it was checked are skipped. Returns rows updated.
+    `local` applies them to this worker only (results every worker restores itself).
+    """
+    if not results:
+        return 0
+    return _commit({"integrity": list(results)}, local=local)
+
+
+def remove(file_path: str) -> None:
+    """Drop a single file from the catalog."""
+    _commit({"drop": [int(get_file_id(_library_path(file_path)), 16)]})
+
+
+def _apply(generation: int, change: dict) -> int:
+    """
+    Apply one change to the columns (caller holds _lock): "put" rows as
+    (path, metadata, mtime_ns), "drop" file IDs (ints) and "integrity" results
+    as in set_integrity. Changed rows get `generation`; returns their number.
+    """
+    global _columns
+    columns = _columns
+    puts = change.get("put", ())
+    drops = change.get("drop", ())
+    bulk = len(puts) + len(drops) > _BULK_CHANGE
+    changed = 0
+    reorder = False
+    # Nowe wiersze zmiany hurtowej nie są jeszcze w indeksie ID
+    added: dict[int, int] = {}
+    for file_path, metadata, mtime_ns in puts:
+        file_id = int(get_file_id(file_path), 16)
+        row = added.get(file_id)
+        if row is None:
+            row = columns.find_id(file_id)
+        if row is None and bulk:
+            row = added[file_id] = columns.put(
+                file_path, metadata, mtime_ns, generation, row=-1, keep_order=False
+            )
+            reorder = True
+        else:
+            columns.put(file_path, metadata, mtime_ns, generation, row=row, keep_order=not bulk)
+        changed += 1
+    for file_id in drops:
+        row = columns.find_id(file_id)
+        if row is not None and columns.drop(row, keep_order=not bulk):
+            _log_removal(generation, file_id)
+            changed += 1
+            reorder |= bulk
+    if reorder:
+        columns.sort()
+    for file_id, mtime_ns, size, ok in change.get("integrity", ()):
+        row = columns.find_id(int(file_id, 16))
+        if row is None or (columns.mtimes[row], columns.sizes[row]) != (mtime_ns, size):
+            continue
+        state = 0 if ok is None else (1 if ok else 2)
+        if columns.checks[row] != state:
+            columns.checks[row] = state
+            columns.gens[row] = generation
+            changed += 1
+    # Dużo usuniętych wierszy – przepisz kolumny bez nich
+    if columns.dead > max(1000, len(columns) // 4):
+        _columns = columns.compacted()
+    return changed
+
+
+def _commit(change: dict, local: bool = False) -> int:
+    """
+    Apply a change made by this worker and return the number of changed rows.
+    With several workers it goes through the shared change log (unless `local`,
+    which keeps the current generation).
+    """
+    global _generation
+    if not shared_state.enabled():
+        with _lock:
+            changed = _apply(_generation + 1, change)
+            if changed:
+                _generation += 1
+            return changed
+    if local:
+        _sync()
+        with _lock:
+            return _apply(_generation, change)
+    return _sync(shared_state.append_change(change))
+
+
+def _sync(wanted: Optional[int] = None) -> int:
+    """
+    Replay changes logged (by any worker) since this worker's generation.
+    Returns the number of rows changed by the change numbered `wanted`.
+    """
+    global _generation, _delta_floor, _joined
+    with _lock:
+        if not _joined:
+            # Pusty katalog – wystarczy zacząć od bieżącej pozycji dziennika
+            _generation = _delta_floor = shared_state.latest_change()
+            _joined = True
+        changes = shared_state.changes_after(_generation)
+        if changes is None:
+            logger.warning("Catalog change log was trimmed past this worker – reloading")
+            clear()
+            return 0
+        result = 0
+        for seq, change in changes:
+            changed = _apply(seq, change)
+            _generation = seq
+            if seq == wanted:
+                result = changed
+        return result
+
+
+def query(search: Optional[str] = None) -> RowSequence:
+    """
+    Return catalog rows in path order, optionally filtered by a search phrase
+    matched against title, artist, album and filename.
+    """
+    ensure_fresh()
+    with _lock:
+        if not search:
+            return RowSequence(_columns, array("I", _columns.order))
+        return RowSequence(_columns, _columns.search(search))
+
+
+def get(file_id: str) -> Optional[Row]:
+    """Find a catalog row by file ID."""
+    ensure_fresh()
+    if len(file_id) != 16:
+        return None
+    try:
+        key = int(file_id, 16)
+    except ValueError:
+        return None
+    with _lock:
+        row = _columns.find_id(key)
+        return Row(_columns, row) if row is not None else None
+
+
+def generation() -> int:
+    """Current catalog generation; changes whenever any file is added, changed or removed."""
+    ensure_fresh()
+    with _lock:
+        return _generation
+
+
+def changes_since(since: int) -> tuple[int, bool, RowSequence, list[str]]:
+    """
+    Rows added or changed after generation `since` and IDs removed since then.
+    Returns (generation, reset, changed, removed); `reset` means the delta is
+    not available (too old, or from before a restart) and the client must reload.
+    """
+    ensure_fresh()
+    with _lock:
+        columns = _columns
+        if since < _delta_floor or since > _generation:
+            return _generation, True, RowSequence(columns, array("I")), []
+        gens = columns.gens
+        changed = array("I", [row for row in columns.order if gens[row] > since])
+        # Plik usunięty i dodany ponownie jest tylko w `changed`
+        removed = [
+            f"{file_id:016x}"
+            for gen, file_id in _removed
+            if gen > since and columns.find_id(file_id) is None
+        ]
+        return _generation, False, RowSequence(columns, changed), list(dict.fromkeys(removed))
+
+
+def stats() -> dict:
+    """Row and string pool counts, useful for sizing the catalog."""
+    with _lock:
+        return {
+            "files": len(_columns),
+            "tombstones": _columns.dead,
+            "strings": len(_columns.strings),
+        }
+
+
+def clear() -> None:
+    """Forget every entry; the next query rebuilds the catalog from disk."""
+    global _columns, _last_refresh, _generation, _delta_floor, _joined
+    with _lock:
+        _columns = _Columns()
+        _last_refresh = None
+        for root in ROOTS:
+            root.last_refresh = root.last_attempt = None
+        if shared_state.enabled():
+            # Generacja to pozycja w dzienniku – następna synchronizacja zaczyna od bieżącej
+            _joined = False
+        else:
+            _generation += 1
+        _delta_floor = _generation
+        _removed.clear()
@@ -0,0 +1,296 @@
+"""
+Duplicate detection over the library catalog.
+
+Exact duplicates are narrowed in stages, so only a small part of the library is read:
+
+1. rows are grouped by (size, duration) straight from the catalog – no I/O,
+2. files still sharing a group get their head and tail blocks hashed,
+3. only files whose head and tail also match are hashed in full.
+
+Optionally tracks with the same normalised artist/title and a similar duration
+are reported as tag matches (re-downloads of the same song in another format).
+Hashes are cached per file together with its (mtime, size), so a repeated scan
+only reads files that changed since the previous one.
+"""
+
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from concurrent.futures import as_completed
+from typing import Optional
+
+from app.jobs import Job, latest_job, start_job
+from app.services import catalog_service
+from app.services.executors import get_thread_pool, lower_thread_priority
+
+# Rozmiar bloku z początku i końca pliku w etapie 2
+DUPLICATES_BLOCK_SIZE = int(os.environ.get("DUPLICATES_BLOCK_SIZE", str(64 * 1024)))
+DUPLICATES_WORKERS = int(os.environ.get("DUPLICATES_WORKERS", "4"))
+# Maksymalna różnica długości (s) dla dopasowania po tagach
+DUPLICATES_DURATION_TOLERANCE = float(os.environ.get("DUPLICATES_DURATION_TOLERANCE", "2"))
+
+JOB_KIND = "duplicates"
+
+_READ_CHUNK = 1024 * 1024
+
+# Dopiski z YouTube, które nie zmieniają utworu: "(Official Video)", "[HD]"...
+_NOISE_BRACKETS = re.compile(
+    r"[\(\[][^\)\]]*\b(official|video|audio|lyrics?|visuali[sz]er|hd|hq|4k|remaster(ed)?|explicit)\b[^\)\]]*[\)\]]"
+)
+_FEATURING = re.compile(r"\s(feat\.?|ft\.?|featuring)\s.*$")
+_NON_WORD = re.compile(r"[^\w]+")
+
+# ID pliku -> (mtime_ns, rozmiar, skrót); osobno dla head/tail i całej treści
+_partial_hashes: dict[str, tuple[int, int, str]] = {}
+_full_hashes: dict[str, tuple[int, int, str]] = {}
+_cache_lock = threading.Lock()
+
+
+def normalize_tag(value: Optional[str]) -> str:
+    """Lowercase, strip accents, YouTube noise in brackets, `feat.` credits and punctuation."""
+    if not value:
+        return ""
+    value = unicodedata.normalize("NFKD", value)
+    value = "".join(c for c in value if not unicodedata.combining(c)).casefold()
+    value = _NOISE_BRACKETS.sub(" ", value)
+    value = _FEATURING.sub("", value)
+    return " ".join(_NON_WORD.sub(" ", value).split())
+
+
+def partial_hash(file_path: str, size: int) -> tuple[str, int, bool]:
+    """
+    Hash of the first and last DUPLICATES_BLOCK_SIZE bytes.
+    Returns (digest, bytes read, whether the whole file was covered).
+    """
+    block = DUPLICATES_BLOCK_SIZE
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        if size <= 2 * block:
+            data = f.read()
+            digest.update(data)
+            return digest.hexdigest(), len(data), True
+        head = f.read(block)
+        f.seek(-block, os.SEEK_END)
+        tail = f.read(block)
+    digest.update(head)
+    digest.update(tail)
+    return digest.hexdigest(), len(head) + len(tail), False
+
+
+def full_hash(file_path: str) -> tuple[str, int]:
+    """Hash of the whole file; returns (digest, bytes read)."""
+    digest = hashlib.blake2b(digest_size=16)
+    read = 0
+    with open(file_path, "rb") as f:
+        while chunk := f.read(_READ_CHUNK):
+            digest.update(chunk)
+            read += len(chunk)
+    return digest.hexdigest(), read
+
+
+def _hash_stage(job: Job, phase: str, files: list[tuple], full: bool, stats: dict) -> dict[str, str]:
+    """
+    Hash `files` (id, path, size, mtime_ns) in the worker pool, reusing cached digests.
+    Returns file ID -> digest; unreadable files are left out.
+    """
+    cache = _full_hashes if full else _partial_hashes
+    digests: dict[str, str] = {}
+    pending = []
+    with _cache_lock:
+        for file_id, path, size, mtime_ns in files:
+            cached = cache.get(file_id)
+            if cached is not None and cached[:2] == (mtime_ns, size):
+                digests[file_id] = cached[2]
+            else:
+                pending.append((file_id, path, size, mtime_ns))
+
+    job.update(phase=phase, done=len(digests), total=len(files))
+    pool = get_thread_pool("duplicates", DUPLICATES_WORKERS, initializer=lower_thread_priority)
+    futures = {
+        pool.submit(full_hash, path) if full else pool.submit(partial_hash, path, size): (
+            file_id,
+            size,
+            mtime_ns,
+        )
+        for file_id, path, size, mtime_ns in pending
+    }
+    try:
+        for future in as_completed(futures):
+            file_id, size, mtime_ns = futures[future]
+            job.advance()
+            try:
+                result = future.result()
+            except OSError:
+                stats["unreadable"] += 1
+                continue
+            digest, read = result[0], result[1]
+            stats["bytes_read"] += read
+            digests[file_id] = digest
+            with _cache_lock:
+                cache[file_id] = (mtime_ns, size, digest)
+                # Mały plik przeczytany w całości – etap 3 nie jest potrzebny
+                if not full and result[2]:
+                    _full_hashes[file_id] = (mtime_ns, size, digest)
+            job.check_cancelled()
+    finally:
+        for future in futures:
+            future.cancel()
+    return digests
+
+
+def _regroup(groups: list[list[int]], ids: list[str], digests: dict[str, str]) -> list[list[int]]:
+    regrouped = []
+    for group in groups:
+        by_digest: dict[str, list[int]] = defaultdict(list)
+        for i in group:
+            digest = digests.get(ids[i])
+            if digest is not None:
+                by_digest[digest].append(i)
+        regrouped.extend(g for g in by_digest.values() if len(g) > 1)
+    return regrouped
+
+
+def _tag_groups(columns: dict, exact: list[list[int]]) -> list[dict]:
+    """Groups of tracks with the same normalised artist and title and a similar duration."""
+    exact_group = {i: n for n, group in enumerate(exact) for i in group}
+    by_key: dict[tuple[str, str], list[int]] = defaultdict(list)
+    for i, (artist, title) in enumerate(zip(columns["artist"], columns["title"])):
+        # Pobrania bez tagu wykonawcy mają zwykle tytuł "Wykonawca - Tytuł"
+        if not artist and title and " - " in title:
+            artist, title = title.split(" - ", 1)
+        key = (normalize_tag(artist), normalize_tag(title))
+        if key[0] and key[1]:
+            by_key[key].append(i)
+
+    durations = columns["duration"]
+    groups = []
+    for (artist, title), members in by_key.items():
+        if len(members) < 2:
+            continue
+        members.sort(key=lambda i: durations[i] or 0.0)
+        cluster = [members[0]]
+        for i in members[1:] + [None]:
+            previous = durations[cluster[-1]]
+            if i is not None and (
+                previous is None
+                or durations[i] is None
+                or durations[i] - previous <= DUPLICATES_DURATION_TOLERANCE
+            ):
+                cluster.append(i)
+                continue
+            # Grupa złożona tylko z identycznych plików jest już w wynikach "exact"
+            if len(cluster) > 1 and len({exact_group.get(j, -1 - j) for j in cluster}) > 1:
+                groups.append({"kind": "tags", "artist": artist, "title": title, "rows": cluster})
+            if i is not None:
+                cluster = [i]
+    return groups
+
+
+def find_duplicates(job: Job, tags: bool = False) -> dict:
+    """Job body: run the three hashing stages (and the tag match) over the whole catalog."""
+    rows = catalog_service.query()
+    columns = rows.to_columns(
+        ("id", "path", "file_size", "duration", "mtime_ns", "artist", "title")
+    )
+    ids, paths, sizes = columns["id"], columns["path"], columns["file_size"]
+    durations, mtimes = columns["duration"], columns["mtime_ns"]
+    stats = {
+        "files": len(ids),
+        "bytes_total": sum(sizes),
+        "bytes_read": 0,
+        "unreadable": 0,
+    }
+
+    # Etap 1: rozmiar + długość z katalogu, bez czytania plików
+    job.update(phase="size", done=0, total=len(ids))
+    by_size: dict[tuple, list[int]] = defaultdict(list)
+    for i, (size, duration) in enumerate(zip(sizes, durations)):
+        if size > 0:
+            by_size[(size, None if duration is None else round(duration, 3))].append(i)
+    groups = [g for g in by_size.values() if len(g) > 1]
+    stats["candidates_size"] = sum(map(len, groups))
+
+    def files_of(groups: list[list[int]]) -> list[tuple]:
+        return [(ids[i], paths[i], sizes[i], mtimes[i]) for group in groups for i in group]
+
+    # Etap 2: początek i koniec pliku
+    groups = _regroup(groups, ids, _hash_stage(job, "partial", files_of(groups), False, stats))
+    stats["candidates_partial"] = sum(map(len, groups))
+
+    # Etap 3: cała treść, tylko dla plików zgodnych w etapie 2
+    groups = _regroup(groups, ids, _hash_stage(job, "full", files_of(groups), True, stats))
+    stats["candidates_full"] = sum(map(len, groups))
+
+    exact = []
+    with _cache_lock:
+        for group in groups:
+            group.sort(key=lambda i: paths[i])
+            exact.append(
+                {
+                    "kind": "exact",
+                    "hash": _full_hashes[ids[group[0]]][2],
+                    "rows": group,
+                }
+            )
+        # Usunięte z biblioteki pliki nie zostają w cache na zawsze
+        alive = set(ids)
+        for cache in (_partial_hashes, _full_hashes):
+            for file_id in [k for k in cache if k not in alive]:
+                del cache[file_id]
+
+    found = exact
+    if tags:
+        job.update(phase="tags")
+        found = exact + _tag_groups(columns, [g["rows"] for g in exact])
+
+    stats["groups"] = len(found)
+    stats["read_ratio"] = stats["bytes_read"] / stats["bytes_total"] if stats["bytes_total"] else 0.0
+    job.update(phase="done", **{k: stats[k] for k in ("groups", "bytes_read")})
+    return {
+        "generation": catalog_service.generation(),
+        "stats": stats,
+        "groups": [
+            {
+                **{k: v for k, v in group.items() if k != "rows"},
+                "ids": [ids[i] for i in group["rows"]],
+            }
+            for group in found
+        ],
+    }
+
+
+def start_scan(tags: bool = False) -> Job:
+    """Start a duplicate scan, or return the one already running."""
+    return start_job(JOB_KIND, lambda job: find_duplicates(job, tags), {"tags": tags}, exclusive=True)
+
+
+def latest_result(kind: Optional[str] = None) -> tuple[Optional[Job], Optional[dict]]:
+    """
+    The newest scan job and the groups of its last completed run, with files
+    resolved from the current catalog. Files removed since the scan are dropped.
+    """
+    job = latest_job(JOB_KIND)
+    completed = latest_job(JOB_KIND, status="completed")
+    if completed is None:
+        return job, None
+
+    groups = []
+    wasted = 0
+    for group in completed.result["groups"]:
+        if kind and group["kind"] != kind:
+            continue
+        files = [row.to_dict() for row in map(catalog_service.get, group["ids"]) if row is not None]
+        if len(files) < 2:
+            continue
+        if group["kind"] == "exact":
+            wasted += sum(f["file_size"] for f in files[1:])
+        groups.append({**{k: v for k, v in group.items() if k != "ids"}, "files": files})
+    return job, {
+        "scanned_at": completed.finished_at,
+        "stats": completed.result["stats"],
+        "wasted_bytes": wasted,
+        "groups": groups,
+    }
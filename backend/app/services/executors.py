@@ -0,0 +1,168 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+
+from app.metrics import CallbackMetric
+
+# Nazwane pule wykonawcze współdzielone przez serwisy (tworzone leniwie)
+_pools: dict[str, Executor] = {}
+_lock = threading.Lock()
+
+
+class _TrackedMixin:
+    """Counts submitted-but-unfinished work items so queue depth can be reported."""
+
+    max_workers: int = 1
+
+    def _init_tracking(self, max_workers: int) -> None:
+        self.max_workers = max_workers
+        self.in_flight = 0
+        self._tracking_lock = threading.Lock()
+
+    def _track(self, future):
+        with self._tracking_lock:
+            self.in_flight += 1
+
+        def finished(_):
+            with self._tracking_lock:
+                self.in_flight -= 1
+
+        future.add_done_callback(finished)
+        return future
+
+    @property
+    def queued(self) -> int:
+        return max(0, self.in_flight - self.max_workers)
+
+
+class TrackedThreadPool(_TrackedMixin, ThreadPoolExecutor):
+    def __init__(self, max_workers: int, **kwargs):
+        super().__init__(max_workers=max_workers, **kwargs)
+        self._init_tracking(max_workers)
+
+    def submit(self, fn, /, *args, **kwargs):
+        return self._track(super().submit(fn, *args, **kwargs))
+
+
+class TrackedProcessPool(_TrackedMixin, ProcessPoolExecutor):
+    def __init__(self, max_workers: int, **kwargs):
+        super().__init__(max_workers=max_workers, **kwargs)
+        self._init_tracking(max_workers)
+
+    def submit(self, fn, /, *args, **kwargs):
+        return self._track(super().submit(fn, *args, **kwargs))
+
+
+def cpu_count() -> int:
+    """Number of CPUs this process may actually run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def get_process_pool(name: str, max_workers: int) -> ProcessPoolExecutor:
+    """
+    Return the named process pool, creating it on first use.
+    Workers are spawned fresh so they never inherit the server's threads or locks.
+    """
+    with _lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = TrackedProcessPool(
+                max_workers=max(1, max_workers),
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            _pools[name] = pool
+        return pool  # type: ignore[return-value]
+
+
+def submit_process(name: str, max_workers: int, fn: Callable, /, *args, **kwargs) -> Future:
+    """
+    Submit `fn` to the named process pool. A worker that died abruptly leaves
+    the pool broken for good (submit raises BrokenProcessPool) – it is then
+    replaced by a fresh pool and the call retried once.
+    """
+    pool = get_process_pool(name, max_workers)
+    try:
+        return pool.submit(fn, *args, **kwargs)
+    except BrokenProcessPool:
+        with _lock:
+            if _pools.get(name) is pool:
+                del _pools[name]
+        pool.shutdown(wait=False, cancel_futures=True)
+        return get_process_pool(name, max_workers).submit(fn, *args, **kwargs)
+
+
+def get_thread_pool(
+    name: str, max_workers: int, initializer: Optional[Callable[[], None]] = None
+) -> ThreadPoolExecutor:
+    """Return the named thread pool, creating it on first use."""
+    with _lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = TrackedThreadPool(
+                max_workers=max(1, max_workers),
+                thread_name_prefix=name,
+                initializer=initializer,
+            )
+            _pools[name] = pool
+        return pool  # type: ignore[return-value]
+
+
+def lower_thread_priority(niceness: int = 10) -> None:
+    """
+    Pool initializer that renices the current worker thread (Linux nice is per-thread),
+    so background work yields CPU to request handling.
+    """
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), niceness)
+    except (AttributeError, OSError):
+        pass
+
+
+def pool_stats() -> dict[str, dict[str, int]]:
+    """In-flight, queued and worker counts for every pool created so far."""
+    with _lock:
+        pools = dict(_pools)
+    return {
+        name: {
+            "workers": pool.max_workers,
+            "in_flight": pool.in_flight,
+            "queued": pool.queued,
+        }
+        for name, pool in pools.items()
+        if isinstance(pool, _TrackedMixin)
+    }
+
+
+def shutdown_pools(wait: bool = True) -> None:
+    """Shut down every pool created so far."""
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=wait, cancel_futures=True)
+
+
+CallbackMetric(
+    "toolbox_executor_workers",
+    "Configured workers per executor pool",
+    lambda: {(name,): stats["workers"] for name, stats in pool_stats().items()},
+    ("pool",),
+)
+CallbackMetric(
+    "toolbox_executor_in_flight",
+    "Submitted work items not yet finished, per executor pool",
+    lambda: {(name,): stats["in_flight"] for name, stats in pool_stats().items()},
+    ("pool",),
+)
+CallbackMetric(
+    "toolbox_executor_queue_depth",
+    "Work items waiting for a free worker, per executor pool",
+    lambda: {(name,): stats["queued"] for name, stats in pool_stats().items()},
+    ("pool",),
+)
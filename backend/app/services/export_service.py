@@ -0,0 +1,111 @@
+import csv
+import io
+from typing import Iterator, Optional, Sequence
+
+from app.responses import json_bytes, msgpack_bytes
+from app.services import catalog_service
+
+EXPORT_FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "msgpack": ("application/msgpack", "msgpack"),
+}
+
+# Tagi sprawdzane przez filtr missing=tags
+TAG_FIELDS = ("title", "artist", "album", "year", "track_number", "genre")
+
+# Wiersze kodowane jednym kawałkiem – pamięć nie rośnie z rozmiarem biblioteki
+EXPORT_BATCH_SIZE = 2000
+
+
+def parse_fields(fields: Optional[str]) -> tuple[str, ...]:
+    """Comma-separated field names; empty means every catalog field."""
+    if not fields:
+        return catalog_service.FIELDS
+    selected = tuple(f.strip() for f in fields.split(",") if f.strip())
+    if not selected:
+        return catalog_service.FIELDS
+    unknown = [f for f in selected if f not in catalog_service.FIELDS]
+    if unknown:
+        raise ValueError(
+            f"Unknown fields: {', '.join(unknown)}. "
+            f"Available: {', '.join(catalog_service.FIELDS)}"
+        )
+    return selected
+
+
+def parse_missing(missing: Optional[str]) -> tuple[str, ...]:
+    """Tags that must be empty; `tags` expands to every tag field."""
+    if not missing:
+        return ()
+    selected: list[str] = []
+    for name in (m.strip() for m in missing.split(",") if m.strip()):
+        if name == "tags":
+            selected.extend(TAG_FIELDS)
+        elif name in TAG_FIELDS:
+            selected.append(name)
+        else:
+            raise ValueError(f"missing accepts: tags, {', '.join(TAG_FIELDS)}")
+    return tuple(dict.fromkeys(selected))
+
+
+def _encode(fmt: str, fields: Sequence[str], rows: list) -> bytes:
+    if fmt == "ndjson":
+        return b"".join(json_bytes(dict(zip(fields, row))) + b"\n" for row in rows)
+    if fmt == "msgpack":
+        return b"".join(msgpack_bytes(dict(zip(fields, row))) for row in rows)
+    buffer = io.StringIO()
+    # csv zapisuje None jako pusty napis
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue().encode("utf-8")
+
+
+def export_catalog(
+    fmt: str = "ndjson",
+    fields: Sequence[str] = catalog_service.FIELDS,
+    search: Optional[str] = None,
+    formats: Optional[set[str]] = None,
+    missing: Sequence[str] = (),
+    has_cover: Optional[bool] = None,
+) -> Iterator[bytes]:
+    """
+    Stream the catalog (a snapshot taken on the first chunk) as encoded chunks.
+    Rows match when their format is in `formats`, at least one of the `missing`
+    tags is empty and the cover flag equals `has_cover` – each filter only if given.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Format must be one of: {', '.join(EXPORT_FORMATS)}")
+    if fmt == "msgpack":
+        msgpack_bytes(None)  # brak pakietu msgpack -> ValueError przed wysłaniem nagłówków
+
+    def generate() -> Iterator[bytes]:
+        if fmt == "csv":
+            buffer = io.StringIO()
+            csv.writer(buffer).writerow(fields)
+            yield buffer.getvalue().encode("utf-8")
+
+        rows = catalog_service.query(search)
+        needed = tuple(
+            dict.fromkeys(
+                [*fields, *missing]
+                + (["format"] if formats else [])
+                + (["has_cover"] if has_cover is not None else [])
+            )
+        )
+        for start in range(0, len(rows), EXPORT_BATCH_SIZE):
+            columns = rows[start : start + EXPORT_BATCH_SIZE].to_columns(needed)
+            selected = [columns[field] for field in fields]
+            if formats or missing or has_cover is not None:
+                keep = range(len(selected[0]))
+                if formats:
+                    keep = [i for i in keep if columns["format"][i] in formats]
+                if missing:
+                    keep = [i for i in keep if any(columns[m][i] in (None, "") for m in missing)]
+                if has_cover is not None:
+                    keep = [i for i in keep if columns["has_cover"][i] == has_cover]
+                selected = [[column[i] for i in keep] for column in selected]
+            batch = list(zip(*selected))
+            if batch:
+                yield _encode(fmt, fields, batch)
+
+    return generate()
@@ -1,14 +1,40 @@
 import os
+import base64
 import hashlib
 from pathlib import Path
 from typing import Optional
-from mutagen.mp3 import MP3
-from mutagen.flac import FLAC, Picture
-from mutagen.mp4 import MP4
-from mutagen.oggvorbis import OggVorbis
-from mutagen.oggopus import OggOpus
-from mutagen.asf import ASF
-from mutagen.wave import WAVE
+
+from app.lazy import lazy_attr
+from app.metrics import (
+    COVER_EXTRACT_SECONDS,
+    FILE_SCAN_FILES,
+    FILE_SCAN_SECONDS,
+    METADATA_EXTRACT_ERRORS,
+    METADATA_EXTRACT_SECONDS,
+)
+
+# Moduły formatów mutagen są importowane przy pierwszym użyciu (app.lazy)
+APIC = lazy_attr("mutagen.id3", "APIC")
+ID3 = lazy_attr("mutagen.id3", "ID3")
+TALB = lazy_attr("mutagen.id3", "TALB")
+TCON = lazy_attr("mutagen.id3", "TCON")
+TDRC = lazy_attr("mutagen.id3", "TDRC")
+TIT2 = lazy_attr("mutagen.id3", "TIT2")
+TPE1 = lazy_attr("mutagen.id3", "TPE1")
+TPE2 = lazy_attr("mutagen.id3", "TPE2")
+TPOS = lazy_attr("mutagen.id3", "TPOS")
+TRCK = lazy_attr("mutagen.id3", "TRCK")
+TXXX = lazy_attr("mutagen.id3", "TXXX")
+MP3 = lazy_attr("mutagen.mp3", "MP3")
+FLAC = lazy_attr("mutagen.flac", "FLAC")
+Picture = lazy_attr("mutagen.flac", "Picture")
+MP4 = lazy_attr("mutagen.mp4", "MP4")
+MP4Cover = lazy_attr("mutagen.mp4", "MP4Cover")
+MP4FreeForm = lazy_attr("mutagen.mp4", "MP4FreeForm")
+OggVorbis = lazy_attr("mutagen.oggvorbis", "OggVorbis")
+OggOpus = lazy_attr("mutagen.oggopus", "OggOpus")
+ASF = lazy_attr("mutagen.asf", "ASF")
+WAVE = lazy_attr("mutagen.wave", "WAVE")
 
 # Obsługiwane formaty audio
 SUPPORTED_EXTENSIONS = {
@@ -22,8 +48,13 @@ SUPPORTED_EXTENSIONS = {
     ".wav",
 }
 
-# Ścieżka do katalogu z muzyką (konfigurowalna przez zmienną środowiskową)
-MUSIC_DIR = os.environ.get("MUSIC_DIR", "/media")
+# Kilka katalogów biblioteki (np. dysk lokalny, NAS, archiwum) oddzielonych ";",
+# każdy z własnymi opcjami skanu: "/music;/mnt/nas?workers=16&interval=600"
+MUSIC_DIRS = os.environ.get("MUSIC_DIRS", "")
+
+# Ścieżka do katalogu z muzyką (konfigurowalna przez zmienną środowiskową);
+# przy MUSIC_DIRS domyślnie pierwszy z nich – względem niego podaje się ścieżki w API
+MUSIC_DIR = os.environ.get("MUSIC_DIR") or MUSIC_DIRS.split(";")[0].split("?")[0].strip() or "/media"
 
 
 def get_file_id(file_path: str) -> str:
@@ -31,6 +62,7 @@ def get_file_id(file_path: str) -> str:
     return hashlib.sha256(file_path.encode()).hexdigest()[:16]
 
 
+@FILE_SCAN_SECONDS.timed
 def scan_music_directory(directory: str = MUSIC_DIR) -> list[str]:
     """
     Rekursywnie skanuje katalog w poszukiwaniu plików muzycznych.
@@ -41,7 +73,9 @@ def scan_music_directory(directory: str = MUSIC_DIR) -> list[str]:
     if not os.path.exists(directory):
         return music_files
 
-    for root, _, files in os.walk(directory):
+    for root, dirs, files in os.walk(directory):
+        # Pomijaj ukryte katalogi (np. .incoming z pobieraniami w toku) – tak jak Navidrome
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
         for file in files:
             file_lower = file.lower()
             if any(file_lower.endswith(ext) for ext in SUPPORTED_EXTENSIONS):
@@ -50,6 +84,7 @@ def scan_music_directory(directory: str = MUSIC_DIR) -> list[str]:
 
     # Sortuj alfabetycznie dla deterministycznej kolejności
     music_files.sort()
+    FILE_SCAN_FILES.set(len(music_files))
     return music_files
 
 
@@ -74,6 +109,7 @@ def _safe_get_first_tuple(value) -> Optional[tuple]:
     return None
 
 
+@METADATA_EXTRACT_SECONDS.timed
 def extract_metadata(file_path: str) -> dict:
     """
     Wyciąga metadane z pliku audio używając mutagen.
@@ -99,8 +135,9 @@ def extract_metadata(file_path: str) -> dict:
 
         audio = None
 
-        if ext == ".mp3":
-            audio = MP3(file_path)
+        if ext in [".mp3", ".wav"]:
+            # WAV może mieć tagi ID3 w chunku "id3 " (tak zapisuje je write_tags)
+            audio = MP3(file_path) if ext == ".mp3" else WAVE(file_path)
             # Sprawdź czy są tagi ID3
             if audio.tags:
                 id3 = audio.tags
@@ -213,9 +250,6 @@ def extract_metadata(file_path: str) -> dict:
             )
             metadata["genre"] = _safe_get_first(audio.get("WM/Genre"))
 
-        elif ext == ".wav":
-            audio = WAVE(file_path)
-            # WAV ma ograniczone metadane
 
         # Wspólne pola dla wszystkich formatów
         if audio and hasattr(audio, "info") and audio.info is not None:
@@ -244,7 +278,7 @@ def extract_metadata(file_path: str) -> dict:
 
     except Exception:
         # W przypadku błędu parsowania zwracamy podstawowe metadane
-        pass
+        METADATA_EXTRACT_ERRORS.inc(format=metadata["format"] or "unknown")
 
     return metadata
 
@@ -272,6 +306,7 @@ def _parse_track_number(track_value) -> Optional[int]:
         return None
 
 
+@COVER_EXTRACT_SECONDS.timed
 def get_cover_art(file_path: str) -> Optional[bytes]:
     """
     Wyciąga okładkę z pliku audio.
@@ -402,55 +437,314 @@ def get_cover_mime_type(file_path: str) -> str:
     return "image/jpeg"  # domyślnie
 
 
-def list_files(offset: int = 0, limit: int = 50, search: Optional[str] = None) -> dict:
+def embed_cover_art(
+    file_path: str, image_data: bytes, mime: str = "image/jpeg", ext: Optional[str] = None
+) -> bool:
     """
-    Zwraca listę plików z paginacją i opcjonalnym wyszukiwaniem.
+    Osadza okładkę (front cover) w pliku audio, zastępując istniejące.
+    `ext` pozwala wskazać format pliku tymczasowego o innym rozszerzeniu.
+    Zwraca False dla formatów bez obsługi okładek (WMA, WAV).
     """
-    # Pobierz wszystkie ścieżki plików
-    all_files = scan_music_directory()
-
-    # Filtrowanie po wyszukiwaniu
-    if search:
-        search_lower = search.lower()
-        filtered_files = []
-        for file_path in all_files:
-            # Pobierz metadane dla wyszukiwania
-            metadata = extract_metadata(file_path)
-            searchable_text = " ".join(
-                filter(
-                    None,
-                    [
-                        metadata.get("title"),
-                        metadata.get("artist"),
-                        metadata.get("album"),
-                        os.path.basename(file_path),
-                    ],
-                )
-            ).lower()
+    ext = (ext or Path(file_path).suffix).lower()
+
+    if ext == ".mp3":
+        audio = MP3(file_path)
+        if audio.tags is None:
+            audio.add_tags()
+        audio.tags.delall("APIC")
+        audio.tags.add(
+            APIC(encoding=3, mime=mime, type=3, desc="Cover", data=image_data)
+        )
+        audio.save()
+        return True
+
+    picture = Picture()
+    picture.type = 3
+    picture.mime = mime
+    picture.data = image_data
+
+    if ext == ".flac":
+        audio = FLAC(file_path)
+        audio.clear_pictures()
+        audio.add_picture(picture)
+        audio.save()
+        return True
+
+    if ext in [".m4a", ".aac"]:
+        audio = MP4(file_path)
+        image_format = (
+            MP4Cover.FORMAT_PNG if mime == "image/png" else MP4Cover.FORMAT_JPEG
+        )
+        audio["covr"] = [MP4Cover(image_data, imageformat=image_format)]
+        audio.save()
+        return True
+
+    if ext in [".ogg", ".opus"]:
+        audio = OggOpus(file_path) if ext == ".opus" else OggVorbis(file_path)
+        # Vorbis comments przechowują okładkę jako blok FLAC Picture w base64
+        audio["METADATA_BLOCK_PICTURE"] = [
+            base64.b64encode(picture.write()).decode("ascii")
+        ]
+        audio.save()
+        return True
+
+    return False
+
+
+# Tagi obsługiwane przez write_tags
+WRITABLE_TAGS = (
+    "title",
+    "artist",
+    "album",
+    "album_artist",
+    "year",
+    "track_number",
+    "disc_number",
+    "genre",
+)
+
+_ID3_FRAMES = {
+    "title": TIT2,
+    "artist": TPE1,
+    "album": TALB,
+    "album_artist": TPE2,
+    "year": TDRC,
+    "track_number": TRCK,
+    "disc_number": TPOS,
+    "genre": TCON,
+}
+_VORBIS_KEYS = {
+    "title": "title",
+    "artist": "artist",
+    "album": "album",
+    "album_artist": "albumartist",
+    "year": "date",
+    "track_number": "tracknumber",
+    "disc_number": "discnumber",
+    "genre": "genre",
+}
+_MP4_KEYS = {
+    "title": "\xa9nam",
+    "artist": "\xa9ART",
+    "album": "\xa9alb",
+    "album_artist": "aART",
+    "year": "\xa9day",
+    "track_number": "trkn",
+    "disc_number": "disk",
+    "genre": "\xa9gen",
+}
+_ASF_KEYS = {
+    "title": "Title",
+    "artist": "Author",
+    "album": "WM/AlbumTitle",
+    "album_artist": "WM/AlbumArtist",
+    "year": "WM/Year",
+    "track_number": "WM/TrackNumber",
+    "disc_number": "WM/PartOfSet",
+    "genre": "WM/Genre",
+}
+_ASF_ALIASES = {"title": "WM/Title", "artist": "WM/Author"}
+
 
-            if search_lower in searchable_text:
-                filtered_files.append(file_path)
-        all_files = filtered_files
+def _write_id3(id3: ID3, tags: dict) -> None:
+    for name, value in tags.items():
+        frame = _ID3_FRAMES[name]
+        id3.delall(frame.__name__)
+        if value is not None:
+            id3.add(frame(encoding=3, text=[str(value)]))
 
+
+def write_tags(file_path: str, tags: dict, ext: Optional[str] = None) -> None:
+    """
+    Zapisuje tagi (klucze z WRITABLE_TAGS) w pliku audio.
+    Wartość None usuwa tag, pominięte klucze zostają bez zmian.
+    `ext` wskazuje format, gdy plik ma tymczasową nazwę (np. kopia przed podmianą).
+    Rzuca ValueError dla nieznanego tagu lub formatu bez obsługi tagów.
+    """
+    unknown = set(tags) - set(WRITABLE_TAGS)
+    if unknown:
+        raise ValueError(f"Unknown tags: {', '.join(sorted(unknown))}")
+
+    ext = (ext or Path(file_path).suffix).lower()
+
+    if ext in [".mp3", ".wav"]:
+        # WAV przechowuje tagi jako chunk ID3
+        audio = MP3(file_path) if ext == ".mp3" else WAVE(file_path)
+        if audio.tags is None:
+            audio.add_tags()
+        _write_id3(audio.tags, tags)
+        audio.save()
+        return
+
+    if ext in [".flac", ".ogg", ".opus"]:
+        audio = {".flac": FLAC, ".ogg": OggVorbis, ".opus": OggOpus}[ext](file_path)
+        if audio.tags is None:
+            audio.add_tags()
+        for name, value in tags.items():
+            key = _VORBIS_KEYS[name]
+            if value is None:
+                if key in audio.tags:
+                    del audio.tags[key]
+            else:
+                audio[key] = [str(value)]
+        audio.save()
+        return
+
+    if ext in [".m4a", ".aac"]:
+        audio = MP4(file_path)
+        if audio.tags is None:
+            audio.add_tags()
+        for name, value in tags.items():
+            key = _MP4_KEYS[name]
+            if value is None:
+                audio.tags.pop(key, None)
+            elif name in ("track_number", "disc_number"):
+                # trkn/disk to krotki (numer, całkowita_liczba) – zachowujemy liczbę całkowitą
+                total = (audio.get(key) or [(0, 0)])[0][1]
+                audio[key] = [(int(value), total)]
+            else:
+                audio[key] = [str(value)]
+        audio.save()
+        return
+
+    if ext == ".wma":
+        audio = ASF(file_path)
+        if audio.tags is None:
+            audio.add_tags()
+        for name, value in tags.items():
+            # extract_metadata czyta też WM/Title i WM/Author – nie mogą przesłonić nowej wartości
+            for key in (_ASF_KEYS[name], _ASF_ALIASES.get(name)):
+                if key and key in audio.tags:
+                    del audio.tags[key]
+            if value is not None:
+                audio.tags[_ASF_KEYS[name]] = [str(value)]
+        audio.save()
+        return
+
+    raise ValueError(f"Tag writing is not supported for {ext or 'files without extension'}")
+
+
+# Wartości obsługiwane przez write_replaygain
+REPLAYGAIN_TAGS = ("track_gain", "track_peak", "album_gain", "album_peak")
+# Poziom odniesienia R128_*_GAIN w Opus (RFC 7845) względem ReplayGain 2.0 (-18 LUFS)
+_R128_OFFSET = -5.0
+
+
+def write_replaygain(file_path: str, gains: dict, ext: Optional[str] = None) -> None:
+    """
+    Zapisuje tagi ReplayGain 2.0 (klucze z REPLAYGAIN_TAGS): wzmocnienie w dB
+    względem -18 LUFS i szczyt jako ułamek pełnej skali. Wartość None usuwa tag.
+    Opus dostaje zamiast nich R128_TRACK_GAIN / R128_ALBUM_GAIN (Q7.8 względem
+    -23 LUFS) – odtwarzacze Opus nie czytają REPLAYGAIN_*, a szczytów nie ma.
+    """
+    unknown = set(gains) - set(REPLAYGAIN_TAGS)
+    if unknown:
+        raise ValueError(f"Unknown ReplayGain values: {', '.join(sorted(unknown))}")
+
+    ext = (ext or Path(file_path).suffix).lower()
+    values = {
+        f"REPLAYGAIN_{name.upper()}": None
+        if value is None
+        else (f"{value:.2f} dB" if name.endswith("gain") else f"{value:.6f}")
+        for name, value in gains.items()
+    }
+
+    if ext in [".mp3", ".wav"]:
+        audio = MP3(file_path) if ext == ".mp3" else WAVE(file_path)
+        if audio.tags is None:
+            audio.add_tags()
+        for key, value in values.items():
+            # Część programów zapisuje opis ramki TXXX małymi literami
+            audio.tags.delall(f"TXXX:{key}")
+            audio.tags.delall(f"TXXX:{key.lower()}")
+            if value is not None:
+                audio.tags.add(TXXX(encoding=3, desc=key, text=[value]))
+        audio.save()
+        return
+
+    if ext == ".opus":
+        audio = OggOpus(file_path)
+        if audio.tags is None:
+            audio.add_tags()
+        for name, value in gains.items():
+            if name.endswith("peak"):
+                continue
+            key = f"R128_{name.upper()}"
+            if value is None:
+                if key in audio.tags:
+                    del audio.tags[key]
+            else:
+                q78 = round((value + _R128_OFFSET) * 256)
+                audio[key] = [str(max(-32768, min(32767, q78)))]
+        for key in values:
+            if key in audio.tags:
+                del audio.tags[key]
+        audio.save()
+        return
+
+    if ext in [".flac", ".ogg"]:
+        audio = FLAC(file_path) if ext == ".flac" else OggVorbis(file_path)
+        if audio.tags is None:
+            audio.add_tags()
+        for key, value in values.items():
+            if value is None:
+                if key in audio.tags:
+                    del audio.tags[key]
+            else:
+                audio[key] = [value]
+        audio.save()
+        return
+
+    if ext in [".m4a", ".aac"]:
+        audio = MP4(file_path)
+        if audio.tags is None:
+            audio.add_tags()
+        for key, value in values.items():
+            atom = f"----:com.apple.iTunes:{key.lower()}"
+            if value is None:
+                audio.tags.pop(atom, None)
+            else:
+                audio[atom] = [MP4FreeForm(value.encode("utf-8"))]
+        audio.save()
+        return
+
+    if ext == ".wma":
+        audio = ASF(file_path)
+        if audio.tags is None:
+            audio.add_tags()
+        for key, value in values.items():
+            if key.lower() in audio.tags:
+                del audio.tags[key.lower()]
+            if value is not None:
+                audio.tags[key.lower()] = [value]
+        audio.save()
+        return
+
+    raise ValueError(f"Tag writing is not supported for {ext or 'files without extension'}")
+
+
+def list_files(
+    offset: int = 0, limit: int = 50, search: Optional[str] = None, layout: str = "rows"
+) -> dict:
+    """
+    Zwraca listę plików z paginacją i opcjonalnym wyszukiwaniem.
+    Dane pochodzą z katalogu w pamięci – bez skanowania dysku przy każdym żądaniu.
+    layout="columns" zwraca zamiast "items" słownik "columns" (pole -> lista wartości).
+    """
+    from app.services import catalog_service
+
+    all_files = catalog_service.query(search)
     total = len(all_files)
 
-    # Paginacja
-    paginated_files = all_files[offset : offset + limit]
-
-    # Budowanie wyników
-    items = []
-    for file_path in paginated_files:
-        metadata = extract_metadata(file_path)
-        file_item = {
-            "id": get_file_id(file_path),
-            "path": file_path,
-            "filename": os.path.basename(file_path),
-            **metadata,
-        }
-        items.append(file_item)
+    # Paginacja – słowniki powstają tylko dla zwracanej strony
+    page = all_files[offset : offset + limit]
+    if layout == "columns":
+        data = {"columns": page.to_columns()}
+    else:
+        data = {"items": page.to_dicts()}
 
     return {
-        "items": items,
+        **data,
         "total": total,
         "offset": offset,
         "limit": limit,
@@ -464,16 +758,7 @@ def get_file_by_id(file_id: str) -> Optional[dict]:
     Znajduje plik po ID i zwraca jego metadane.
     Zwraca None jeśli plik nie został znaleziony.
     """
-    all_files = scan_music_directory()
-
-    for file_path in all_files:
-        if get_file_id(file_path) == file_id:
-            metadata = extract_metadata(file_path)
-            return {
-                "id": file_id,
-                "path": file_path,
-                "filename": os.path.basename(file_path),
-                **metadata,
-            }
+    from app.services import catalog_service
 
-    return None
+    row = catalog_service.get(file_id)
+    return row.to_dict() if row else None
@@ -0,0 +1,282 @@
+"""
+Library integrity verification.
+
+Every file is fully decoded with ffmpeg (`-f null`), which catches truncated
+downloads and corrupt frames that mutagen's header parsing never sees. Decodes
+run in a CPU-sized process pool. Results are kept per file together with the
+(mtime, size) that was checked and saved to INTEGRITY_STATE_FILE, so after the
+first full pass only new or changed files are decoded again – also across
+restarts. The catalog carries the ok/broken state of every file.
+"""
+
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Optional
+
+from app import DATA_DIR, shared_state
+from app.jobs import Job, latest_job, start_job
+from app.services import catalog_service
+from app.services.executors import cpu_count, submit_process
+from app.services.postprocess_service import FFMPEG_BIN
+
+logger = logging.getLogger(__name__)
+
+INTEGRITY_WORKERS = int(os.environ.get("INTEGRITY_WORKERS", "0")) or cpu_count()
+# Limit czasu dekodowania jednego pliku (s)
+INTEGRITY_TIMEOUT = float(os.environ.get("INTEGRITY_TIMEOUT", "600"))
+# O ile sekund zdekodowany dźwięk może być krótszy niż długość z nagłówków
+INTEGRITY_DURATION_TOLERANCE = float(os.environ.get("INTEGRITY_DURATION_TOLERANCE", "1"))
+# Wyniki muszą przetrwać odtworzenie kontenera – inaczej całą bibliotekę trzeba dekodować od nowa
+INTEGRITY_STATE_FILE = os.environ.get(
+    "INTEGRITY_STATE_FILE", os.path.join(DATA_DIR, "integrity.json")
+)
+# Automatyczne sprawdzanie zmian co tyle sekund (0 = tylko ręcznie)
+INTEGRITY_CHECK_INTERVAL = float(os.environ.get("INTEGRITY_CHECK_INTERVAL", "0"))
+
+JOB_KIND = "integrity"
+
+# Zapis stanu i aktualizacja katalogu co tyle sprawdzonych plików
+_FLUSH_EVERY = 200
+# Ile ostatnich linii stderr ffmpeg zapamiętać jako opis błędu
+_ERROR_LINES = 5
+
+# ID pliku -> [mtime_ns, rozmiar, ok, błąd]
+_state: Optional[dict[str, list]] = None
+_state_lock = threading.Lock()
+
+
+def verify_file(file_path: str, expected_duration: Optional[float] = None) -> tuple[bool, Optional[str]]:
+    """
+    Decode the whole audio stream and discard the output.
+    ffmpeg exits 0 on many recoverable decode errors, so any error output counts
+    as broken. A file that decodes noticeably shorter than the duration declared
+    in its headers (e.g. an MP3 cut off mid-download) is reported as truncated.
+    """
+    cmd = [
+        FFMPEG_BIN,
+        "-hide_banner",
+        "-nostdin",
+        "-v",
+        "error",
+        "-nostats",
+        "-progress",
+        "pipe:1",
+        "-threads",
+        "1",
+        "-i",
+        file_path,
+        "-map",
+        "0:a:0",
+        "-f",
+        "null",
+        "-",
+    ]
+    try:
+        completed = subprocess.run(cmd, capture_output=True, timeout=INTEGRITY_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        return False, f"Decoding timed out after {INTEGRITY_TIMEOUT:.0f}s"
+    stderr = completed.stderr.decode("utf-8", errors="replace").strip()
+    if completed.returncode != 0 or stderr:
+        lines = stderr.splitlines()[-_ERROR_LINES:] or [f"ffmpeg exited with {completed.returncode}"]
+        return False, "\n".join(lines)
+
+    if expected_duration:
+        decoded = None
+        for line in completed.stdout.decode("ascii", errors="replace").splitlines():
+            if line.startswith("out_time_us="):
+                try:
+                    decoded = int(line.split("=", 1)[1]) / 1_000_000
+                except ValueError:
+                    pass
+        tolerance = max(INTEGRITY_DURATION_TOLERANCE, expected_duration * 0.02)
+        if decoded is not None and decoded < expected_duration - tolerance:
+            return False, f"Truncated: decoded {decoded:.1f}s of {expected_duration:.1f}s"
+    return True, None
+
+
+def _load_state() -> dict[str, list]:
+    global _state
+    with _state_lock:
+        if _state is None:
+            try:
+                with open(INTEGRITY_STATE_FILE, encoding="utf-8") as f:
+                    _state = json.load(f)
+            except (OSError, ValueError):
+                _state = {}
+        return _state
+
+
+def _save_state() -> None:
+    with _state_lock:
+        if _state is None:
+            return
+        payload = json.dumps(_state, separators=(",", ":"))
+    os.makedirs(os.path.dirname(INTEGRITY_STATE_FILE) or ".", exist_ok=True)
+    tmp_path = INTEGRITY_STATE_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(payload)
+    os.replace(tmp_path, INTEGRITY_STATE_FILE)
+
+
+def restore() -> None:
+    """Copy saved results into a freshly loaded catalog (rows changed since are skipped)."""
+    state = _load_state()
+    with _state_lock:
+        results = [(file_id, entry[0], entry[1], entry[2]) for file_id, entry in state.items()]
+    catalog_service.set_integrity(results, local=True)
+
+
+catalog_service.on_load(restore)
+
+
+def check_library(job: Job, full: bool = False) -> dict:
+    """
+    Job body: decode every file whose (mtime, size) differs from its last check
+    (every file with `full`) and record the results.
+    """
+    global _state
+    if shared_state.enabled():
+        # Poprzednie sprawdzenie mógł zrobić inny worker – stan czytany od nowa z pliku
+        with _state_lock:
+            _state = None
+    state = _load_state()
+    rows = catalog_service.query()
+    columns = rows.to_columns(("id", "path", "file_size", "mtime_ns", "duration"))
+    ids = columns["id"]
+    todo = []
+    with _state_lock:
+        for file_id, path, size, mtime_ns, duration in zip(
+            ids, columns["path"], columns["file_size"], columns["mtime_ns"], columns["duration"]
+        ):
+            entry = state.get(file_id)
+            if full or entry is None or entry[:2] != [mtime_ns, size]:
+                todo.append((file_id, path, size, mtime_ns, duration))
+        # Pliki usunięte z biblioteki nie zostają w stanie na zawsze
+        alive = set(ids)
+        for file_id in [k for k in state if k not in alive]:
+            del state[file_id]
+
+    job.update(phase="decoding", done=0, total=len(todo), skipped=len(ids) - len(todo), broken=0, errors=0)
+    pending: dict = {}
+    results: list[tuple] = []
+    broken = 0
+    # Pliki, których nie udało się sprawdzić (np. brak ffmpeg, padnięty worker) – bez wpisu w stanie
+    errors = 0
+    queue = iter(todo)
+
+    def flush() -> None:
+        catalog_service.set_integrity(results)
+        results.clear()
+        _save_state()
+
+    try:
+        # Okno zadań zamiast 200k futures naraz
+        window = INTEGRITY_WORKERS * 4
+        while True:
+            for file_id, path, size, mtime_ns, duration in queue:
+                future = submit_process("integrity", INTEGRITY_WORKERS, verify_file, path, duration)
+                pending[future] = (file_id, size, mtime_ns)
+                if len(pending) >= window:
+                    break
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_id, size, mtime_ns = pending.pop(future)
+                try:
+                    ok, error = future.result()
+                except FileNotFoundError as e:
+                    # Bez ffmpeg żaden plik nie zostanie sprawdzony – zadanie kończy się błędem
+                    raise RuntimeError(f"Cannot run {FFMPEG_BIN}: {e}") from e
+                except Exception as e:
+                    # Awaria sprawdzania, nie wynik dekodowania – plik zostanie sprawdzony ponownie
+                    errors += 1
+                    logger.warning(f"Integrity check of {file_id} could not run: {e}")
+                    job.update(done=job.progress["done"] + 1, errors=errors, last_error=str(e))
+                    continue
+                broken += not ok
+                with _state_lock:
+                    state[file_id] = [mtime_ns, size, ok, error]
+                results.append((file_id, mtime_ns, size, ok))
+                job.update(done=job.progress["done"] + 1, broken=broken)
+            if len(results) >= _FLUSH_EVERY:
+                flush()
+            job.check_cancelled()
+    finally:
+        for future in pending:
+            future.cancel()
+        flush()
+
+    job.update(phase="done")
+    return {
+        "files": len(ids),
+        "checked": len(todo) - errors,
+        "skipped": len(ids) - len(todo),
+        "broken": broken,
+        "errors": errors,
+    }
+
+
+def start_check(full: bool = False) -> Job:
+    """Start an integrity check, or return the one already running."""
+    return start_job(
+        JOB_KIND, lambda job: check_library(job, full), {"full": full}, exclusive=True, expose_result=True
+    )
+
+
+def summary() -> dict:
+    """Counts of ok / broken / unchecked files in the current catalog and the latest job."""
+    states = catalog_service.query().to_columns(("integrity",))["integrity"]
+    counts = {"ok": 0, "broken": 0, None: 0}
+    for value in states:
+        counts[value] += 1
+    job = latest_job(JOB_KIND)
+    completed = latest_job(JOB_KIND, status="completed")
+    return {
+        "files": len(states),
+        "ok": counts["ok"],
+        "broken": counts["broken"],
+        "unchecked": counts[None],
+        "last_check_at": completed.finished_at if completed else None,
+        "job": job,
+    }
+
+
+def broken_files(offset: int = 0, limit: int = 50) -> tuple[int, list[dict]]:
+    """Broken files (path order) with the decoder error from their last check."""
+    rows = catalog_service.query()
+    states = rows.to_columns(("integrity",))["integrity"]
+    broken = [row for row, value in zip(rows, states) if value == "broken"]
+    state = _load_state()
+    page = []
+    with _state_lock:
+        for row in broken[offset : offset + limit]:
+            entry = state.get(row.id)
+            page.append({**row.to_dict(), "error": entry[3] if entry else None})
+    return len(broken), page
+
+
+def start_scheduler() -> Optional[threading.Thread]:
+    """Re-check changed files every INTEGRITY_CHECK_INTERVAL seconds (if enabled)."""
+    if INTEGRITY_CHECK_INTERVAL <= 0:
+        return None
+
+    def loop():
+        while True:
+            time.sleep(INTEGRITY_CHECK_INTERVAL)
+            # Przy kilku workerach sprawdza tylko lider
+            if not shared_state.is_leader():
+                continue
+            try:
+                start_check()
+            except Exception as e:
+                logger.warning(f"Scheduled integrity check failed to start: {e}")
+
+    thread = threading.Thread(target=loop, name="integrity-scheduler", daemon=True)
+    thread.start()
+    return thread
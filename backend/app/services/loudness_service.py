@@ -0,0 +1,561 @@
+"""
+Loudness analysis and ReplayGain tagging.
+
+ffmpeg decodes every file to 48 kHz float PCM on a pipe (mono stays mono,
+anything else is downmixed to stereo). The stream is K-weighted (ITU-R
+BS.1770) with NumPy in large chunks: both filter stages are applied together
+as one FIR – their impulse response, cut where it has decayed below float
+precision – by FFT overlap-add, many blocks per transform. The
+energy of 400 ms gating blocks gives the EBU R128 integrated loudness of a
+track; the blocks of all tracks of an album, gated together, give the album
+loudness. Gains are ReplayGain 2.0 (reference LOUDNESS_REFERENCE, -18 LUFS).
+
+Decoding runs in a CPU-sized process pool, tag writes in a thread pool. Per
+file, the loudness, peak and the (mtime, size) after tagging are kept in
+LOUDNESS_STATE_FILE and the gating blocks in LOUDNESS_CACHE_DIR, so later runs
+decode only new or changed files. An album whose tracks or membership changed
+is gated again from cached blocks; its other tracks are re-tagged only when
+the album gain actually moved.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import FIRST_COMPLETED, wait
+from functools import lru_cache
+from typing import Optional
+
+from app import DATA_DIR, shared_state
+from app.jobs import Job, latest_job, start_job
+from app.lazy import lazy_module
+from app.services import catalog_service, navidrome_service
+from app.services.executors import cpu_count, get_thread_pool, submit_process
+from app.services.file_service import write_replaygain
+from app.services.postprocess_service import FFMPEG_BIN
+
+LOUDNESS_WORKERS = int(os.environ.get("LOUDNESS_WORKERS", "0")) or cpu_count()
+LOUDNESS_WRITE_WORKERS = int(os.environ.get("LOUDNESS_WRITE_WORKERS", "4"))
+# Limit czasu dekodowania jednego pliku (s)
+LOUDNESS_TIMEOUT = float(os.environ.get("LOUDNESS_TIMEOUT", "900"))
+# Poziom odniesienia ReplayGain 2.0 (LUFS)
+LOUDNESS_REFERENCE = float(os.environ.get("LOUDNESS_REFERENCE", "-18"))
+# Wyniki muszą przetrwać odtworzenie kontenera – inaczej całą bibliotekę trzeba dekodować od nowa
+LOUDNESS_STATE_FILE = os.environ.get(
+    "LOUDNESS_STATE_FILE", os.path.join(DATA_DIR, "loudness.json")
+)
+# Bloki bramkowania per plik – z nich liczone są albumy bez ponownego dekodowania
+LOUDNESS_CACHE_DIR = os.environ.get(
+    "LOUDNESS_CACHE_DIR", os.path.join(DATA_DIR, "loudness")
+)
+
+JOB_KIND = "loudness"
+
+np = lazy_module("numpy", optional=True)
+mutagen = lazy_module("mutagen")
+
+_RATE = 48000
+# Podblok 100 ms; blok bramkowania to 4 podbloki (400 ms, nakładanie 75%)
+_SUBBLOCK = _RATE // 10
+# Długość odpowiedzi impulsowej filtru K i rozmiar FFT (overlap-add)
+_FIR_TAPS = 4096
+_FFT_SIZE = 65536
+_STEP = _FFT_SIZE - _FIR_TAPS + 1
+# Bloków FFT na jedno czytanie z ffmpeg (ok. 10 s dźwięku) i bajtów na kanał
+_BATCH = 8
+_READ_SIZE = _STEP * _BATCH * 4
+_ABSOLUTE_GATE = -70.0
+_RELATIVE_GATE = -10.0
+# Filtry K dla 48 kHz (BS.1770-4): półka wysokich tonów i górnoprzepustowy, (b0, b1, b2), (a1, a2)
+_K_STAGES = (
+    ((1.53512485958697, -2.69169618940638, 1.19839281085285), (-1.69065929318241, 0.73248077421585)),
+    ((1.0, -2.0, 1.0), (-1.99004745483398, 0.99007225036621)),
+)
+
+# Zapis stanu i aktualizacja katalogu co tyle otagowanych plików
+_FLUSH_EVERY = 200
+_ERROR_LINES = 5
+_TMP_SUFFIX = ".loudness-tmp"
+
+# {"files": {ID: [mtime_ns, rozmiar, LUFS, szczyt, błąd]}, "albums": {klucz: [skład, LUFS, szczyt]}}
+_state: Optional[dict] = None
+_state_lock = threading.Lock()
+
+
+class DecodeError(Exception):
+    """ffmpeg rejected the file itself – unlike a timeout or a dead worker, worth remembering."""
+
+
+@lru_cache(maxsize=1)
+def _k_weighting():
+    """Spectrum of the K-weighting impulse response (once per process)."""
+    response = [1.0] + [0.0] * (_FIR_TAPS - 1)
+    for (b0, b1, b2), (a1, a2) in _K_STAGES:
+        x1 = x2 = y1 = y2 = 0.0
+        for n, x in enumerate(response):
+            y = b0 * x + b1 * x1 + b2 * x2 - a1 * y1 - a2 * y2
+            response[n] = y
+            x2, x1, y2, y1 = x1, x, y1, y
+    return np.fft.rfft(np.array(response), _FFT_SIZE).astype(np.complex64)
+
+
+def _weight(pcm, tail):
+    """
+    K-weight (channels, n) samples by overlap-add. `tail` is the filter ringing
+    carried over from the previous chunk; returns (weighted, new tail).
+    """
+    channels, n = pcm.shape
+    blocks = -(-n // _STEP)
+    frames = np.zeros((channels, blocks * _STEP), dtype=np.float32)
+    frames[:, :n] = pcm
+    spectrum = np.fft.rfft(frames.reshape(channels, blocks, _STEP), _FFT_SIZE, axis=-1)
+    out = np.fft.irfft(spectrum * _k_weighting(), _FFT_SIZE, axis=-1)
+    weighted = out[..., :_STEP].copy()
+    ringing = out[..., _STEP:]
+    weighted[:, 1:, : _FIR_TAPS - 1] += ringing[:, :-1]
+    weighted[:, 0, : _FIR_TAPS - 1] += tail
+    return weighted.reshape(channels, -1)[:, :n], ringing[:, -1].copy()
+
+
+def _channels(file_path: str) -> int:
+    """1 for mono files, 2 otherwise – duplicating mono into stereo would add 3 LU."""
+    try:
+        audio = mutagen.File(file_path)
+    except Exception:
+        return 2
+    return 1 if audio is not None and getattr(audio.info, "channels", 2) == 1 else 2
+
+
+def analyse_file(file_path: str) -> dict:
+    """
+    Decode `file_path` and return the loudness (LUFS) of its 400 ms gating blocks
+    above the absolute gate (float16), the integrated loudness (None for silence)
+    and the sample peak. Runs in the loudness process pool. Raises DecodeError
+    when ffmpeg fails on the file; other exceptions (timeout, missing ffmpeg)
+    say nothing about the file.
+    """
+    if np is None:
+        raise RuntimeError("Loudness analysis is not installed (pip install numpy)")
+    cmd = [FFMPEG_BIN, "-hide_banner", "-nostdin", "-loglevel", "error", "-threads", "1", "-i", file_path]
+    channels = _channels(file_path)
+    cmd += ["-map", "0:a:0", "-ac", str(channels), "-ar", str(_RATE), "-f", "f32le", "pipe:1"]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    # stderr czytany w wątku – pełny bufor zatrzymałby ffmpeg
+    stderr: list[bytes] = []
+    reader = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+    reader.start()
+    timed_out = threading.Event()
+
+    def kill() -> None:
+        timed_out.set()
+        process.kill()
+
+    timer = threading.Timer(LOUDNESS_TIMEOUT, kill)
+    timer.start()
+
+    frame_size = channels * 4
+    tail = np.zeros((channels, _FIR_TAPS - 1), dtype=np.float32)
+    remainder = np.zeros(0)
+    subblocks: list = []
+    peak = 0.0
+    try:
+        while chunk := process.stdout.read(_READ_SIZE * channels):
+            whole = len(chunk) - len(chunk) % frame_size
+            pcm = np.frombuffer(chunk[:whole], dtype="<f4").reshape(-1, channels).T
+            if not pcm.size:
+                continue
+            peak = max(peak, float(np.abs(pcm).max()))
+            weighted, tail = _weight(pcm, tail)
+            power = np.concatenate([remainder, np.square(weighted, dtype=np.float64).sum(axis=0)])
+            whole = len(power) - len(power) % _SUBBLOCK
+            subblocks.append(power[:whole].reshape(-1, _SUBBLOCK).sum(axis=1))
+            remainder = power[whole:]
+    finally:
+        timer.cancel()
+        process.stdout.close()
+        process.wait()
+        reader.join()
+        process.stderr.close()
+    if timed_out.is_set():
+        raise TimeoutError(f"Decoding timed out after {LOUDNESS_TIMEOUT:g}s")
+    if process.returncode < 0:
+        raise RuntimeError(f"ffmpeg was killed by signal {-process.returncode}")
+    if process.returncode != 0:
+        message = b"".join(stderr).decode("utf-8", errors="replace").strip()
+        lines = message.splitlines()[-_ERROR_LINES:] or [f"ffmpeg exited with {process.returncode}"]
+        raise DecodeError("\n".join(lines))
+
+    energy = np.concatenate(subblocks) if subblocks else np.zeros(0)
+    if len(energy) >= 4:
+        mean_square = np.convolve(energy, np.ones(4), mode="valid") / (4 * _SUBBLOCK)
+    else:
+        mean_square = np.zeros(0)
+    with np.errstate(divide="ignore"):
+        loudness = -0.691 + 10 * np.log10(mean_square)
+    blocks = loudness[loudness > _ABSOLUTE_GATE].astype(np.float16)
+    return {"blocks": blocks, "loudness": integrated_loudness(blocks), "peak": peak}
+
+
+def integrated_loudness(blocks) -> Optional[float]:
+    """EBU R128 gated loudness of gating block values (LUFS); None for silence."""
+    blocks = np.asarray(blocks, dtype=np.float64)
+    blocks = blocks[blocks > _ABSOLUTE_GATE]
+    if not blocks.size:
+        return None
+    energy = np.power(10, (blocks + 0.691) / 10)
+    threshold = 10 * np.log10(energy.mean()) - 0.691 + _RELATIVE_GATE
+    return float(10 * np.log10(energy[blocks > threshold].mean()) - 0.691)
+
+
+def _blocks_path(file_id: str) -> str:
+    return os.path.join(LOUDNESS_CACHE_DIR, file_id[:2], f"{file_id}.npy")
+
+
+def _store_blocks(file_id: str, blocks) -> None:
+    path = _blocks_path(file_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, blocks)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _load_blocks(file_id: str):
+    try:
+        return np.load(_blocks_path(file_id))
+    except (OSError, ValueError):
+        return None
+
+
+def _write_gains(file_path: str, gains: dict) -> tuple[int, int]:
+    """Write ReplayGain tags into a copy and swap it in; returns the new (mtime_ns, size)."""
+    directory, name = os.path.split(file_path)
+    tmp_path = os.path.join(directory, f".{name}{_TMP_SUFFIX}")
+    try:
+        shutil.copyfile(file_path, tmp_path)
+        shutil.copymode(file_path, tmp_path)
+        write_replaygain(tmp_path, gains, ext=os.path.splitext(file_path)[1])
+        os.replace(tmp_path, file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    st = os.stat(file_path)
+    return st.st_mtime_ns, st.st_size
+
+
+def _album_signature(members: list[str]) -> str:
+    return hashlib.blake2b("\n".join(sorted(members)).encode(), digest_size=8).hexdigest()
+
+
+def _load_state() -> dict:
+    global _state
+    with _state_lock:
+        if _state is None:
+            try:
+                with open(LOUDNESS_STATE_FILE, encoding="utf-8") as f:
+                    _state = json.load(f)
+            except (OSError, ValueError):
+                _state = {}
+            _state.setdefault("files", {})
+            _state.setdefault("albums", {})
+        return _state
+
+
+def _save_state() -> None:
+    with _state_lock:
+        if _state is None:
+            return
+        payload = json.dumps(_state, separators=(",", ":"))
+    os.makedirs(os.path.dirname(LOUDNESS_STATE_FILE) or ".", exist_ok=True)
+    tmp_path = LOUDNESS_STATE_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(payload)
+    os.replace(tmp_path, LOUDNESS_STATE_FILE)
+
+
+def _gains(loudness: float, peak: float) -> tuple[float, float]:
+    return round(LOUDNESS_REFERENCE - loudness, 2), round(peak, 6)
+
+
+def analyse_library(job: Job, full: bool = False) -> dict:
+    """
+    Job body: decode every file whose (mtime, size) differs from its last
+    analysis (every file with `full`), gate the affected albums and write
+    track and album ReplayGain tags.
+    """
+    global _state
+    if shared_state.enabled():
+        # Poprzednią analizę mógł zrobić inny worker – stan czytany od nowa z pliku
+        with _state_lock:
+            _state = None
+    state = _load_state()
+    files, album_state = state["files"], state["albums"]
+    rows = catalog_service.query()
+    columns = rows.to_columns(("id", "path", "file_size", "mtime_ns", "album"))
+
+    tracks: dict[str, tuple[str, int, int]] = {}
+    albums: dict[str, list[str]] = {}
+    album_of: dict[str, str] = {}
+    for file_id, path, size, mtime_ns, album in zip(
+        columns["id"], columns["path"], columns["file_size"], columns["mtime_ns"], columns["album"]
+    ):
+        tracks[file_id] = (path, size, mtime_ns)
+        if album:
+            # Album = katalog + tag albumu, jak przy numerowaniu w tag_service
+            key = f"{os.path.dirname(path)}\n{album}"
+            albums.setdefault(key, []).append(file_id)
+            album_of[file_id] = key
+
+    todo = []
+    with _state_lock:
+        for file_id, (path, size, mtime_ns) in tracks.items():
+            entry = files.get(file_id)
+            if (
+                full
+                or entry is None
+                or entry[:2] != [mtime_ns, size]
+                or (entry[2] is not None and not os.path.exists(_blocks_path(file_id)))
+            ):
+                todo.append(file_id)
+        # Pliki i albumy usunięte z biblioteki nie zostają w stanie na zawsze
+        for file_id in [k for k in files if k not in tracks]:
+            del files[file_id]
+            if os.path.exists(_blocks_path(file_id)):
+                os.remove(_blocks_path(file_id))
+        for key in [k for k in album_state if k not in albums]:
+            del album_state[key]
+
+    pending_set = set(todo)
+    remaining = {
+        key: sum(member in pending_set for member in members)
+        for key, members in albums.items()
+        if any(member in pending_set for member in members)
+        or album_state.get(key, [None])[0] != _album_signature(members)
+    }
+    # Kolejność albumami – album jest tagowany, gdy tylko wszystkie jego pliki są przeanalizowane
+    todo.sort(key=lambda i: (album_of.get(i, ""), tracks[i][0]))
+
+    job.update(
+        phase="analysing",
+        done=0,
+        total=len(todo),
+        skipped=len(tracks) - len(todo),
+        written=0,
+        failed=0,
+        errors=0,
+        albums=len(remaining),
+    )
+    writer = get_thread_pool("loudness-tags", LOUDNESS_WRITE_WORKERS)
+    decoding: dict = {}
+    writing: dict = {}
+    # Przeanalizowane pliki czekające na resztę albumu: ID -> wynik analyse_file
+    analysed: dict[str, dict] = {}
+    touched: list[str] = []
+    written = failed = errors = 0
+    # Albumy z plikiem, którego nie udało się przeanalizować – bez zapisu częściowego wzmocnienia
+    incomplete: set[str] = set()
+    queue = iter(todo)
+
+    def record(file_id: str, result: Optional[dict], error: Optional[str] = None) -> None:
+        """Remember a file that needs no tags (silent or undecodable)."""
+        path, size, mtime_ns = tracks[file_id]
+        with _state_lock:
+            files[file_id] = [mtime_ns, size, None, result["peak"] if result else None, error]
+
+    def submit_write(file_id: str, loudness: float, peak: float, album: Optional[tuple]) -> None:
+        track_gain, track_peak = _gains(loudness, peak)
+        gains = {"track_gain": track_gain, "track_peak": track_peak, "album_gain": None, "album_peak": None}
+        if album is not None:
+            gains["album_gain"], gains["album_peak"] = album
+        future = writer.submit(_write_gains, tracks[file_id][0], gains)
+        writing[future] = (file_id, loudness, peak)
+
+    def finish_album(key: str) -> None:
+        members = albums[key]
+        if key in incomplete:
+            # Stan albumu zostaje stary – następne uruchomienie przeliczy go z brakującym plikiem
+            for member in members:
+                result = analysed.pop(member, None)
+                if result is not None and result["loudness"] is None:
+                    record(member, result)
+            return
+        blocks, peaks, loudness = [], [], {}
+        for member in members:
+            result = analysed.get(member)
+            if result is not None:
+                member_blocks, loudness[member], peak = result["blocks"], result["loudness"], result["peak"]
+            else:
+                entry = files.get(member)
+                if entry is None or entry[2] is None:
+                    continue
+                member_blocks, loudness[member], peak = _load_blocks(member), entry[2], entry[3]
+                if member_blocks is None:
+                    continue
+            if loudness[member] is not None:
+                blocks.append(member_blocks)
+                peaks.append(peak)
+        album_loudness = integrated_loudness(np.concatenate(blocks)) if blocks else None
+        values = list(_gains(album_loudness, max(peaks))) if album_loudness is not None else None
+        previous = album_state.get(key)
+        moved = previous is None or previous[1:] != values
+        with _state_lock:
+            album_state[key] = [_album_signature(members), *(values or [None, None])]
+        for member in members:
+            result = analysed.pop(member, None)
+            if result is not None and result["loudness"] is None:
+                record(member, result)
+            elif loudness.get(member) is not None and (result is not None or moved):
+                peak = result["peak"] if result is not None else files[member][3]
+                submit_write(member, loudness[member], peak, tuple(values) if values else None)
+
+    def flush() -> None:
+        catalog_service.upsert_many(touched)
+        touched.clear()
+        _save_state()
+
+    try:
+        # Albumy, w których zmienił się tylko skład – bez dekodowania
+        for key in [k for k, count in remaining.items() if count == 0]:
+            finish_album(key)
+        window = LOUDNESS_WORKERS * 4
+        while True:
+            for file_id in queue:
+                future = submit_process("loudness", LOUDNESS_WORKERS, analyse_file, tracks[file_id][0])
+                decoding[future] = file_id
+                if len(decoding) >= window:
+                    break
+            if not decoding and not writing:
+                break
+            done, _ = wait([*decoding, *writing], return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in writing:
+                    file_id, loudness, peak = writing.pop(future)
+                    try:
+                        mtime_ns, size = future.result()
+                    except Exception as e:
+                        # Bez wpisu w stanie – następna analiza spróbuje ponownie
+                        failed += 1
+                        with _state_lock:
+                            files.pop(file_id, None)
+                        job.update(failed=failed, last_error=f"{tracks[file_id][0]}: {e}")
+                        continue
+                    with _state_lock:
+                        files[file_id] = [mtime_ns, size, loudness, peak, None]
+                    touched.append(tracks[file_id][0])
+                    written += 1
+                    job.update(written=written)
+                    continue
+
+                file_id = decoding.pop(future)
+                try:
+                    result = future.result()
+                except DecodeError as e:
+                    failed += 1
+                    result = None
+                    record(file_id, None, str(e))
+                    job.update(failed=failed)
+                except FileNotFoundError as e:
+                    # Bez ffmpeg żaden plik nie zostanie zmierzony – zadanie kończy się błędem
+                    raise RuntimeError(f"Cannot run {FFMPEG_BIN}: {e}") from e
+                except Exception as e:
+                    # Awaria pomiaru, nie wynik – bez wpisu w stanie, następna analiza spróbuje ponownie
+                    errors += 1
+                    result = None
+                    with _state_lock:
+                        files.pop(file_id, None)
+                    if file_id in album_of:
+                        incomplete.add(album_of[file_id])
+                    job.update(errors=errors, last_error=f"{tracks[file_id][0]}: {e}")
+                if result is not None:
+                    _store_blocks(file_id, result["blocks"])
+                key = album_of.get(file_id)
+                if key is not None:
+                    if result is not None:
+                        analysed[file_id] = result
+                    remaining[key] -= 1
+                    if remaining[key] == 0:
+                        finish_album(key)
+                elif result is not None and result["loudness"] is not None:
+                    submit_write(file_id, result["loudness"], result["peak"], None)
+                elif result is not None:
+                    record(file_id, result)
+                job.update(done=job.progress["done"] + 1)
+            if len(touched) >= _FLUSH_EVERY:
+                flush()
+            job.check_cancelled()
+    finally:
+        for future in decoding:
+            future.cancel()
+        # Rozpoczęte zapisy są kończone, żeby stan zgadzał się z plikami
+        for future, (file_id, loudness, peak) in writing.items():
+            try:
+                mtime_ns, size = future.result()
+            except Exception:
+                continue
+            with _state_lock:
+                files[file_id] = [mtime_ns, size, loudness, peak, None]
+            touched.append(tracks[file_id][0])
+            written += 1
+        flush()
+        if written:
+            navidrome_service.notify_library_changed()
+
+    job.update(phase="done")
+    return {
+        "files": len(tracks),
+        "analysed": len(todo),
+        "skipped": len(tracks) - len(todo),
+        "written": written,
+        "failed": failed,
+        "errors": errors,
+        "albums": len(remaining),
+    }
+
+
+def start_analysis(full: bool = False) -> Job:
+    """Start a loudness analysis, or return the one already running."""
+    if np is None:
+        raise RuntimeError("Loudness analysis is not installed (pip install numpy)")
+    return start_job(
+        JOB_KIND, lambda job: analyse_library(job, full), {"full": full}, exclusive=True, expose_result=True
+    )
+
+
+def summary() -> dict:
+    """Counts of analysed / pending files in the current catalog and the latest job."""
+    state = _load_state()
+    columns = catalog_service.query().to_columns(("id", "file_size", "mtime_ns"))
+    analysed = silent = failed = 0
+    with _state_lock:
+        files = state["files"]
+        for file_id, size, mtime_ns in zip(columns["id"], columns["file_size"], columns["mtime_ns"]):
+            entry = files.get(file_id)
+            if entry is None or entry[:2] != [mtime_ns, size]:
+                continue
+            if entry[4]:
+                failed += 1
+            elif entry[2] is None:
+                silent += 1
+            else:
+                analysed += 1
+        albums = len(state["albums"])
+    job = latest_job(JOB_KIND)
+    completed = latest_job(JOB_KIND, status="completed")
+    return {
+        "files": len(columns["id"]),
+        "analysed": analysed,
+        "silent": silent,
+        "failed": failed,
+        "pending": len(columns["id"]) - analysed - silent - failed,
+        "albums": albums,
+        "last_run_at": completed.finished_at if completed else None,
+        "job": job,
+    }
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+import urllib.parse
+import urllib.request
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Adres i dane logowania Navidrome (Subsonic API); bez NAVIDROME_URL notyfikacje są wyłączone
+NAVIDROME_URL = os.environ.get("NAVIDROME_URL", "")
+NAVIDROME_USER = os.environ.get("NAVIDROME_USER", "")
+NAVIDROME_PASSWORD = os.environ.get("NAVIDROME_PASSWORD", "")
+# Skan startuje po tylu sekundach ciszy...
+NAVIDROME_SCAN_QUIET_PERIOD = float(os.environ.get("NAVIDROME_SCAN_QUIET_PERIOD", "30"))
+# ...ale nie później niż tyle sekund od pierwszej zmiany w serii
+NAVIDROME_SCAN_MAX_DELAY = float(os.environ.get("NAVIDROME_SCAN_MAX_DELAY", "300"))
+NAVIDROME_FULL_SCAN = os.environ.get("NAVIDROME_FULL_SCAN", "0") == "1"
+# Po nieudanym startScan kolejna próba po tylu sekundach, podwajanych przy każdej porażce...
+NAVIDROME_SCAN_RETRY_DELAY = float(os.environ.get("NAVIDROME_SCAN_RETRY_DELAY", "30"))
+# ...aż do tego limitu
+NAVIDROME_SCAN_RETRY_MAX_DELAY = float(os.environ.get("NAVIDROME_SCAN_RETRY_MAX_DELAY", "3600"))
+
+SUBSONIC_API_VERSION = "1.16.1"
+SUBSONIC_CLIENT = "navidrome-toolbox"
+
+
+class ScanNotifier:
+    """
+    Coalesces library-change events into a single Subsonic `startScan` call.
+
+    A scan fires once no event arrived for `quiet_period` seconds, or at the
+    latest `max_delay` seconds after the first event of the batch, so a long
+    import still gets scanned periodically. A failed call is retried after
+    `retry_delay` seconds, doubled after every further failure up to
+    `retry_max_delay`; new events do not cut the backoff short.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        user: str,
+        password: str,
+        quiet_period: float = NAVIDROME_SCAN_QUIET_PERIOD,
+        max_delay: float = NAVIDROME_SCAN_MAX_DELAY,
+        full_scan: bool = NAVIDROME_FULL_SCAN,
+        timeout: float = 10.0,
+        retry_delay: float = NAVIDROME_SCAN_RETRY_DELAY,
+        retry_max_delay: float = NAVIDROME_SCAN_RETRY_MAX_DELAY,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.user = user
+        self.password = password
+        self.quiet_period = quiet_period
+        self.max_delay = max(max_delay, quiet_period)
+        self.full_scan = full_scan
+        self.timeout = timeout
+        self.retry_delay = retry_delay
+        self.retry_max_delay = max(retry_max_delay, retry_delay)
+
+        self.scans_triggered = 0
+        self.scans_failed = 0
+        self.last_scan_at: Optional[float] = None
+
+        self._cond = threading.Condition()
+        self._first_event: Optional[float] = None
+        self._last_event: Optional[float] = None
+        self._pending = 0
+        # Kolejne nieudane próby i najwcześniejszy moment następnej
+        self._failures = 0
+        self._retry_at: Optional[float] = None
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+
+    def notify(self, path: Optional[str] = None) -> None:
+        """Record a library change; the scan itself is scheduled in the background."""
+        with self._cond:
+            if self._closed:
+                return
+            now = time.monotonic()
+            if self._first_event is None:
+                self._first_event = now
+            self._last_event = now
+            self._pending += 1
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="navidrome-scan", daemon=True
+                )
+                self._thread.start()
+            self._cond.notify()
+
+    def flush(self) -> None:
+        """Trigger the pending scan immediately instead of waiting for the quiet period."""
+        with self._cond:
+            if self._first_event is not None:
+                self._first_event = self._last_event = float("-inf")
+                self._retry_at = None
+                self._cond.notify()
+
+    def close(self, flush: bool = True) -> None:
+        """Stop the background thread, optionally firing a pending scan first."""
+        if flush:
+            self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=self.timeout + 1)
+
+    @property
+    def pending(self) -> int:
+        with self._cond:
+            return self._pending
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    if self._first_event is None:
+                        if self._closed:
+                            return
+                        self._cond.wait()
+                        continue
+                    deadline = min(
+                        self._last_event + self.quiet_period,
+                        self._first_event + self.max_delay,
+                    )
+                    if self._retry_at is not None:
+                        deadline = max(deadline, self._retry_at)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or self._closed:
+                        break
+                    self._cond.wait(remaining)
+
+                batch = self._pending
+                self._first_event = self._last_event = None
+                self._pending = 0
+
+            if self.start_scan():
+                logger.info(f"Navidrome scan triggered for {batch} library change(s)")
+                with self._cond:
+                    self._failures = 0
+                    self._retry_at = None
+            else:
+                # Nie gubimy zmian – kolejna próba z rosnącym odstępem
+                with self._cond:
+                    if not self._closed:
+                        now = time.monotonic()
+                        self._failures += 1
+                        # Wykładnik ograniczony – po tysiącach porażek 2**n nie przepełni floata
+                        backoff = self.retry_delay * 2 ** min(self._failures - 1, 32)
+                        delay = min(backoff, self.retry_max_delay)
+                        self._retry_at = now + delay
+                        self._first_event = self._first_event or now
+                        self._last_event = now
+                        self._pending += batch
+
+    def _auth_params(self) -> dict:
+        salt = secrets.token_hex(8)
+        token = hashlib.md5((self.password + salt).encode("utf-8")).hexdigest()
+        return {
+            "u": self.user,
+            "t": token,
+            "s": salt,
+            "v": SUBSONIC_API_VERSION,
+            "c": SUBSONIC_CLIENT,
+            "f": "json",
+        }
+
+    def start_scan(self) -> bool:
+        """Call Subsonic `startScan` once. Returns True when Navidrome accepted it."""
+        params = self._auth_params()
+        if self.full_scan:
+            params["fullScan"] = "true"
+        url = f"{self.base_url}/rest/startScan?{urllib.parse.urlencode(params)}"
+
+        try:
+            with urllib.request.urlopen(url, timeout=self.timeout) as response:
+                payload = json.loads(response.read().decode("utf-8"))
+            status = payload.get("subsonic-response", {}).get("status")
+            if status != "ok":
+                error = payload.get("subsonic-response", {}).get("error", {})
+                raise RuntimeError(error.get("message") or f"status={status}")
+        except Exception as e:
+            self.scans_failed += 1
+            logger.warning(f"Navidrome startScan failed: {e}")
+            return False
+
+        self.scans_triggered += 1
+        self.last_scan_at = time.time()
+        return True
+
+
+_notifier: Optional[ScanNotifier] = None
+_notifier_lock = threading.Lock()
+
+
+def get_notifier() -> Optional[ScanNotifier]:
+    """Process-wide notifier, or None when Navidrome is not configured."""
+    global _notifier
+    if not NAVIDROME_URL:
+        return None
+    with _notifier_lock:
+        if _notifier is None:
+            _notifier = ScanNotifier(NAVIDROME_URL, NAVIDROME_USER, NAVIDROME_PASSWORD)
+        return _notifier
+
+
+def notify_library_changed(path: Optional[str] = None) -> None:
+    """Tell Navidrome (eventually) that the toolbox changed something in the library."""
+    notifier = get_notifier()
+    if notifier is not None:
+        notifier.notify(path)
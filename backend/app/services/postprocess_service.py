@@ -0,0 +1,171 @@
+import logging
+import os
+import subprocess
+import time
+from concurrent.futures import Future
+from typing import Optional
+
+from app.services.executors import cpu_count, submit_process
+from app.services.file_service import embed_cover_art
+from app.tracing import Trace
+
+logger = logging.getLogger(__name__)
+
+# ffmpeg jest instalowany w obrazie Dockera; ścieżkę można nadpisać lokalnie
+FFMPEG_BIN = os.environ.get("FFMPEG_BIN", "ffmpeg")
+
+# Rozmiar puli CPU dla kroków ffmpeg (domyślnie liczba rdzeni)
+POSTPROCESS_WORKERS = int(os.environ.get("POSTPROCESS_WORKERS", "0")) or cpu_count()
+
+# Normalizacja głośności wymaga ponownego kodowania (stratnego) – domyślnie wyłączona,
+# głośność wyrównują tagi ReplayGain (/api/loudness/analyze)
+POSTPROCESS_LOUDNORM = os.environ.get("POSTPROCESS_LOUDNORM", "0") == "1"
+POSTPROCESS_LOUDNORM_FILTER = os.environ.get(
+    "POSTPROCESS_LOUDNORM_FILTER", "loudnorm=I=-14:TP=-1.5:LRA=11"
+)
+POSTPROCESS_EMBED_THUMBNAIL = os.environ.get("POSTPROCESS_EMBED_THUMBNAIL", "1") == "1"
+
+# Parametry kodera używane, gdy loudnorm wymusza ponowne kodowanie
+_ENCODER_ARGS = {
+    ".opus": ["-c:a", "libopus", "-b:a", "160k", "-ar", "48000"],
+    ".ogg": ["-c:a", "libvorbis", "-q:a", "6"],
+    ".mp3": ["-c:a", "libmp3lame", "-q:a", "2"],
+    ".m4a": ["-c:a", "aac", "-b:a", "256k"],
+    ".flac": ["-c:a", "flac"],
+}
+
+
+def _target_extension(ext: str, acodec: Optional[str]) -> str:
+    """
+    Pick the container for the library copy.
+    WebM audio is remuxed into Ogg: `.opus` for Opus streams, `.ogg` for Vorbis.
+    """
+    if ext == ".webm":
+        if acodec and acodec.startswith("vorbis"):
+            return ".ogg"
+        return ".opus"
+    return ext
+
+
+def _run_ffmpeg(args: list[str]) -> None:
+    cmd = [FFMPEG_BIN, "-hide_banner", "-nostdin", "-loglevel", "error", "-y", *args]
+    completed = subprocess.run(cmd, capture_output=True)
+    if completed.returncode != 0:
+        stderr = completed.stderr.decode("utf-8", errors="replace").strip()
+        raise RuntimeError(f"ffmpeg failed ({completed.returncode}): {stderr}")
+
+
+def _load_cover(thumbnail_path: str) -> bytes:
+    """Convert the yt-dlp thumbnail (usually WebP) to a JPEG players understand."""
+    jpeg_path = thumbnail_path + ".cover.jpg"
+    try:
+        _run_ffmpeg(["-i", thumbnail_path, "-frames:v", "1", jpeg_path])
+        with open(jpeg_path, "rb") as f:
+            return f.read()
+    finally:
+        if os.path.exists(jpeg_path):
+            os.remove(jpeg_path)
+
+
+def process_download(
+    source_path: str,
+    tags: dict,
+    thumbnail_path: Optional[str] = None,
+    acodec: Optional[str] = None,
+) -> tuple[str, dict[str, tuple[float, float]]]:
+    """
+    Remux, tag, optionally loudness-normalise and add cover art to a finished download.
+    Runs inside the post-processing process pool. Returns the final file path
+    and the wall-clock (start, end) of each step for tracing.
+    """
+    phases: dict[str, tuple[float, float]] = {}
+    root, ext = os.path.splitext(source_path)
+    target_ext = _target_extension(ext.lower(), acodec)
+    target_path = root + target_ext
+    tmp_path = f"{root}.part-pp{target_ext}"
+
+    args = ["-i", source_path, "-map", "0:a:0"]
+    for key, value in tags.items():
+        if value:
+            args += ["-metadata", f"{key}={value}"]
+
+    if POSTPROCESS_LOUDNORM and target_ext in _ENCODER_ARGS:
+        args += ["-af", POSTPROCESS_LOUDNORM_FILTER, *_ENCODER_ARGS[target_ext]]
+    else:
+        args += ["-c:a", "copy"]
+
+    try:
+        started = time.time()
+        _run_ffmpeg([*args, tmp_path])
+        phases["ffmpeg"] = (started, time.time())
+
+        if thumbnail_path and os.path.exists(thumbnail_path):
+            started = time.time()
+            try:
+                embed_cover_art(tmp_path, _load_cover(thumbnail_path))
+            except Exception as e:
+                logger.warning(f"Cover embedding failed for {source_path}: {e}")
+            phases["cover"] = (started, time.time())
+
+        os.replace(tmp_path, target_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    if target_path != source_path:
+        os.remove(source_path)
+    if thumbnail_path and os.path.exists(thumbnail_path):
+        os.remove(thumbnail_path)
+
+    return target_path, phases
+
+
+def _fallback(source_path: str, thumbnail_path: Optional[str], acodec: Optional[str]) -> str:
+    """Plain rename used when ffmpeg is unavailable or fails on a file."""
+    root, ext = os.path.splitext(source_path)
+    target_path = root + _target_extension(ext.lower(), acodec)
+    if target_path != source_path:
+        os.replace(source_path, target_path)
+    if thumbnail_path and os.path.exists(thumbnail_path):
+        os.remove(thumbnail_path)
+    return target_path
+
+
+def submit(
+    source_path: str,
+    tags: dict,
+    thumbnail_path: Optional[str] = None,
+    acodec: Optional[str] = None,
+    trace: Optional[Trace] = None,
+) -> Future:
+    """
+    Hand a downloaded file to the post-processing pool.
+    The returned future resolves to the final path; ffmpeg errors degrade to a rename.
+    """
+    result: Future = Future()
+    submitted = time.time()
+    job = submit_process(
+        "postprocess", POSTPROCESS_WORKERS, process_download, source_path, tags, thumbnail_path, acodec
+    )
+
+    def done(job: Future) -> None:
+        try:
+            final_path, phases = job.result()
+            if trace is not None:
+                first_start = min((start for start, _ in phases.values()), default=None)
+                if first_start is not None:
+                    trace.add_span("postprocess_queue", submitted, first_start)
+                for name, (start, end) in phases.items():
+                    trace.add_span(name, start, end)
+            result.set_result(final_path)
+        except Exception as e:
+            if trace is not None:
+                trace.add_span("postprocess_failed", submitted, time.time(), error=str(e))
+            logger.warning(f"Post-processing failed for {source_path}: {e}")
+            try:
+                result.set_result(_fallback(source_path, thumbnail_path, acodec))
+            except Exception as fallback_error:
+                result.set_exception(fallback_error)
+
+    job.add_done_callback(done)
+    return result
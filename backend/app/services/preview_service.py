@@ -0,0 +1,105 @@
+"""
+Audio previews of library files.
+
+Formats browsers can play are served as plain files (Starlette's FileResponse):
+Range requests read only the requested bytes and servers implementing the ASGI
+`http.response.pathsend` extension send the file without copying it through
+Python. Other formats (WMA) are transcoded on the fly by ffmpeg to a low-bitrate
+stream, with seeking done by ffmpeg (`start`) instead of byte ranges.
+"""
+
+import asyncio
+import os
+from typing import AsyncIterator, Optional
+
+from app.services.postprocess_service import FFMPEG_BIN
+
+# Format podglądu dla plików, których przeglądarka nie odtworzy
+PREVIEW_TRANSCODE_FORMAT = os.environ.get("PREVIEW_TRANSCODE_FORMAT", "mp3")
+PREVIEW_TRANSCODE_BITRATE = int(os.environ.get("PREVIEW_TRANSCODE_BITRATE", "128"))
+# Ile podglądów może być jednocześnie transkodowanych (każdy to proces ffmpeg)
+PREVIEW_MAX_TRANSCODES = int(os.environ.get("PREVIEW_MAX_TRANSCODES", "4"))
+
+# Formaty odtwarzane natywnie przez przeglądarki
+MEDIA_TYPES = {
+    "mp3": "audio/mpeg",
+    "flac": "audio/flac",
+    "m4a": "audio/mp4",
+    "aac": "audio/aac",
+    "ogg": "audio/ogg",
+    "opus": "audio/ogg",
+    "wav": "audio/wav",
+}
+
+_TRANSCODE_ARGS = {
+    "mp3": ("audio/mpeg", ["-c:a", "libmp3lame", "-f", "mp3"]),
+    "opus": ("audio/ogg", ["-c:a", "libopus", "-ar", "48000", "-f", "ogg"]),
+}
+
+_CHUNK_SIZE = 64 * 1024
+
+_transcodes: Optional[asyncio.Semaphore] = None
+
+
+class PreviewBusy(Exception):
+    """All PREVIEW_MAX_TRANSCODES transcoding slots are taken."""
+
+
+class PreviewUnavailable(Exception):
+    """Transcoding is not possible here (ffmpeg is not installed)."""
+
+
+def media_type(fmt: Optional[str]) -> Optional[str]:
+    """MIME type of a natively playable format, None if it has to be transcoded."""
+    return MEDIA_TYPES.get(fmt or "")
+
+
+def transcode_media_type() -> str:
+    return _TRANSCODE_ARGS[PREVIEW_TRANSCODE_FORMAT][0]
+
+
+def _slots() -> asyncio.Semaphore:
+    global _transcodes
+    if _transcodes is None:
+        _transcodes = asyncio.Semaphore(PREVIEW_MAX_TRANSCODES)
+    return _transcodes
+
+
+async def transcode(file_path: str, start: float = 0.0) -> AsyncIterator[bytes]:
+    """
+    Start ffmpeg for a low-bitrate preview and return its output as chunks.
+    The slot is taken before the response starts (PreviewBusy when none is free,
+    PreviewUnavailable without ffmpeg); ffmpeg is killed as soon as the client goes away.
+    """
+    slots = _slots()
+    if slots.locked():
+        raise PreviewBusy()
+    await slots.acquire()
+    args = [FFMPEG_BIN, "-hide_banner", "-nostdin", "-loglevel", "error"]
+    if start:
+        # -ss przed -i: ffmpeg przewija po indeksie zamiast dekodować od początku
+        args += ["-ss", f"{start:.3f}"]
+    args += ["-i", file_path, "-map", "0:a:0", "-map_metadata", "-1"]
+    args += [*_TRANSCODE_ARGS[PREVIEW_TRANSCODE_FORMAT][1], "-b:a", f"{PREVIEW_TRANSCODE_BITRATE}k", "pipe:1"]
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+    except FileNotFoundError:
+        slots.release()
+        raise PreviewUnavailable(f"Transcoding is unavailable: {FFMPEG_BIN} not found")
+    except BaseException:
+        slots.release()
+        raise
+
+    async def chunks() -> AsyncIterator[bytes]:
+        try:
+            while chunk := await process.stdout.read(_CHUNK_SIZE):
+                yield chunk
+        finally:
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+            slots.release()
+
+    return chunks()
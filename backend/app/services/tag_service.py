@@ -0,0 +1,221 @@
+"""
+Batch tag editing.
+
+A batch applies one tag patch (plus optional per-file overrides and track
+renumbering) to many files. Each file is written atomically: tags go into a
+copy next to the original, which then replaces it with `os.replace`. The
+original stays hard-linked as a backup until the batch ends, so a failed batch
+can be rolled back file by file without copying audio data twice.
+"""
+
+import logging
+import os
+import shutil
+from concurrent.futures import as_completed
+from typing import Optional
+
+from app.jobs import Job, JobCancelled, start_job
+from app.services import catalog_service, navidrome_service
+from app.services.executors import get_thread_pool
+from app.services.file_service import WRITABLE_TAGS, extract_metadata, write_tags
+
+logger = logging.getLogger(__name__)
+
+TAG_WRITE_WORKERS = int(os.environ.get("TAG_WRITE_WORKERS", "8"))
+TAG_BATCH_MAX_FILES = int(os.environ.get("TAG_BATCH_MAX_FILES", "5000"))
+
+JOB_KIND = "tags"
+
+# Pliki pomocnicze mają rozszerzenie spoza SUPPORTED_EXTENSIONS – skan ich nie indeksuje
+_TMP_SUFFIX = ".tags-tmp"
+_BACKUP_SUFFIX = ".tags-bak"
+
+
+def _sidecar(file_path: str, suffix: str) -> str:
+    directory, name = os.path.split(file_path)
+    return os.path.join(directory, f".{name}{suffix}")
+
+
+def plan_batch(
+    ids: list[str],
+    patch: dict,
+    edits: Optional[dict[str, dict]] = None,
+    renumber: bool = False,
+) -> list[tuple[str, str, dict]]:
+    """
+    Resolve file IDs against the catalog and build (id, path, tags) per file.
+    Per-file `edits` override the shared `patch`; `renumber` numbers tracks
+    1..n within each album directory in their current track order.
+    Raises ValueError for unknown IDs or tags and oversized batches.
+    """
+    edits = edits or {}
+    all_ids = list(dict.fromkeys([*ids, *edits]))
+    if not all_ids:
+        raise ValueError("No files selected")
+    if len(all_ids) > TAG_BATCH_MAX_FILES:
+        raise ValueError(f"At most {TAG_BATCH_MAX_FILES} files per batch")
+    for tags in (patch, *edits.values()):
+        unknown = set(tags) - set(WRITABLE_TAGS)
+        if unknown:
+            raise ValueError(f"Unknown tags: {', '.join(sorted(unknown))}")
+
+    rows = {}
+    for file_id in all_ids:
+        row = catalog_service.get(file_id)
+        if row is None:
+            raise ValueError(f"File not found: {file_id}")
+        rows[file_id] = row
+
+    plan = {file_id: {**patch, **edits.get(file_id, {})} for file_id in all_ids}
+
+    if renumber:
+        albums: dict[tuple, list[str]] = {}
+        for file_id, row in rows.items():
+            album = plan[file_id].get("album", row.album)
+            albums.setdefault((os.path.dirname(row.path), album), []).append(file_id)
+        for members in albums.values():
+            members.sort(
+                key=lambda i: (
+                    rows[i].track_number is None,
+                    rows[i].track_number or 0,
+                    rows[i].filename,
+                )
+            )
+            for number, file_id in enumerate(members, 1):
+                plan[file_id]["track_number"] = number
+
+    return [(file_id, rows[file_id].path, tags) for file_id, tags in plan.items() if tags]
+
+
+def _write_one(file_path: str, tags: dict) -> tuple[str, dict]:
+    """
+    Write tags into a copy and swap it in. Returns (backup path, new metadata);
+    the backup is the original file, kept under a hidden name until the batch ends.
+    """
+    tmp_path = _sidecar(file_path, _TMP_SUFFIX)
+    backup_path = _sidecar(file_path, _BACKUP_SUFFIX)
+    try:
+        shutil.copyfile(file_path, tmp_path)
+        shutil.copymode(file_path, tmp_path)
+        write_tags(tmp_path, tags, ext=os.path.splitext(file_path)[1])
+        try:
+            os.link(file_path, backup_path)
+        except FileExistsError:
+            os.remove(backup_path)
+            os.link(file_path, backup_path)
+        except OSError:
+            # System plików bez twardych dowiązań – kopia zamiast linku
+            shutil.copy2(file_path, backup_path)
+        try:
+            os.replace(tmp_path, file_path)
+        except OSError:
+            os.remove(backup_path)
+            raise
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return backup_path, extract_metadata(file_path)
+
+
+def apply_batch(job: Job, plan: list[tuple[str, str, dict]], rollback_on_error: bool = True) -> dict:
+    """
+    Job body: write every planned file in the tag-write pool, then either drop
+    the backups or (on error with `rollback_on_error`, or on cancel) restore them.
+    The catalog is updated once, after all files are settled. A file whose
+    backup cannot be put back keeps the new tags and its backup, and is
+    listed in `not_restored`.
+    """
+    job.update(phase="writing", done=0, total=len(plan), written=0, failed=0)
+    pool = get_thread_pool("tag-writes", TAG_WRITE_WORKERS)
+    futures = {pool.submit(_write_one, path, tags): (file_id, path) for file_id, path, tags in plan}
+
+    backups: dict[str, str] = {}
+    metadata: dict[str, dict] = {}
+    failures: list[dict] = []
+    cancelled = False
+    try:
+        for future in as_completed(futures):
+            file_id, path = futures[future]
+            try:
+                backups[path], metadata[path] = future.result()
+            except Exception as e:
+                failures.append({"id": file_id, "path": path, "error": str(e)})
+            job.update(done=job.progress["done"] + 1, written=len(backups), failed=len(failures))
+            if failures and rollback_on_error:
+                break
+            job.check_cancelled()
+    except JobCancelled:
+        cancelled = True
+    finally:
+        # Zatrzymaj pozostałe zapisy i poczekaj na te, które już trwają
+        for future in futures:
+            future.cancel()
+        for future, (file_id, path) in futures.items():
+            if future.cancelled() or path in backups:
+                continue
+            try:
+                backups[path], metadata[path] = future.result()
+            except Exception as e:
+                if not any(f["path"] == path for f in failures):
+                    failures.append({"id": file_id, "path": path, "error": str(e)})
+
+    ids = {path: file_id for file_id, path in futures.values()}
+    not_restored: list[dict] = []
+    rolled_back = bool(backups) and (cancelled or bool(failures and rollback_on_error))
+    if rolled_back:
+        job.update(phase="rolling_back")
+        for path, backup_path in backups.items():
+            # Błąd jednego pliku nie przerywa przywracania pozostałych
+            try:
+                os.replace(backup_path, path)
+            except OSError as e:
+                logger.error(f"Cannot restore {path} from {backup_path}: {e}")
+                not_restored.append({"id": ids[path], "path": path, "backup": backup_path, "error": str(e)})
+        if not_restored:
+            # Przerwane zadanie nie ma wyniku – lista jest też w postępie
+            job.update(not_restored=not_restored)
+    else:
+        for backup_path in backups.values():
+            try:
+                os.remove(backup_path)
+            except OSError as e:
+                logger.warning(f"Cannot remove tag backup {backup_path}: {e}")
+
+    job.update(phase="indexing")
+    touched = list(backups)
+    catalog_service.upsert_many(touched, None if rolled_back else metadata)
+    if touched and (not rolled_back or not_restored):
+        navidrome_service.notify_library_changed()
+
+    if cancelled:
+        raise JobCancelled()
+    job.update(phase="done")
+    return {
+        "files": len(plan),
+        "written": len(not_restored) if rolled_back else len(backups),
+        "failed": failures,
+        "rolled_back": rolled_back,
+        "not_restored": not_restored,
+    }
+
+
+def start_batch(
+    ids: list[str],
+    patch: dict,
+    edits: Optional[dict[str, dict]] = None,
+    renumber: bool = False,
+    rollback_on_error: bool = True,
+) -> Job:
+    """Validate the batch up front (ValueError) and run it as a background job."""
+    plan = plan_batch(ids, patch, edits, renumber)
+    return start_job(
+        JOB_KIND,
+        lambda job: apply_batch(job, plan, rollback_on_error),
+        {
+            "files": len(plan),
+            "tags": sorted({name for _, _, tags in plan for name in tags}),
+            "renumber": renumber,
+            "rollback_on_error": rollback_on_error,
+        },
+        expose_result=True,
+    )
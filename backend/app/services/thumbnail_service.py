@@ -0,0 +1,171 @@
+import os
+import re
+import tempfile
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import Future
+from typing import Optional
+
+from app.metrics import register_cache
+
+# Źródło miniaturek – można podmienić na lokalny serwer (np. w testach)
+THUMBNAIL_UPSTREAM = os.environ.get("THUMBNAIL_UPSTREAM", "https://i.ytimg.com")
+THUMBNAIL_CACHE_DIR = os.environ.get(
+    "THUMBNAIL_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "navidrome-toolbox", "thumbnails"),
+)
+THUMBNAIL_CACHE_MAX_BYTES = int(
+    os.environ.get("THUMBNAIL_CACHE_MAX_BYTES", str(256 * 1024 * 1024))
+)
+THUMBNAIL_TIMEOUT = float(os.environ.get("THUMBNAIL_TIMEOUT", "10"))
+
+THUMBNAIL_VARIANTS = {"default", "mqdefault", "hqdefault", "sddefault", "maxresdefault"}
+DEFAULT_VARIANT = "mqdefault"
+
+_VIDEO_ID_PATTERN = re.compile(r"^[\w-]{11}$")
+
+_lock = threading.Lock()
+_inflight: dict[str, Future] = {}
+_cache_bytes: Optional[int] = None
+
+hits = 0
+misses = 0
+
+register_cache("thumbnails", lambda: (hits, misses))
+
+
+class ThumbnailNotFound(Exception):
+    pass
+
+
+def thumbnail_url(video_id: str) -> str:
+    """Backend-relative URL that serves the cached thumbnail for a video."""
+    return f"/api/youtube/thumbnail/{video_id}"
+
+
+def _cache_path(video_id: str, variant: str) -> str:
+    return os.path.join(THUMBNAIL_CACHE_DIR, f"{video_id}_{variant}.jpg")
+
+
+def _current_cache_bytes() -> int:
+    global _cache_bytes
+    if _cache_bytes is None:
+        total = 0
+        if os.path.isdir(THUMBNAIL_CACHE_DIR):
+            for entry in os.scandir(THUMBNAIL_CACHE_DIR):
+                if entry.is_file():
+                    total += entry.stat().st_size
+        _cache_bytes = total
+    return _cache_bytes
+
+
+def _evict() -> None:
+    """Drop least recently used files until the cache is back under 90% of its limit."""
+    global _cache_bytes
+    entries = [e for e in os.scandir(THUMBNAIL_CACHE_DIR) if e.is_file()]
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    total = sum(e.stat().st_size for e in entries)
+    target = THUMBNAIL_CACHE_MAX_BYTES * 0.9
+    for entry in entries:
+        if total <= target:
+            break
+        size = entry.stat().st_size
+        try:
+            os.remove(entry.path)
+            total -= size
+        except OSError:
+            pass
+    _cache_bytes = total
+
+
+def _read_cached(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    # mtime służy jako znacznik LRU przy eksmisji
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return data
+
+
+def _fetch(video_id: str, variant: str) -> bytes:
+    url = f"{THUMBNAIL_UPSTREAM.rstrip('/')}/vi/{video_id}/{variant}.jpg"
+    try:
+        with urllib.request.urlopen(url, timeout=THUMBNAIL_TIMEOUT) as response:
+            return response.read()
+    except urllib.error.HTTPError as e:
+        if e.code == 404:
+            raise ThumbnailNotFound(f"No thumbnail for {video_id}")
+        raise
+
+
+def _store(path: str, data: bytes) -> None:
+    global _cache_bytes
+    os.makedirs(THUMBNAIL_CACHE_DIR, exist_ok=True)
+    # Licznik inicjowany skanem przed zapisem – inaczej nowy plik byłby policzony dwa razy
+    with _lock:
+        _current_cache_bytes()
+    fd, tmp_path = tempfile.mkstemp(dir=THUMBNAIL_CACHE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    with _lock:
+        _cache_bytes += len(data)
+        over_limit = _cache_bytes > THUMBNAIL_CACHE_MAX_BYTES
+    if over_limit:
+        with _lock:
+            _evict()
+
+
+def get_thumbnail(video_id: str, variant: str = DEFAULT_VARIANT) -> bytes:
+    """
+    Return JPEG bytes for a YouTube thumbnail from the on-disk cache.
+    A miss fetches from upstream once; concurrent requests for the same image wait for it.
+    """
+    global hits, misses
+
+    if not _VIDEO_ID_PATTERN.match(video_id):
+        raise ValueError("Invalid video id")
+    if variant not in THUMBNAIL_VARIANTS:
+        raise ValueError(f"Variant must be one of: {', '.join(sorted(THUMBNAIL_VARIANTS))}")
+
+    path = _cache_path(video_id, variant)
+    data = _read_cached(path)
+    if data is not None:
+        hits += 1
+        return data
+
+    key = f"{video_id}_{variant}"
+    with _lock:
+        pending = _inflight.get(key)
+        owner = pending is None
+        if owner:
+            pending = Future()
+            _inflight[key] = pending
+            misses += 1
+
+    if not owner:
+        return pending.result()
+
+    try:
+        data = _fetch(video_id, variant)
+        _store(path, data)
+        pending.set_result(data)
+        return data
+    except Exception as e:
+        pending.set_exception(e)
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
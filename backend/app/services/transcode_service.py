@@ -0,0 +1,426 @@
+"""
+Batch transcoding of library files.
+
+A transcode job converts a catalog selection (search phrase, source formats,
+directory, explicit IDs) to one target format with ffmpeg. Files are encoded
+one per process in a CPU-sized pool, with tags mapped by ffmpeg and the cover
+art copied with mutagen. Output is written under a hidden temporary name and
+moved into place with `os.replace`, so readers never see a half-written file.
+
+A file whose output already exists and is newer than the source is skipped,
+which makes re-running a job cheap. Unfinished jobs are kept in
+TRANSCODE_STATE_FILE (with several workers: in the shared state) and started
+again after a restart – already converted files are then skipped, so the job
+continues where it stopped.
+"""
+
+import json
+import logging
+import os
+import subprocess
+import threading
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Optional
+
+from app import DATA_DIR, shared_state
+from app.jobs import Job, start_job
+from app.services import catalog_service, navidrome_service
+from app.services.executors import cpu_count, submit_process
+from app.services.file_service import embed_cover_art, get_cover_art, get_cover_mime_type
+from app.services.postprocess_service import FFMPEG_BIN
+
+logger = logging.getLogger(__name__)
+
+TRANSCODE_WORKERS = int(os.environ.get("TRANSCODE_WORKERS", "0")) or cpu_count()
+TRANSCODE_MAX_FILES = int(os.environ.get("TRANSCODE_MAX_FILES", "200000"))
+# Niedokończone zadania wznawiane po restarcie – musi przetrwać odtworzenie kontenera
+TRANSCODE_STATE_FILE = os.environ.get(
+    "TRANSCODE_STATE_FILE", os.path.join(DATA_DIR, "transcode.json")
+)
+
+JOB_KIND = "transcode"
+
+# Format docelowy -> (rozszerzenie, muxer ffmpeg, koder, domyślny bitrate w kbps)
+TARGET_FORMATS: dict[str, tuple[str, str, list[str], Optional[int]]] = {
+    "opus": (".opus", "opus", ["-c:a", "libopus", "-ar", "48000"], 128),
+    "ogg": (".ogg", "ogg", ["-c:a", "libvorbis"], 192),
+    "mp3": (".mp3", "mp3", ["-c:a", "libmp3lame"], 256),
+    "m4a": (".m4a", "ipod", ["-c:a", "aac"], 256),
+    "flac": (".flac", "flac", ["-c:a", "flac"], None),
+}
+
+# W Ogg tagi są metadanymi strumienia, a nie kontenera
+_STREAM_TAG_FORMATS = {"ogg", "opus"}
+
+# Katalog aktualizowany co tyle przekonwertowanych plików
+_FLUSH_EVERY = 100
+
+# ID zadania -> parametry; tylko zadania, które jeszcze się nie zakończyły
+_pending: dict[str, dict] = {}
+_pending_lock = threading.Lock()
+# Przestrzeń wspólnego stanu z niedokończonymi zadaniami wszystkich workerów
+_PENDING_NAMESPACE = "transcode-pending"
+
+
+def _within(path: str, directory: str) -> bool:
+    return os.path.commonpath([directory, path]) == directory
+
+
+def _library_root(file_path: str) -> Optional[catalog_service.LibraryRoot]:
+    """The innermost configured library root containing `file_path`."""
+    matches = [root for root in catalog_service.ROOTS if root.contains(file_path)]
+    return max(matches, key=lambda root: len(root.abspath), default=None)
+
+
+def _resolve_in_root(path: str, root: catalog_service.LibraryRoot) -> Optional[str]:
+    """
+    `path` (absolute or relative to `root`) with symlinks and ".." resolved,
+    expressed under root.abspath; None when it lies outside `root`.
+    """
+    real_root = os.path.realpath(root.abspath)
+    resolved = os.path.realpath(os.path.join(root.abspath, path))
+    if not _within(resolved, real_root):
+        return None
+    return os.path.normpath(os.path.join(root.abspath, os.path.relpath(resolved, real_root)))
+
+
+def _resolve_per_root(path: str) -> dict[str, str]:
+    """
+    Resolve an API-supplied directory (root path -> resolved directory). A
+    relative path is resolved in every library root and must stay inside each
+    of them; an absolute one must lie in some root. Raises ValueError otherwise
+    – API input must never reach files outside the library.
+    """
+    resolved = {}
+    for root in catalog_service.ROOTS:
+        inside = _resolve_in_root(path, root)
+        if inside is not None:
+            resolved[root.abspath] = inside
+        elif not os.path.isabs(path):
+            resolved.clear()
+            break
+    if not resolved:
+        raise ValueError(f"Path is outside the music library: {path}")
+    return resolved
+
+
+def output_path(source_path: str, target: str, output_roots: Optional[dict[str, str]] = None) -> str:
+    """
+    Where the converted file goes: next to the source, or – with `output_roots`
+    from _resolve_per_root(output_dir) – under the output directory, mirroring
+    the layout of the source's library root. Raises ValueError for a source
+    outside the configured library roots.
+    """
+    stem, _ = os.path.splitext(os.path.abspath(source_path))
+    if output_roots:
+        root = _library_root(source_path)
+        if root is None:
+            raise ValueError(f"File is outside the music library: {source_path}")
+        # Bezwzględny katalog wyjściowy może leżeć w innym katalogu biblioteki niż źródło
+        output_root = output_roots.get(root.abspath) or next(iter(output_roots.values()))
+        stem = os.path.join(output_root, os.path.relpath(stem, root.abspath))
+    return stem + TARGET_FORMATS[target][0]
+
+
+def is_up_to_date(source_path: str, target_path: str) -> bool:
+    """The output exists and was written after the source last changed."""
+    try:
+        return os.stat(target_path).st_mtime_ns >= os.stat(source_path).st_mtime_ns
+    except OSError:
+        return False
+
+
+def transcode_file(
+    source_path: str,
+    target_path: str,
+    target: str,
+    bitrate: Optional[int] = None,
+    delete_source: bool = False,
+) -> int:
+    """
+    Convert one file. Runs inside the transcode process pool (one ffmpeg thread
+    per file – the pool spreads files over the cores). Returns the output size.
+    """
+    ext, muxer, codec, default_bitrate = TARGET_FORMATS[target]
+    source_format = os.path.splitext(source_path)[1].lower().lstrip(".")
+    directory, name = os.path.split(target_path)
+    os.makedirs(directory, exist_ok=True)
+    # Rozszerzenie spoza SUPPORTED_EXTENSIONS – skan nie zaindeksuje niedokończonego pliku
+    tmp_path = os.path.join(directory, f".{name}.{os.getpid()}.transcode-tmp")
+
+    tag_source = "0:s:a:0" if source_format in _STREAM_TAG_FORMATS else "0"
+    args = [FFMPEG_BIN, "-hide_banner", "-nostdin", "-loglevel", "error", "-y", "-i", source_path]
+    args += ["-map", "0:a:0", "-map_metadata", tag_source, "-threads", "1", *codec]
+    if default_bitrate is not None:
+        args += ["-b:a", f"{bitrate or default_bitrate}k"]
+    args += ["-f", muxer, tmp_path]
+
+    try:
+        completed = subprocess.run(args, capture_output=True)
+        if completed.returncode != 0:
+            stderr = completed.stderr.decode("utf-8", errors="replace").strip()
+            raise RuntimeError(f"ffmpeg failed ({completed.returncode}): {stderr}")
+
+        cover = get_cover_art(source_path)
+        if cover:
+            try:
+                embed_cover_art(tmp_path, cover, get_cover_mime_type(source_path), ext=ext)
+            except Exception as e:
+                logger.warning(f"Cover carry-over failed for {source_path}: {e}")
+
+        os.replace(tmp_path, target_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    if delete_source and os.path.abspath(source_path) != os.path.abspath(target_path):
+        os.remove(source_path)
+    return os.path.getsize(target_path)
+
+
+def plan_transcode(
+    target: str,
+    search: Optional[str] = None,
+    formats: Optional[list[str]] = None,
+    directory: Optional[str] = None,
+    ids: Optional[list[str]] = None,
+    output_dir: Optional[str] = None,
+) -> list[tuple[str, str, str, int]]:
+    """
+    Select catalog rows and map them to (id, source path, output path, size).
+    Files whose output would overwrite themselves are left out, and so is every
+    file but the first whose output path collides with another.
+    Raises ValueError for an unknown format or an empty or oversized selection.
+    """
+    if target not in TARGET_FORMATS:
+        raise ValueError(f"Unsupported target format: {target}")
+    wanted_formats = {f.lower().lstrip(".") for f in formats or []}
+    wanted_ids = set(ids or [])
+    # Katalog biblioteki -> prefiks ścieżek wybranego katalogu (względny katalog – w każdym z nich)
+    prefixes = None
+    if directory:
+        prefixes = {root: os.path.join(path, "") for root, path in _resolve_per_root(directory).items()}
+    output_roots = _resolve_per_root(output_dir) if output_dir else None
+
+    rows = catalog_service.query(search)
+    columns = rows.to_columns(("id", "path", "format", "file_size"))
+    plan = []
+    outputs: set[str] = set()
+    for file_id, path, fmt, size in zip(
+        columns["id"], columns["path"], columns["format"], columns["file_size"]
+    ):
+        if wanted_ids and file_id not in wanted_ids:
+            continue
+        if wanted_formats and fmt not in wanted_formats:
+            continue
+        if prefixes is not None:
+            root = _library_root(path)
+            prefix = prefixes.get(root.abspath) if root is not None else None
+            if prefix is None or not os.path.abspath(path).startswith(prefix):
+                continue
+        target_path = output_path(path, target, output_roots)
+        # Plik w formacie docelowym konwertowany "w miejscu" nadpisałby sam siebie
+        if target_path == os.path.abspath(path) or target_path in outputs:
+            continue
+        outputs.add(target_path)
+        plan.append((file_id, path, target_path, size))
+
+    if not plan:
+        raise ValueError("No files match the selection")
+    if len(plan) > TRANSCODE_MAX_FILES:
+        raise ValueError(f"At most {TRANSCODE_MAX_FILES} files per job")
+    return plan
+
+
+def _set_pending(job_id: str, params: Optional[dict]) -> None:
+    """Remember an unfinished job (params=None forgets it)."""
+    if shared_state.enabled():
+        # Każdy worker ma własne zadania – jeden plik nadpisywałyby sobie nawzajem
+        if params is None:
+            shared_state.cache_delete(_PENDING_NAMESPACE, job_id)
+        else:
+            shared_state.cache_set(_PENDING_NAMESPACE, job_id, params)
+        return
+    with _pending_lock:
+        if params is None:
+            _pending.pop(job_id, None)
+        else:
+            _pending[job_id] = params
+    _save_pending()
+
+
+def _save_pending() -> None:
+    with _pending_lock:
+        payload = json.dumps(_pending)
+    os.makedirs(os.path.dirname(TRANSCODE_STATE_FILE) or ".", exist_ok=True)
+    tmp_path = TRANSCODE_STATE_FILE + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(payload)
+    os.replace(tmp_path, TRANSCODE_STATE_FILE)
+
+
+def run_transcode(
+    job: Job,
+    plan: list[tuple[str, str, str, int]],
+    target: str,
+    bitrate: Optional[int] = None,
+    delete_source: bool = False,
+) -> dict:
+    """
+    Job body: skip up-to-date outputs, convert the rest in the process pool and
+    index new files (and removed sources) in batches as they complete.
+    """
+    todo = []
+    skipped = 0
+    for file_id, source, target_path, size in plan:
+        if is_up_to_date(source, target_path):
+            skipped += 1
+        else:
+            todo.append((file_id, source, target_path, size))
+
+    job.update(
+        phase="transcoding",
+        done=0,
+        total=len(todo),
+        skipped=skipped,
+        converted=0,
+        failed=0,
+        bytes_in=0,
+        bytes_out=0,
+    )
+    pending: dict = {}
+    touched: list[str] = []
+    failures: list[dict] = []
+    stats = {"converted": 0, "bytes_in": 0, "bytes_out": 0}
+    queue = iter(todo)
+
+    def flush() -> None:
+        if touched:
+            catalog_service.upsert_many(touched)
+            touched.clear()
+
+    try:
+        # Okno zadań – przy anulowaniu nie trzeba wycofywać tysięcy futures
+        window = TRANSCODE_WORKERS * 2
+        while True:
+            for file_id, source, target_path, size in queue:
+                args = (source, target_path, target, bitrate, delete_source)
+                future = submit_process("transcode", TRANSCODE_WORKERS, transcode_file, *args)
+                pending[future] = (file_id, source, target_path, size)
+                if len(pending) >= window:
+                    break
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_id, source, target_path, size = pending.pop(future)
+                try:
+                    written = future.result()
+                except Exception as e:
+                    failures.append({"id": file_id, "path": source, "error": str(e)})
+                else:
+                    stats["converted"] += 1
+                    stats["bytes_in"] += size
+                    stats["bytes_out"] += written
+                    touched.append(target_path)
+                    if delete_source:
+                        touched.append(source)
+                job.update(done=job.progress["done"] + 1, failed=len(failures), **stats)
+            if len(touched) >= _FLUSH_EVERY:
+                flush()
+            job.check_cancelled()
+    finally:
+        for future in pending:
+            future.cancel()
+        # Trwające konwersje i tak się zakończą – poczekaj, żeby trafiły do katalogu
+        for future, (file_id, source, target_path, size) in pending.items():
+            if not future.cancelled() and future.exception() is None:
+                touched.append(target_path)
+                if delete_source:
+                    touched.append(source)
+        flush()
+        if stats["converted"]:
+            navidrome_service.notify_library_changed()
+
+    job.update(phase="done")
+    return {"files": len(plan), "skipped": skipped, **stats, "failed": failures}
+
+
+def start_transcode(
+    target: str,
+    search: Optional[str] = None,
+    formats: Optional[list[str]] = None,
+    directory: Optional[str] = None,
+    ids: Optional[list[str]] = None,
+    output_dir: Optional[str] = None,
+    bitrate: Optional[int] = None,
+    delete_source: bool = False,
+) -> Job:
+    """
+    Validate the selection up front (ValueError) and run it as a background job.
+    The job stays in TRANSCODE_STATE_FILE until it completes, fails or is cancelled.
+    """
+    params = {
+        "target": target,
+        "search": search,
+        "formats": formats,
+        "directory": directory,
+        "ids": ids,
+        "output_dir": output_dir,
+        "bitrate": bitrate,
+        "delete_source": delete_source,
+    }
+    plan = plan_transcode(target, search, formats, directory, ids, output_dir)
+
+    started = threading.Event()
+
+    def body(job: Job) -> dict:
+        try:
+            return run_transcode(job, plan, target, bitrate, delete_source)
+        finally:
+            # Zadanie nie może usunąć swojego wpisu, zanim zostanie dodany
+            started.wait()
+            _set_pending(job.job_id, None)
+
+    job = start_job(JOB_KIND, body, {**params, "files": len(plan)}, expose_result=True)
+    try:
+        _set_pending(job.job_id, params)
+    finally:
+        started.set()
+    return job
+
+
+def resume_pending() -> None:
+    """
+    Start again the jobs interrupted by the last shutdown (registered as a
+    catalog load listener). With several workers only the leader resumes, and
+    only jobs whose worker is gone.
+    """
+    if shared_state.enabled():
+        if not shared_state.is_leader():
+            return
+        interrupted = {}
+        for job_id, params in shared_state.cache_items(_PENDING_NAMESPACE):
+            row = shared_state.load_job(job_id)
+            if row is None or row["orphaned"]:
+                interrupted[job_id] = params
+    else:
+        try:
+            with open(TRANSCODE_STATE_FILE, encoding="utf-8") as f:
+                interrupted = json.load(f)
+        except (OSError, ValueError):
+            return
+    for job_id, params in interrupted.items():
+        try:
+            start_transcode(**params)
+            logger.info(f"Resumed interrupted transcode job {job_id}")
+        except ValueError as e:
+            logger.info(f"Interrupted transcode job {job_id} has nothing left to do: {e}")
+        if shared_state.enabled():
+            shared_state.cache_delete(_PENDING_NAMESPACE, job_id)
+    # Wznowione zadania mają nowe wpisy – stare znikają z pliku
+    if not shared_state.enabled():
+        _save_pending()
+
+
+catalog_service.on_load(resume_pending)
@@ -0,0 +1,245 @@
+"""
+Waveform envelopes (peak and RMS) of library files.
+
+ffmpeg decodes a file to mono 16-bit PCM on a pipe. The stream is read in
+fixed-size chunks and reduced with NumPy to per-block peak and sum of squares,
+so the PCM stream never has to fit in memory. The blocks are then
+folded into the fixed WAVEFORM_RESOLUTIONS (number of points per track).
+
+Results are stored on disk per file version (ID, size and mtime), so a
+waveform is decoded once and every later request only reads a few KB.
+Computation runs in a process pool; a request for a waveform that is not
+ready yet starts it and returns immediately.
+"""
+
+import hashlib
+import os
+import subprocess
+import tempfile
+import threading
+from concurrent.futures import Future
+from typing import Optional
+
+from app import DATA_DIR
+from app.lazy import lazy_module
+from app.metrics import register_cache
+from app.services.cache import TTLCache
+from app.services.executors import submit_process
+from app.services.postprocess_service import FFMPEG_BIN
+
+WAVEFORM_CACHE_DIR = os.environ.get("WAVEFORM_CACHE_DIR", os.path.join(DATA_DIR, "waveforms"))
+WAVEFORM_WORKERS = int(os.environ.get("WAVEFORM_WORKERS", "2"))
+# Liczba punktów na utwór – klient wybiera jedną z nich
+WAVEFORM_RESOLUTIONS = tuple(
+    int(n) for n in os.environ.get("WAVEFORM_RESOLUTIONS", "128,512,2048").split(",")
+)
+# Częstotliwość dekodowania – do obwiedni wystarczy niższa niż oryginalna
+WAVEFORM_SAMPLE_RATE = int(os.environ.get("WAVEFORM_SAMPLE_RATE", "22050"))
+# Limit czasu dekodowania jednego pliku (s) – zawieszony ffmpeg nie blokuje procesu puli
+WAVEFORM_TIMEOUT = float(os.environ.get("WAVEFORM_TIMEOUT", "300"))
+# Jak długo błąd obliczenia jest zwracany bez ponownej próby (s) i ile błędów pamiętać
+WAVEFORM_FAILED_TTL = float(os.environ.get("WAVEFORM_FAILED_TTL", "3600"))
+WAVEFORM_FAILED_SIZE = int(os.environ.get("WAVEFORM_FAILED_SIZE", "1000"))
+
+# Próbek na blok pośredni (ok. 12 ms przy 22 kHz) i bajtów czytanych naraz z ffmpeg
+_BLOCK = 256
+_READ_SIZE = _BLOCK * 2 * 2048
+_FULL_SCALE = 32767
+# Ostatnie linie stderr ffmpeg w komunikacie błędu
+_ERROR_LINES = 5
+
+np = lazy_module("numpy", optional=True)
+
+_lock = threading.Lock()
+_inflight: dict[str, Future] = {}
+# Klucz -> błąd ostatniego obliczenia; uszkodzony plik nie jest dekodowany przy każdym zapytaniu,
+# a chwilowa awaria (timeout, brak ffmpeg) wygasa i obliczenie rusza znowu
+_failed = TTLCache(WAVEFORM_FAILED_SIZE, WAVEFORM_FAILED_TTL)
+
+hits = 0
+misses = 0
+
+register_cache("waveforms", lambda: (hits, misses))
+
+
+def cache_key(file_id: str, size: int, mtime_ns: int) -> str:
+    """Key of one version of a file – a changed file gets a new waveform."""
+    return hashlib.blake2b(f"{file_id}:{size}:{mtime_ns}".encode(), digest_size=16).hexdigest()
+
+
+def _cache_path(key: str) -> str:
+    return os.path.join(WAVEFORM_CACHE_DIR, key[:2], f"{key}.npz")
+
+
+def _fold(values, counts: int, resolution: int, reducer):
+    """Reduce per-block values to `resolution` nearly equal groups."""
+    if counts == 0:
+        return np.zeros(resolution, dtype=values.dtype)
+    edges = np.linspace(0, counts, resolution + 1).astype(np.int64)[:-1]
+    edges = np.minimum(edges, counts - 1)
+    return reducer.reduceat(values, edges)
+
+
+def compute_waveform(file_path: str) -> dict:
+    """
+    Decode `file_path` and return peak/RMS envelopes (uint8, 255 = full scale)
+    for every resolution plus duration and the number of clipped samples.
+    Runs in the waveform process pool.
+    """
+    if np is None:
+        raise RuntimeError("Waveform support is not installed (pip install numpy)")
+    cmd = [FFMPEG_BIN, "-hide_banner", "-nostdin", "-loglevel", "error", "-i", file_path]
+    cmd += ["-map", "0:a:0", "-ac", "1", "-ar", str(WAVEFORM_SAMPLE_RATE), "-f", "s16le", "pipe:1"]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    # stderr czytany w wątku – pełny bufor zatrzymałby ffmpeg
+    stderr: list[bytes] = []
+    reader = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+    reader.start()
+    timed_out = threading.Event()
+
+    def kill() -> None:
+        timed_out.set()
+        process.kill()
+
+    timer = threading.Timer(WAVEFORM_TIMEOUT, kill)
+    timer.start()
+
+    peaks: list = []
+    squares: list = []
+    samples = 0
+    clipped = 0
+    carry = b""
+    try:
+        while chunk := process.stdout.read(_READ_SIZE):
+            data = carry + chunk
+            whole = len(data) - len(data) % (_BLOCK * 2)
+            carry = data[whole:]
+            if not whole:
+                continue
+            pcm = np.frombuffer(data[:whole], dtype="<i2").astype(np.int32).reshape(-1, _BLOCK)
+            magnitude = np.abs(pcm)
+            peaks.append(magnitude.max(axis=1))
+            squares.append(np.square(pcm, dtype=np.float64).sum(axis=1))
+            clipped += int(np.count_nonzero(magnitude >= _FULL_SCALE))
+            samples += pcm.size
+        # Ostatni niepełny blok
+        if len(carry) >= 2:
+            pcm = np.frombuffer(carry[: len(carry) - len(carry) % 2], dtype="<i2").astype(np.int32)
+            magnitude = np.abs(pcm)
+            peaks.append(magnitude.max(keepdims=True))
+            squares.append(np.square(pcm, dtype=np.float64).sum(keepdims=True))
+            clipped += int(np.count_nonzero(magnitude >= _FULL_SCALE))
+            samples += pcm.size
+    finally:
+        timer.cancel()
+        process.stdout.close()
+        process.wait()
+        reader.join()
+        process.stderr.close()
+    if timed_out.is_set():
+        raise TimeoutError(f"Decoding timed out after {WAVEFORM_TIMEOUT:g}s")
+    if process.returncode != 0:
+        message = b"".join(stderr).decode("utf-8", errors="replace").strip()
+        message = "\n".join(message.splitlines()[-_ERROR_LINES:])
+        raise RuntimeError(f"ffmpeg failed ({process.returncode}): {message}")
+
+    block_peaks = np.concatenate(peaks) if peaks else np.zeros(0, dtype=np.int32)
+    block_squares = np.concatenate(squares) if squares else np.zeros(0)
+    block_sizes = np.full(len(block_peaks), _BLOCK, dtype=np.float64)
+    if len(block_sizes) and samples % _BLOCK:
+        block_sizes[-1] = samples % _BLOCK
+
+    result = {
+        "duration": samples / WAVEFORM_SAMPLE_RATE,
+        "sample_rate": WAVEFORM_SAMPLE_RATE,
+        "clipped_samples": clipped,
+    }
+    for resolution in WAVEFORM_RESOLUTIONS:
+        peak = _fold(block_peaks, len(block_peaks), resolution, np.maximum)
+        energy = _fold(block_squares, len(block_squares), resolution, np.add)
+        count = _fold(block_sizes, len(block_sizes), resolution, np.add)
+        rms = np.sqrt(energy / np.maximum(count, 1))
+        result[f"peaks_{resolution}"] = np.round(peak * 255 / (_FULL_SCALE + 1)).astype(np.uint8)
+        result[f"rms_{resolution}"] = np.round(rms * 255 / (_FULL_SCALE + 1)).astype(np.uint8)
+    return result
+
+
+def _store(key: str, result: dict) -> None:
+    path = _cache_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **{k: np.asarray(v) for k, v in result.items()})
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _generate(key: str, file_path: str) -> Future:
+    """Compute in the pool and store the result; one computation per key at a time."""
+    with _lock:
+        future = _inflight.get(key)
+        if future is not None:
+            return future
+        future = submit_process("waveforms", WAVEFORM_WORKERS, compute_waveform, file_path)
+        _inflight[key] = future
+
+    def done(future: Future) -> None:
+        try:
+            if future.exception() is None:
+                _store(key, future.result())
+            else:
+                _failed.set(key, str(future.exception()))
+        except Exception as e:
+            _failed.set(key, str(e))
+        finally:
+            with _lock:
+                _inflight.pop(key, None)
+
+    future.add_done_callback(done)
+    return future
+
+
+def get_waveform(
+    file_id: str, file_path: str, size: int, mtime_ns: int, resolution: int
+) -> Optional[dict]:
+    """
+    Cached envelope of one file at `resolution`, or None while it is being
+    computed (the first call starts the computation in the background).
+    Raises ValueError for an unknown resolution and RuntimeError when this
+    version of the file could not be decoded.
+    """
+    global hits, misses
+
+    if np is None:
+        raise RuntimeError("Waveform support is not installed (pip install numpy)")
+    if resolution not in WAVEFORM_RESOLUTIONS:
+        raise ValueError(
+            f"Resolution must be one of: {', '.join(map(str, WAVEFORM_RESOLUTIONS))}"
+        )
+
+    key = cache_key(file_id, size, mtime_ns)
+    try:
+        with np.load(_cache_path(key)) as data:
+            hits += 1
+            return {
+                "id": file_id,
+                "resolution": resolution,
+                "duration": float(data["duration"]),
+                "sample_rate": int(data["sample_rate"]),
+                "clipped_samples": int(data["clipped_samples"]),
+                "peaks": data[f"peaks_{resolution}"].tolist(),
+                "rms": data[f"rms_{resolution}"].tolist(),
+            }
+    except (OSError, KeyError, ValueError):
+        pass
+
+    error = _failed.get(key)
+    if error is not None:
+        raise RuntimeError(f"Waveform computation failed: {error}")
+    misses += 1
+    _generate(key, file_path)
+    return None
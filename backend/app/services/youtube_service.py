@@ -1,16 +1,79 @@
+import logging
 import os
+import shutil
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 from pathlib import Path
 import tempfile
+from concurrent.futures import Future
 from typing import Callable, Optional
 
-import yt_dlp
-import yt_dlp.utils
 from app.schemas.youtube import (
     DownloadResponse,
     FormatInfo,
     QualityResponse,
     VideoResult,
 )
+from app.services import (
+    catalog_service,
+    navidrome_service,
+    postprocess_service,
+    thumbnail_service,
+)
+from app import tracing
+from app.lazy import lazy_module
+from app.metrics import JOBS_IN_FLIGHT, YTDLP_ERRORS, YTDLP_SECONDS, register_cache
+from app.services.cache import TTLCache
+from app.services.executors import get_thread_pool, lower_thread_priority
+
+logger = logging.getLogger(__name__)
+
+# Import yt-dlp (setki modułów ekstraktorów) dopiero przy pierwszym użyciu albo w tle po starcie
+yt_dlp = lazy_module("yt_dlp")
+
+# Pliki trafiają do biblioteki dopiero po zakończeniu pobierania i post-processingu.
+# Staging leży w ukrytym podkatalogu, więc rename jest atomowy (ten sam system plików).
+DOWNLOAD_DIR = os.environ.get("DOWNLOAD_DIR", "/media")
+DOWNLOAD_STAGING_DIR = os.environ.get(
+    "DOWNLOAD_STAGING_DIR", os.path.join(DOWNLOAD_DIR, ".incoming")
+)
+
+# Ile sufiksów " (n)" próbować, gdy nazwa pliku jest już zajęta w bibliotece
+_PUBLISH_MAX_SUFFIX = 1000
+
+THUMBNAIL_PROXY = os.environ.get("THUMBNAIL_PROXY", "1") == "1"
+
+# Cache formatów oraz opcjonalny prefetch dla najwyższych wyników wyszukiwania
+YTDLP_FORMATS_CACHE_TTL = float(os.environ.get("YTDLP_FORMATS_CACHE_TTL", "1800"))
+YTDLP_FORMATS_CACHE_SIZE = int(os.environ.get("YTDLP_FORMATS_CACHE_SIZE", "512"))
+YTDLP_PREFETCH_FORMATS = int(os.environ.get("YTDLP_PREFETCH_FORMATS", "0"))
+YTDLP_PREFETCH_WORKERS = int(os.environ.get("YTDLP_PREFETCH_WORKERS", "2"))
+YTDLP_PREFETCH_MAX_PENDING = int(os.environ.get("YTDLP_PREFETCH_MAX_PENDING", "20"))
+YTDLP_PREFETCH_BUDGET = int(os.environ.get("YTDLP_PREFETCH_BUDGET", "60"))  # na minutę
+
+_formats_cache = TTLCache(YTDLP_FORMATS_CACHE_SIZE, YTDLP_FORMATS_CACHE_TTL, namespace="formats")
+_formats_lock = threading.Lock()
+_formats_inflight: dict[str, Future] = {}
+_prefetch_queued: set[str] = set()
+_prefetch_started: deque[float] = deque()
+
+register_cache("formats", lambda: (_formats_cache.hits, _formats_cache.misses))
+
+
+@contextmanager
+def _observe(operation: str):
+    """
+    Time a yt-dlp operation and count its failures.
+    The `extract` span includes yt-dlp's page fetches and signature solving.
+    """
+    with YTDLP_SECONDS.time(operation=operation), tracing.span("extract"):
+        try:
+            yield
+        except Exception:
+            YTDLP_ERRORS.inc(operation=operation)
+            raise
 
 
 def _is_youtube_url(query: str) -> bool:
@@ -69,10 +132,14 @@ def _extract_single_video(entry: dict) -> VideoResult | None:
 
     uploader = entry.get("artist") or entry.get("uploader") or entry.get("channel", "")
 
-    # yt-dlp w extract_flat często nie daje thumbnaila, więc budujemy go sami
-    thumbnail = (
-        entry.get("thumbnail") or f"https://i.ytimg.com/vi/{video_id}/mqdefault.jpg"
-    )
+    # Miniaturki idą przez cache backendu; yt-dlp w extract_flat często i tak ich nie daje
+    if THUMBNAIL_PROXY:
+        thumbnail = thumbnail_service.thumbnail_url(video_id)
+    else:
+        thumbnail = (
+            entry.get("thumbnail")
+            or f"https://i.ytimg.com/vi/{video_id}/mqdefault.jpg"
+        )
 
     url = entry.get(
         "webpage_url",
@@ -93,6 +160,7 @@ def _extract_single_video(entry: dict) -> VideoResult | None:
     )
 
 
+@tracing.traced("search")
 def search_youtube(
     query: str, limit: int, music_only: bool = True
 ) -> tuple[list[VideoResult], bool]:
@@ -107,6 +175,7 @@ def search_youtube(
     if not 1 <= limit <= 50:
         raise ValueError("Limit must be between 1 and 50")
 
+    tracing.annotate(query=query, limit=limit)
     cookie_file = os.getenv("YTDLP_COOKIE_FILE", "")
 
     ydl_opts: dict = {
@@ -121,7 +190,7 @@ def search_youtube(
     is_direct_url = _is_youtube_url(query)
 
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        with _observe("search"), yt_dlp.YoutubeDL(ydl_opts) as ydl:
             if is_direct_url:
                 # Pobieranie informacji o filmie bezpośrednio z URL'a
                 ydl_opts["extract_flat"] = False
@@ -165,6 +234,7 @@ def search_youtube(
     return results, is_direct_url
 
 
+@tracing.traced("playlist")
 def get_playlist_info(url: str) -> dict:
     """
     Fetch full playlist information including all videos.
@@ -183,7 +253,7 @@ def get_playlist_info(url: str) -> dict:
         ydl_opts["cookiefile"] = cookie_file
 
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        with _observe("playlist"), yt_dlp.YoutubeDL(ydl_opts) as ydl:
             info = ydl.extract_info(url, download=False)
     except (yt_dlp.utils.DownloadError, yt_dlp.utils.ExtractorError) as e:
         raise Exception(f"yt-dlp error: {str(e)}")
@@ -222,7 +292,7 @@ def get_playlist_info(url: str) -> dict:
             ydl_opts_full["cookiefile"] = cookie_file
 
         try:
-            with yt_dlp.YoutubeDL(ydl_opts_full) as ydl_full:
+            with _observe("playlist"), yt_dlp.YoutubeDL(ydl_opts_full) as ydl_full:
                 info_full = ydl_full.extract_info(url, download=False)
             if info_full and "entries" in info_full:
                 entries = info_full.get("entries") or []
@@ -247,17 +317,18 @@ def get_playlist_info(url: str) -> dict:
     }
 
 
+@tracing.traced("playlist")
 def get_playlist_info_chunked(url: str, offset: int = 0, limit: int = 10) -> dict:
     """
     Fetch playlist videos in chunks with parallel processing.
     Returns playlist metadata and a chunk of videos starting from offset.
     """
+    tracing.annotate(url=url, offset=offset, limit=limit)
     cookie_file = os.getenv("YTDLP_COOKIE_FILE", "")
 
     # Convert URL to proper playlist format for faster extraction
     playlist_url = _convert_to_playlist_url(url)
-    print(f"DEBUG: Original URL: {url}")
-    print(f"DEBUG: Converted URL: {playlist_url}")
+    logger.debug(f"Playlist URL: {url} -> {playlist_url}")
 
     # Calculate playlist item range (1-indexed for yt-dlp)
     start_item = offset + 1
@@ -274,22 +345,16 @@ def get_playlist_info_chunked(url: str, offset: int = 0, limit: int = 10) -> dic
         ydl_opts["cookiefile"] = cookie_file
 
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        with _observe("playlist"), yt_dlp.YoutubeDL(ydl_opts) as ydl:
             info = ydl.extract_info(playlist_url, download=False)
     except (yt_dlp.utils.DownloadError, yt_dlp.utils.ExtractorError) as e:
         raise Exception(f"yt-dlp error: {str(e)}")
     except Exception as e:
         raise Exception(f"Network error: {str(e)}")
 
-    # Debug logging - using print for immediate console output
-    print(
-        f"DEBUG Chunk: playlist_url={playlist_url}, offset={offset}, limit={limit}",
-        flush=True,
-    )
-    print(f"DEBUG Info keys: {list(info.keys()) if info else 'None'}", flush=True)
-    print(
-        f"DEBUG Playlist count: {info.get('playlist_count') if info else 'N/A'}",
-        flush=True,
+    logger.debug(
+        f"Playlist chunk: offset={offset}, limit={limit}, "
+        f"playlist_count={info.get('playlist_count') if info else 'N/A'}"
     )
 
     # Extract playlist metadata (from first request or reuse from client)
@@ -300,9 +365,7 @@ def get_playlist_info_chunked(url: str, offset: int = 0, limit: int = 10) -> dic
 
     # Extract videos from this chunk
     entries = info.get("entries") or []
-    print(f"DEBUG Entries count: {len(entries)}", flush=True)
-    if entries:
-        print(f"DEBUG First entry sample: {str(entries[0])[:200]}", flush=True)
+    logger.debug(f"Playlist chunk entries: {len(entries)}")
     videos: list[VideoResult] = []
 
     # Process entries in parallel batches of 5
@@ -347,7 +410,110 @@ def get_playlist_info_chunked(url: str, offset: int = 0, limit: int = 10) -> dic
     }
 
 
+def _video_key(url: str) -> str:
+    """Cache key for a video URL – the video ID when it can be found."""
+    import re
+
+    match = re.search(r"(?:[?&]v=|youtu\.be/|shorts/)([\w-]{11})", url)
+    return match.group(1) if match else url
+
+
+@tracing.traced("formats")
 def get_formats(url: str) -> QualityResponse:
+    """
+    Audio formats for a video, served from cache when a prefetch (or an earlier
+    request) already extracted them. Concurrent calls for one video share one extraction.
+    """
+    key = _video_key(url)
+    tracing.annotate(url=url)
+    cached = _formats_cache.get(key)
+    if cached is not None:
+        tracing.annotate(cache="hit")
+        return cached
+
+    with _formats_lock:
+        pending = _formats_inflight.get(key)
+        owner = pending is None
+        if owner:
+            pending = Future()
+            _formats_inflight[key] = pending
+
+    if not owner:
+        tracing.annotate(cache="shared")
+        with tracing.span("wait_inflight"):
+            return pending.result()
+
+    tracing.annotate(cache="miss")
+    try:
+        response = _extract_formats(url)
+        _formats_cache.set(key, response)
+        pending.set_result(response)
+        return response
+    except Exception as e:
+        pending.set_exception(e)
+        raise
+    finally:
+        with _formats_lock:
+            _formats_inflight.pop(key, None)
+
+
+def _prefetch_allowed() -> bool:
+    """Sliding one-minute budget so prefetching never floods YouTube."""
+    now = time.monotonic()
+    with _formats_lock:
+        while _prefetch_started and _prefetch_started[0] < now - 60:
+            _prefetch_started.popleft()
+        if len(_prefetch_started) >= YTDLP_PREFETCH_BUDGET:
+            return False
+        _prefetch_started.append(now)
+        return True
+
+
+def _prefetch_one(url: str) -> None:
+    key = _video_key(url)
+    with _formats_lock:
+        _prefetch_queued.discard(key)
+    if key in _formats_cache or not _prefetch_allowed():
+        return
+    try:
+        with tracing.trace("formats_prefetch", url=url):
+            get_formats(url)
+    except Exception as e:
+        logger.debug(f"Formats prefetch failed for {url}: {e}")
+
+
+def prefetch_formats(urls: list[str]) -> int:
+    """
+    Warm the formats cache for the top YTDLP_PREFETCH_FORMATS URLs in a
+    low-priority background pool. Returns the number of URLs queued.
+    """
+    if YTDLP_PREFETCH_FORMATS <= 0:
+        return 0
+
+    pool = get_thread_pool(
+        "formats-prefetch", YTDLP_PREFETCH_WORKERS, initializer=lower_thread_priority
+    )
+    queued = 0
+    for url in urls[:YTDLP_PREFETCH_FORMATS]:
+        key = _video_key(url)
+        with _formats_lock:
+            if (
+                key in _prefetch_queued
+                or key in _formats_inflight
+                or len(_prefetch_queued) >= YTDLP_PREFETCH_MAX_PENDING
+            ):
+                continue
+            _prefetch_queued.add(key)
+        if key in _formats_cache:
+            with _formats_lock:
+                _prefetch_queued.discard(key)
+            continue
+        pool.submit(_prefetch_one, url)
+        queued += 1
+    return queued
+
+
+def _extract_formats(url: str) -> QualityResponse:
     cookie_file = os.getenv("YTDLP_COOKIE_FILE", "")
 
     ydl_opts: dict = {
@@ -361,7 +527,7 @@ def get_formats(url: str) -> QualityResponse:
         ydl_opts["cookiefile"] = cookie_file
 
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        with _observe("formats"), yt_dlp.YoutubeDL(ydl_opts) as ydl:
             info = ydl.extract_info(url, download=False)
     except (yt_dlp.utils.DownloadError, yt_dlp.utils.ExtractorError) as e:
         raise Exception(f"yt-dlp error: {str(e)}")
@@ -405,70 +571,118 @@ def get_formats(url: str) -> QualityResponse:
     )
 
 
-def download(url: str, format_id: str, output_template: str) -> DownloadResponse:
-    download_dir = "/media"
-    os.makedirs(download_dir, exist_ok=True)
+def _download_tags(info: dict) -> dict:
+    """Map yt-dlp info fields to ffmpeg metadata keys."""
+    year = info.get("release_year") or (info.get("upload_date") or "")[:4]
+    return {
+        "title": info.get("track") or info.get("title"),
+        "artist": info.get("artist") or info.get("uploader"),
+        "album": info.get("album"),
+        "date": str(year) if year else None,
+        "track": info.get("track_number"),
+        "genre": info.get("genre"),
+    }
 
-    if ".." in output_template or "/" in output_template or "\\" in output_template:
-        return DownloadResponse(
-            success=False,
-            file_path="",
-            message="Invalid filename: path traversal not allowed",
-        )
-    outtmpl = os.path.join(download_dir, output_template)
 
-    ydl_opts: dict = {
-        "quiet": True,
-        "noplaylist": True,
-        "format": format_id,
-        "outtmpl": outtmpl,
-        "skip_download": False,
-    }
+def _written_thumbnail(info: dict) -> Optional[str]:
+    """Path of the thumbnail written next to the download by `writethumbnail`."""
+    for thumbnail in reversed(info.get("thumbnails") or []):
+        if thumbnail.get("filepath"):
+            return thumbnail["filepath"]
+    return None
 
-    cookie_file = os.getenv("YTDLP_COOKIE_FILE", "")
-    if cookie_file and Path(cookie_file).is_file():
-        ydl_opts["cookiefile"] = cookie_file
 
+def _reserve_library_path(file_name: str) -> str:
+    """
+    Claim a free name in DOWNLOAD_DIR with O_EXCL (an empty placeholder), so an
+    existing file – or a parallel download of the same title – is never
+    overwritten. Collisions get a " (1)", " (2)", ... suffix.
+    """
+    stem, ext = os.path.splitext(file_name)
+    for attempt in range(_PUBLISH_MAX_SUFFIX + 1):
+        name = f"{stem} ({attempt}){ext}" if attempt else file_name
+        path = os.path.join(DOWNLOAD_DIR, name)
+        try:
+            os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+        except FileExistsError:
+            continue
+        return path
+    raise FileExistsError(f"No free file name for {file_name} in {DOWNLOAD_DIR}")
+
+
+def _publish(staged_path: str) -> str:
+    """Atomically move a processed download into the library and index just that file."""
+    file_name = os.path.basename(staged_path)
+    final_path = _reserve_library_path(file_name)
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
-            final_path = ydl.prepare_filename(info)
-        # Change .webm extension to .opus for audio-only formats
-        if final_path.endswith(".webm"):
-            new_path = final_path[:-5] + ".opus"
-            os.rename(final_path, new_path)
-            final_path = new_path
-        return DownloadResponse(
-            success=True, file_path=final_path, message="Downloaded successfully"
+        os.replace(staged_path, final_path)
+    except OSError:
+        os.remove(final_path)
+        raise
+    if os.path.basename(final_path) != file_name:
+        logger.info(f"{file_name} already exists in {DOWNLOAD_DIR}, saved as {final_path}")
+    if catalog_service.upsert(final_path) is None:
+        logger.warning(
+            f"{final_path} is outside every MUSIC_DIR root and will not appear in the catalog; "
+            "point DOWNLOAD_DIR inside the library"
         )
-    except Exception as e:
-        return DownloadResponse(success=False, file_path="", message=str(e))
+    navidrome_service.notify_library_changed(final_path)
+    return final_path
 
 
-def download_with_progress(
+def _record_network_phases(
+    trace: tracing.Trace, phases: dict[str, float], network_end: float
+) -> None:
+    """
+    Split the yt-dlp call into extraction (metadata, signature solving), the
+    transfer itself and yt-dlp's own finishing steps (rename, thumbnail write).
+    """
+    transfer_start = phases.get("transfer_start", network_end)
+    transfer_end = phases.get("transfer_end", transfer_start)
+    trace.add_span("extract", trace.start, transfer_start)
+    if transfer_end > transfer_start:
+        trace.add_span("transfer", transfer_start, transfer_end)
+    if network_end > transfer_end:
+        trace.add_span("ytdlp_finalize", transfer_end, network_end)
+
+
+def start_download(
     url: str,
     format_id: str,
     output_template: str,
     progress_cb: Optional[Callable[[dict], None]] = None,
-) -> DownloadResponse:
+) -> Future:
     """
-    Synchronous download using yt-dlp with optional progress callback.
+    Run the network part of a download in the calling thread and hand the file
+    off to the post-processing pool. Returns a future resolving to DownloadResponse,
+    so the caller's worker is free for the next download while ffmpeg runs.
     progress_cb dostaje słowniki typu:
       {"status": "downloading", "downloaded": ..., "total": ..., "speed": ..., "eta": ..., "percent": ...}
       {"status": "finished", "filename": "..."}
     """
+    result: Future = Future()
+    trace = tracing.start_trace("download", url=url, format_id=format_id)
     cookie_file = os.getenv("YTDLP_COOKIE_FILE", "")
+    # znaczniki czasu faz z hooka yt-dlp (początek i koniec transferu)
+    phases: dict[str, float] = {}
 
-    download_dir = "/media"
-    os.makedirs(download_dir, exist_ok=True)
+    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+    os.makedirs(DOWNLOAD_STAGING_DIR, exist_ok=True)
 
     if ".." in output_template or "/" in output_template or "\\" in output_template:
-        return DownloadResponse(
-            success=False,
-            file_path="",
-            message="Invalid filename: path traversal not allowed",
+        trace.finish(error="Invalid filename")
+        result.set_result(
+            DownloadResponse(
+                success=False,
+                file_path="",
+                message="Invalid filename: path traversal not allowed",
+                trace_id=trace.trace_id,
+            )
         )
-    outtmpl = os.path.join(download_dir, output_template)
+        return result
+    # Osobny katalog na każde pobieranie – równoległe pobrania nie kolidują
+    staging_dir = tempfile.mkdtemp(dir=DOWNLOAD_STAGING_DIR)
+    outtmpl = os.path.join(staging_dir, output_template)
 
     def build_opts() -> dict:
         opts: dict = {
@@ -477,15 +691,20 @@ def download_with_progress(
             "format": format_id,
             "outtmpl": outtmpl,
             "skip_download": False,
+            "writethumbnail": postprocess_service.POSTPROCESS_EMBED_THUMBNAIL,
         }
 
         if cookie_file and Path(cookie_file).is_file():
             opts["cookiefile"] = cookie_file
 
-        if progress_cb:
+        def hook(d: dict):
+            status = d.get("status")
+            if status == "downloading":
+                phases.setdefault("transfer_start", time.time())
+            elif status == "finished":
+                phases["transfer_end"] = time.time()
 
-            def hook(d: dict):
-                status = d.get("status")
+            if progress_cb:
                 if status == "downloading":
                     downloaded = d.get("downloaded_bytes", 0) or 0
                     total = d.get("total_bytes") or d.get("total_bytes_estimate") or 0
@@ -511,30 +730,88 @@ def download_with_progress(
                         }
                     )
 
-            opts["progress_hooks"] = [hook]
+        opts["progress_hooks"] = [hook]
 
         return opts
 
     try:
         opts = build_opts()
-        with yt_dlp.YoutubeDL(opts) as ydl:
+        with (
+            _observe("download"),
+            JOBS_IN_FLIGHT.track_inprogress(kind="download"),
+            yt_dlp.YoutubeDL(opts) as ydl,
+        ):
             info = ydl.extract_info(url, download=True)
             file_path = ydl.prepare_filename(info)
-
-        # Change .webm extension to .opus for audio-only formats
-        if file_path.endswith(".webm"):
-            new_path = file_path[:-5] + ".opus"
-            os.rename(file_path, new_path)
-            file_path = new_path
-
-        return DownloadResponse(
-            success=True,
-            file_path=file_path,
-            message="Downloaded successfully",
+        network_end = time.time()
+        _record_network_phases(trace, phases, network_end)
+
+        processing_started = time.perf_counter()
+        processing = postprocess_service.submit(
+            file_path,
+            _download_tags(info),
+            thumbnail_path=_written_thumbnail(info),
+            acodec=info.get("acodec"),
+            trace=trace,
         )
+        # Dopiero po udanym submit – inaczej done() nigdy nie zmniejszy licznika
+        JOBS_IN_FLIGHT.inc(kind="postprocess")
     except Exception as e:
-        return DownloadResponse(
-            success=False,
-            file_path="",
-            message=str(e),
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        trace.finish(error=str(e))
+        result.set_result(
+            DownloadResponse(
+                success=False,
+                file_path="",
+                message=str(e),
+                trace_id=trace.trace_id,
+            )
+        )
+        return result
+
+    def done(processing: Future) -> None:
+        JOBS_IN_FLIGHT.dec(kind="postprocess")
+        YTDLP_SECONDS.observe(
+            time.perf_counter() - processing_started, operation="postprocess"
         )
+        try:
+            with trace.span("publish"):
+                final_path = _publish(processing.result())
+            trace.annotate(file_path=final_path)
+            trace.finish()
+            response = DownloadResponse(
+                success=True,
+                file_path=final_path,
+                message="Downloaded successfully",
+                trace_id=trace.trace_id,
+            )
+        except Exception as e:
+            trace.finish(error=str(e))
+            response = DownloadResponse(
+                success=False,
+                file_path="",
+                message=str(e),
+                trace_id=trace.trace_id,
+            )
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        result.set_result(response)
+
+    processing.add_done_callback(done)
+    return result
+
+
+def download(url: str, format_id: str, output_template: str) -> DownloadResponse:
+    return start_download(url, format_id, output_template).result()
+
+
+def download_with_progress(
+    url: str,
+    format_id: str,
+    output_template: str,
+    progress_cb: Optional[Callable[[dict], None]] = None,
+) -> DownloadResponse:
+    """
+    Synchronous download using yt-dlp with optional progress callback.
+    Blocks until post-processing has finished; see start_download for the event format.
+    """
+    return start_download(url, format_id, output_template, progress_cb).result()
@@ -0,0 +1,360 @@
+"""
+State shared by the worker processes of one server (`uvicorn --workers N`).
+
+Every worker keeps its own in-memory catalog, caches and job registry. With
+SHARED_STATE_DB set, the parts other workers need are mirrored in one SQLite
+database in WAL mode (readers never wait for the writer):
+
+- job snapshots – the worker running a job publishes its progress, status and
+  result, so any worker can list it, stream its events or cancel it;
+- the catalog change log – every change is appended and replayed by all
+  workers in order, so catalog generations (ETags, /api/files/changes) are the
+  same whichever worker answers;
+- cache entries by namespace (e.g. YouTube formats), with expiry.
+
+Worker liveness is a lock file each worker holds for its whole life: a job
+whose owner crashed is recognised at once, without heartbeats. Another lock
+elects one worker as the leader for periodic work (catalog rescans, scheduled
+integrity checks, resuming interrupted jobs).
+
+Without SHARED_STATE_DB (the default for a single worker) nothing is written
+and this process is always the leader.
+"""
+
+import fcntl
+import json
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+# Liczba workerów uvicorna (uvicorn czyta tę samą zmienną jako domyślne --workers)
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY") or "1")
+# Wspólna baza workerów; przy kilku workerach domyślnie w katalogu tymczasowym
+SHARED_STATE_DB = os.environ.get(
+    "SHARED_STATE_DB",
+    os.path.join(tempfile.gettempdir(), "navidrome-toolbox", "shared.db")
+    if WEB_CONCURRENCY > 1
+    else "",
+)
+# Ile ostatnich zmian katalogu trzymać w bazie – worker, który został dalej w tyle, wczytuje katalog od nowa
+SHARED_CATALOG_LOG_SIZE = int(os.environ.get("SHARED_CATALOG_LOG_SIZE", "10000"))
+
+# Identyfikator tego procesu w tabelach i nazwach plików blokad
+WORKER_ID = uuid.uuid4().hex[:16]
+
+_UNFINISHED = ("queued", "running")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    expires_at REAL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    version INTEGER NOT NULL,
+    cancel INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_kind ON jobs (kind, created_at);
+CREATE TABLE IF NOT EXISTS catalog_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    owner TEXT NOT NULL,
+    change TEXT NOT NULL
+);
+"""
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialised = False
+# Deskryptory trzymanych blokad – zamknięcie (albo śmierć procesu) je zwalnia
+_worker_fd: Optional[int] = None
+_leader_fd: Optional[int] = None
+
+
+def enabled() -> bool:
+    return bool(SHARED_STATE_DB)
+
+
+def _lock_path(name: str) -> str:
+    return os.path.join(SHARED_STATE_DB + ".locks", name)
+
+
+def _try_lock(path: str) -> Optional[int]:
+    """Take an exclusive flock on `path` without waiting; None if another process holds it."""
+    fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _init() -> None:
+    global _initialised, _worker_fd
+    with _init_lock:
+        if _initialised:
+            return
+        os.makedirs(SHARED_STATE_DB + ".locks", exist_ok=True)
+        _worker_fd = _try_lock(_lock_path(f"worker-{WORKER_ID}"))
+        conn = sqlite3.connect(SHARED_STATE_DB, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            # Numeracja zmian od czasu w ms – jak generacje katalogu bez wspólnej bazy,
+            # więc nowa baza nie wydaje numerów mniejszych niż znane klientom
+            conn.execute(
+                "INSERT INTO catalog_log (seq, owner, change) SELECT ?, '', '{}' "
+                "WHERE NOT EXISTS (SELECT 1 FROM catalog_log)",
+                (int(time.time() * 1000),),
+            )
+        finally:
+            conn.close()
+        _initialised = True
+
+
+def _db() -> sqlite3.Connection:
+    """Connection of the calling thread (sqlite3 connections are not shared between threads)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        _init()
+        conn = sqlite3.connect(SHARED_STATE_DB, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+    return conn
+
+
+@contextmanager
+def _transaction() -> Iterator[sqlite3.Connection]:
+    conn = _db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def owner_alive(owner: str) -> bool:
+    """Whether the worker `owner` is still running (it holds its lock file)."""
+    if owner == WORKER_ID:
+        return True
+    path = _lock_path(f"worker-{owner}")
+    if not os.path.exists(path):
+        return False
+    fd = _try_lock(path)
+    if fd is None:
+        return True
+    # Blokada była wolna – właściciel nie żyje, plik nie jest już potrzebny
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+    os.close(fd)
+    return False
+
+
+def is_leader() -> bool:
+    """
+    Whether this worker runs the periodic work. The first worker to ask becomes
+    the leader; when it exits, the next one to ask takes over.
+    """
+    global _leader_fd
+    if not enabled():
+        return True
+    _init()
+    with _init_lock:
+        if _leader_fd is None:
+            _leader_fd = _try_lock(_lock_path("leader"))
+        return _leader_fd is not None
+
+
+# --- cache ---
+
+
+def cache_get(namespace: str, key: str) -> Optional[tuple[Any, Optional[float]]]:
+    """(value, expires_at as time.time()) of a live entry, or None."""
+    row = (
+        _db()
+        .execute(
+            "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ? "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (namespace, key, time.time()),
+        )
+        .fetchone()
+    )
+    if row is None:
+        return None
+    return pickle.loads(row[0]), row[1]
+
+
+def cache_set(namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+    """Store an entry for `ttl` seconds (forever without `ttl`); expired ones are dropped here."""
+    now = time.time()
+    with _transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, pickle.dumps(value), now + ttl if ttl else None),
+        )
+        conn.execute("DELETE FROM cache WHERE namespace = ? AND expires_at <= ?", (namespace, now))
+
+
+def cache_delete(namespace: str, key: str) -> None:
+    _db().execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key))
+
+
+def cache_items(namespace: str) -> list[tuple[str, Any]]:
+    rows = _db().execute(
+        "SELECT key, value FROM cache WHERE namespace = ? AND (expires_at IS NULL OR expires_at > ?)",
+        (namespace, time.time()),
+    )
+    return [(key, pickle.loads(value)) for key, value in rows]
+
+
+# --- jobs ---
+
+
+def _job_row(row: tuple) -> dict:
+    owner, status, version, cancel, data = row
+    return {
+        "owner": owner,
+        "version": version,
+        "cancel": bool(cancel),
+        # Niedokończone zadanie martwego workera nigdy się nie skończy
+        "orphaned": status in _UNFINISHED and not owner_alive(owner),
+        "data": json.loads(data),
+    }
+
+
+_JOB_COLUMNS = "owner, status, version, cancel, data"
+
+
+def claim_job(job_id: str, kind: str, created_at: float, data: dict, exclusive: bool) -> Optional[dict]:
+    """
+    Register a new job of this worker. With `exclusive`, an unfinished job of
+    the same kind in a live worker is returned instead and nothing is registered.
+    """
+    with _transaction() as conn:
+        if exclusive:
+            rows = conn.execute(
+                f"SELECT {_JOB_COLUMNS} FROM jobs WHERE kind = ? AND status IN (?, ?)",
+                (kind, *_UNFINISHED),
+            ).fetchall()
+            for row in rows:
+                if row[0] != WORKER_ID and owner_alive(row[0]):
+                    return _job_row(row)
+        conn.execute(
+            "INSERT INTO jobs (job_id, kind, owner, status, created_at, version, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, WORKER_ID, data["status"], created_at, -1, json.dumps(data, default=str)),
+        )
+    return None
+
+
+def publish_job(
+    job_id: str, version: int, data: dict, result: Any = None, keep: Optional[int] = None
+) -> None:
+    """
+    Update the snapshot of a job of this worker. Older versions never overwrite
+    newer ones. With `keep`, only that many finished jobs stay in the database.
+    """
+    with _transaction() as conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, version = ?, data = ?, result = ? "
+            "WHERE job_id = ? AND version <= ?",
+            (
+                data["status"],
+                version,
+                json.dumps(data, default=str),
+                None if result is None else json.dumps(result, default=str),
+                job_id,
+                version,
+            ),
+        )
+        if keep is not None:
+            conn.execute(
+                "DELETE FROM jobs WHERE status NOT IN (?, ?) AND job_id NOT IN ("
+                "SELECT job_id FROM jobs WHERE status NOT IN (?, ?) ORDER BY created_at DESC LIMIT ?)",
+                (*_UNFINISHED, *_UNFINISHED, keep),
+            )
+
+
+def load_job(job_id: str) -> Optional[dict]:
+    row = _db().execute(f"SELECT {_JOB_COLUMNS} FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    return _job_row(row) if row else None
+
+
+def load_jobs(kind: Optional[str] = None, limit: int = 50) -> list[dict]:
+    """Unfinished jobs first, then finished ones, newest first."""
+    rows = _db().execute(
+        f"SELECT {_JOB_COLUMNS} FROM jobs WHERE ? IS NULL OR kind = ? "
+        "ORDER BY status IN (?, ?) DESC, created_at DESC LIMIT ?",
+        (kind, kind, *_UNFINISHED, limit),
+    )
+    return [_job_row(row) for row in rows]
+
+
+def job_result(job_id: str) -> Any:
+    row = _db().execute("SELECT result FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    return json.loads(row[0]) if row and row[0] is not None else None
+
+
+def request_cancel(job_id: str) -> None:
+    """Flag a job for cancellation; its worker picks the flag up on its next publish."""
+    _db().execute("UPDATE jobs SET cancel = 1 WHERE job_id = ?", (job_id,))
+
+
+def cancel_requests() -> list[str]:
+    """IDs of unfinished jobs of this worker that another worker asked to cancel."""
+    rows = _db().execute(
+        "SELECT job_id FROM jobs WHERE owner = ? AND cancel = 1 AND status IN (?, ?)",
+        (WORKER_ID, *_UNFINISHED),
+    )
+    return [job_id for (job_id,) in rows]
+
+
+# --- catalog change log ---
+
+
+def append_change(change: dict) -> int:
+    """Log a catalog change; returns its sequence number (the new catalog generation)."""
+    with _transaction() as conn:
+        seq = conn.execute(
+            "INSERT INTO catalog_log (owner, change) VALUES (?, ?)",
+            (WORKER_ID, json.dumps(change, separators=(",", ":"))),
+        ).lastrowid
+        if seq % 100 == 0:
+            conn.execute("DELETE FROM catalog_log WHERE seq <= ?", (seq - SHARED_CATALOG_LOG_SIZE,))
+    return seq
+
+
+def latest_change() -> int:
+    return _db().execute("SELECT MAX(seq) FROM catalog_log").fetchone()[0]
+
+
+def changes_after(seq: int) -> Optional[list[tuple[int, dict]]]:
+    """Changes logged after `seq`, in order; None when some of them were already trimmed."""
+    conn = _db()
+    rows = conn.execute(
+        "SELECT seq, change FROM catalog_log WHERE seq > ? ORDER BY seq", (seq,)
+    ).fetchall()
+    if rows and rows[0][0] > seq + 1:
+        oldest = conn.execute("SELECT MIN(seq) FROM catalog_log").fetchone()[0]
+        if oldest > seq + 1:
+            return None
+    return [(number, json.loads(change)) for number, change in rows]
@@ -0,0 +1,209 @@
+"""
+Lightweight per-request tracing kept in an in-memory ring buffer.
+
+A trace covers one operation (search, formats, playlist, download) and holds
+timed spans for its phases. Span times are wall-clock epochs so phases measured
+in worker processes line up with the ones measured in the API process.
+"""
+
+import functools
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+TRACE_BUFFER_SIZE = int(os.environ.get("TRACE_BUFFER_SIZE", "500"))
+
+
+class Span:
+    __slots__ = ("name", "start", "end", "attributes")
+
+    def __init__(self, name: str, start: float, end: Optional[float] = None, **attributes):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.attributes = attributes
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+
+class Trace:
+    def __init__(self, operation: str, **attributes):
+        self.trace_id = uuid.uuid4().hex
+        self.operation = operation
+        self.attributes = attributes
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.status = "running"
+        self.error: Optional[str] = None
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+    def annotate(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def add_span(self, name: str, start: float, end: float, **attributes) -> None:
+        """Record a phase measured elsewhere (another thread or process)."""
+        with self._lock:
+            self.spans.append(Span(name, start, end, **attributes))
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        span = Span(name, time.time(), **attributes)
+        with self._lock:
+            self.spans.append(span)
+        try:
+            yield span
+        except Exception as e:
+            span.attributes["error"] = str(e)
+            raise
+        finally:
+            span.end = time.time()
+
+    def finish(self, error: Optional[str] = None) -> None:
+        if self.end is not None:
+            return
+        self.end = time.time()
+        self.status = "error" if error else "ok"
+        self.error = error
+        _store(self)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s.start)
+        return {
+            "trace_id": self.trace_id,
+            "operation": self.operation,
+            "status": self.status,
+            "error": self.error,
+            "started_at": self.start,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": {k: v for k, v in self.attributes.items() if v is not None},
+            "spans": [
+                {
+                    "name": span.name,
+                    "offset_ms": round((span.start - self.start) * 1000, 3),
+                    "duration_ms": round(span.duration * 1000, 3),
+                    "attributes": span.attributes,
+                }
+                for span in spans
+            ],
+        }
+
+
+_current: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_buffer: deque[Trace] = deque(maxlen=TRACE_BUFFER_SIZE)
+_active: dict[str, Trace] = {}
+_buffer_lock = threading.Lock()
+
+
+def _store(trace: Trace) -> None:
+    with _buffer_lock:
+        _active.pop(trace.trace_id, None)
+        _buffer.append(trace)
+
+
+def start_trace(operation: str, **attributes) -> Trace:
+    """Begin a trace that is finished explicitly, possibly from another thread."""
+    trace = Trace(operation, **attributes)
+    with _buffer_lock:
+        _active[trace.trace_id] = trace
+    return trace
+
+
+def current() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def trace(operation: str, **attributes):
+    """
+    Trace the enclosed block and make it the current trace.
+    Inside another trace this only adds a span, so nested helpers don't split traces.
+    """
+    parent = _current.get()
+    if parent is not None:
+        with parent.span(operation, **attributes):
+            yield parent
+        return
+
+    new = start_trace(operation, **attributes)
+    token = _current.set(new)
+    try:
+        yield new
+    except Exception as e:
+        new.finish(error=str(e))
+        raise
+    else:
+        new.finish()
+    finally:
+        _current.reset(token)
+
+
+def traced(operation: str) -> Callable:
+    """Decorator form of `trace`."""
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with trace(operation):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a phase of the current trace; a no-op when nothing is being traced."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    with parent.span(name, **attributes) as s:
+        yield s
+
+
+def annotate(**attributes) -> None:
+    """Attach attributes to the current trace, if any."""
+    parent = _current.get()
+    if parent is not None:
+        parent.annotate(**attributes)
+
+
+def get_trace(trace_id: str) -> Optional[Trace]:
+    with _buffer_lock:
+        if trace_id in _active:
+            return _active[trace_id]
+        return next((t for t in _buffer if t.trace_id == trace_id), None)
+
+
+def list_traces(
+    operation: Optional[str] = None,
+    order: str = "slowest",
+    limit: int = 20,
+    include_running: bool = False,
+) -> list[Trace]:
+    """Recent finished traces, newest first or slowest first."""
+    with _buffer_lock:
+        traces = list(_buffer)
+        if include_running:
+            traces.extend(_active.values())
+    if operation:
+        traces = [t for t in traces if t.operation == operation]
+    if order == "slowest":
+        traces.sort(key=lambda t: t.duration, reverse=True)
+    else:
+        traces.sort(key=lambda t: t.start, reverse=True)
+    return traces[:limit]
@@ -0,0 +1,149 @@
+"""
+File service benchmark on a synthetic library.
+
+Generates (or reuses) a library with benchmarks.library_generator, then times
+the hot paths of the Files API and writes comparable JSON results:
+
+    python -m benchmarks.bench_file_service --size 10000 --output before.json
+    python -m benchmarks.bench_file_service --size 10000 --compare before.json
+
+With --compare the run exits with status 1 when any case got slower than the
+baseline median by more than --threshold.
+"""
+
+import argparse
+import gc
+import os
+import sys
+import tempfile
+import time
+from typing import Callable
+
+from benchmarks.common import compare, report, summarize, write_json
+from benchmarks.library_generator import FORMATS, generate_library
+
+
+def measure(func: Callable[[], object], repeat: int, ops: int = 1, warmup: int = 1) -> dict:
+    """Run `func` `repeat` times; `ops` is how many operations one call covers."""
+    for _ in range(warmup):
+        func()
+    timings = []
+    gc.collect()
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    summary = summarize(timings)
+    median = summary["median_s"]
+    return {
+        "repeat": repeat,
+        "ops_per_call": ops,
+        **summary,
+        "ops_per_s": round(ops / median, 1) if median else None,
+    }
+
+
+def run(library: str, repeat: int, sample: int) -> dict:
+    # MUSIC_DIR jest czytany przy imporcie, więc ustawiamy go przed importem aplikacji
+    os.environ["MUSIC_DIR"] = library
+    os.environ.setdefault("CATALOG_REFRESH_INTERVAL", "3600")
+    from app.services import catalog_service, file_service
+
+    results: dict[str, dict] = {}
+    paths = file_service.scan_music_directory(library)
+    by_format: dict[str, list[str]] = {}
+    for path in paths:
+        by_format.setdefault(os.path.splitext(path)[1].lower(), []).append(path)
+
+    results["scan_music_directory"] = measure(
+        lambda: file_service.scan_music_directory(library), repeat, ops=len(paths)
+    )
+
+    for ext, files in sorted(by_format.items()):
+        chosen = files[:sample]
+        results[f"extract_metadata[{ext}]"] = measure(
+            lambda chosen=chosen: [file_service.extract_metadata(p) for p in chosen],
+            repeat,
+            ops=len(chosen),
+        )
+
+    covered = [p for p in paths[: sample * 4] if file_service.get_cover_art(p)][:sample]
+    if covered:
+        results["get_cover_art"] = measure(
+            lambda: [file_service.get_cover_art(p) for p in covered], repeat, ops=len(covered)
+        )
+
+    def cold_catalog():
+        catalog_service.clear()
+        file_service.list_files(offset=0, limit=50)
+
+    # Pełne parsowanie biblioteki jest drogie – mniej powtórzeń
+    results["list_files[cold]"] = measure(cold_catalog, max(1, repeat // 5), ops=len(paths), warmup=0)
+    cold_catalog()
+
+    results["list_files[first_page]"] = measure(
+        lambda: file_service.list_files(offset=0, limit=50), repeat
+    )
+    last_page = max(0, len(paths) - 50)
+    results["list_files[last_page]"] = measure(
+        lambda: file_service.list_files(offset=last_page, limit=50), repeat
+    )
+    results["list_files[page_1000]"] = measure(
+        lambda: file_service.list_files(offset=0, limit=1000), repeat
+    )
+
+    entries = catalog_service.query()
+    common_word = (entries[len(entries) // 2].get("artist") or "night").split()[0]
+    results["list_files[search_common]"] = measure(
+        lambda: file_service.list_files(offset=0, limit=50, search=common_word), repeat
+    )
+    results["list_files[search_miss]"] = measure(
+        lambda: file_service.list_files(offset=0, limit=50, search="zzqx-no-match"), repeat
+    )
+
+    ids = [entries[i]["id"] for i in range(0, len(entries), max(1, len(entries) // sample))]
+    results["get_file_by_id"] = measure(
+        lambda: [file_service.get_file_by_id(i) for i in ids], repeat, ops=len(ids)
+    )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--library", help="Library directory (default: temp dir keyed by size/seed)")
+    parser.add_argument("--size", type=int, default=1000, help="Tracks to generate (1k-500k)")
+    parser.add_argument("--formats", default=",".join(FORMATS))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--cover-size", type=int, default=128)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--sample", type=int, default=200, help="Files per per-file case")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown, 0.2 = 20%%")
+    args = parser.parse_args()
+
+    formats = tuple(f if f.startswith(".") else f".{f}" for f in args.formats.split(","))
+    library = args.library or os.path.join(
+        tempfile.gettempdir(), "navidrome-toolbox-bench", f"library-{args.size}-{args.seed}"
+    )
+    manifest = generate_library(
+        library, args.size, formats=formats, seed=args.seed, cover_size=args.cover_size
+    )
+
+    results = run(library, args.repeat, args.sample)
+    regressions = compare(results, args.compare, args.threshold) if args.compare else []
+
+    for name, r in results.items():
+        extra = f"  x{r['vs_baseline']}" if "vs_baseline" in r else ""
+        print(f"{name:32} median {r['median_s'] * 1000:10.3f} ms  p95 {r['p95_s'] * 1000:10.3f} ms{extra}")
+
+    if args.output:
+        write_json(args.output, report("file_service", results, library=manifest))
+
+    if regressions:
+        print("\nRegressions:\n  " + "\n  ".join(regressions), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
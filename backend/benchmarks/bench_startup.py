@@ -0,0 +1,146 @@
+"""
+Cold-start benchmark: import time of the app and time to the first /health.
+
+Every measurement runs in a fresh interpreter, so nothing is cached in
+sys.modules (the OS file cache stays warm – the first run is a warm-up):
+
+    python -m benchmarks.bench_startup --output before.json
+    python -m benchmarks.bench_startup --compare before.json
+
+Cases:
+    import[fastapi]   – the framework alone, the floor the app cannot go below
+    import[app.main]  – everything imported before uvicorn can serve
+    first_health      – process start to the first 200 from /health (uvicorn)
+
+The run also lists heavy modules (HEAVY_MODULES) that `import app.main`
+pulled in; any of them, or a case slower than the baseline median by more
+than --threshold, exits with status 1.
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from benchmarks.common import compare, report, summarize, write_json
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Moduły, które app.lazy importuje dopiero przy pierwszym użyciu
+HEAVY_MODULES = ("yt_dlp", "numpy", "mutagen")
+
+_IMPORT_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "modules": len(sys.modules),
+                  "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def _env(library: str) -> dict:
+    env = dict(os.environ)
+    env.update(MUSIC_DIR=library, CATALOG_WARM_UP="0", PYTHONPATH=BACKEND_DIR)
+    env.pop("WEB_CONCURRENCY", None)
+    return env
+
+
+def measure_import(module: str, repeat: int, library: str) -> tuple[dict, dict]:
+    """Import `module` in `repeat` fresh interpreters; returns (summary, last child report)."""
+    script = _IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES)
+    timings = []
+    child = {}
+    for _ in range(repeat + 1):
+        completed = subprocess.run(
+            [sys.executable, "-c", script],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=BACKEND_DIR,
+            env=_env(library),
+        )
+        child = json.loads(completed.stdout.strip().splitlines()[-1])
+        timings.append(child["seconds"])
+    return summarize(timings[1:]), child
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_first_health(repeat: int, library: str, timeout: float = 30) -> dict:
+    """Start uvicorn `repeat` times and time the first successful /health."""
+    timings = []
+    for _ in range(repeat + 1):
+        port = _free_port()
+        started = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=BACKEND_DIR,
+            env=_env(library),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            while True:
+                if time.perf_counter() - started > timeout:
+                    raise RuntimeError(f"/health did not answer within {timeout:.0f}s")
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                        if response.status == 200:
+                            break
+                except OSError:
+                    time.sleep(0.005)
+            timings.append(time.perf_counter() - started)
+        finally:
+            server.terminate()
+            server.wait()
+    return summarize(timings[1:])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repeat", type=int, default=10, help="Fresh interpreters per import case")
+    parser.add_argument("--health-repeat", type=int, default=5, help="uvicorn starts for first_health")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown, 0.2 = 20%%")
+    args = parser.parse_args()
+
+    # Pusta biblioteka – mierzymy start aplikacji, nie skan
+    library = tempfile.mkdtemp(prefix="navidrome-toolbox-startup-")
+    results: dict[str, dict] = {}
+    results["import[fastapi]"], _ = measure_import("fastapi", args.repeat, library)
+    results["import[app.main]"], child = measure_import("app.main", args.repeat, library)
+    results["import[app.main]"]["modules"] = child["modules"]
+    if args.health_repeat:
+        results["first_health"] = measure_first_health(args.health_repeat, library)
+    os.rmdir(library)
+
+    regressions = compare(results, args.compare, args.threshold) if args.compare else []
+    if child["heavy"]:
+        regressions.append(f"import app.main loads heavy modules eagerly: {', '.join(child['heavy'])}")
+
+    for name, r in results.items():
+        extra = f"  x{r['vs_baseline']}" if "vs_baseline" in r else ""
+        print(f"{name:20} median {r['median_s'] * 1000:9.1f} ms  p95 {r['p95_s'] * 1000:9.1f} ms{extra}")
+    print(f"modules after import app.main: {child['modules']}, eager heavy: {child['heavy'] or 'none'}")
+
+    if args.output:
+        write_json(args.output, report("startup", results, heavy_modules=child["heavy"]))
+
+    if regressions:
+        print("\nRegressions:\n  " + "\n  ".join(regressions), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
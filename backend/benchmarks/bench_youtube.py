@@ -0,0 +1,314 @@
+"""
+Download pipeline throughput benchmark against the offline YouTube stand-in.
+
+Drives search_youtube, get_formats and download_with_progress directly, and
+/api/youtube/query, /api/youtube/formats and /api/youtube/download/stream over
+HTTP (the app runs under uvicorn in this process), with N concurrent clients:
+
+    python -m benchmarks.bench_youtube --clients 1,4,16 --output before.json
+    python -m benchmarks.bench_youtube --clients 1,4,16 --compare before.json
+
+HTTP scenarios also report event-loop lag: how late a 10 ms timer on the
+server loop fires while the clients are running.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from benchmarks.common import compare, report, summarize, write_json
+
+SCENARIOS = ("search", "formats", "download", "http_query", "http_formats", "http_stream")
+LAG_INTERVAL = 0.01
+
+
+class LoopLagProbe:
+    """Samples how late a periodic timer fires on the server's event loop."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.samples: list[float] = []
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            started = self.loop.time()
+            await asyncio.sleep(LAG_INTERVAL)
+            self.samples.append(max(0.0, self.loop.time() - started - LAG_INTERVAL))
+
+    def start(self) -> None:
+        """Create the sampling task on the server loop and wait until it exists."""
+        self.samples = []
+
+        async def create():
+            self._task = asyncio.create_task(self._run())
+
+        asyncio.run_coroutine_threadsafe(create(), self.loop).result(timeout=10)
+
+    def stop(self) -> list[float]:
+        if self._task is not None:
+            self.loop.call_soon_threadsafe(self._task.cancel)
+            self._task = None
+        return list(self.samples)
+
+
+class ApiServer:
+    """The FastAPI app under uvicorn on its own thread and event loop."""
+
+    def __init__(self, app):
+        import uvicorn
+
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.url = "http://127.0.0.1:%d" % self.sock.getsockname()[1]
+        self.loop = asyncio.new_event_loop()
+        self.server = uvicorn.Server(
+            uvicorn.Config(app, log_level="warning", lifespan="off", loop="asyncio")
+        )
+        self.thread = threading.Thread(target=self._serve, name="bench-uvicorn", daemon=True)
+
+    def _serve(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.server.serve(sockets=[self.sock]))
+
+    def start(self) -> "ApiServer":
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def run_clients(clients: int, per_client: int, op: Callable[[int, int], bool]) -> dict:
+    """Run `op(client, request)` from `clients` threads; collect latency and errors."""
+    latencies: list[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def client(index: int) -> None:
+        nonlocal errors
+        for request in range(per_client):
+            started = time.perf_counter()
+            try:
+                ok = op(index, request)
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(client, range(clients)))
+    wall = time.perf_counter() - started
+    total = clients * per_client
+    return {
+        "clients": clients,
+        "requests": total,
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_ops_s": round(total / wall, 2) if wall else None,
+        **summarize(latencies),
+    }
+
+
+def _post_json(url: str, payload: dict, timeout: float = 300):
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    return urllib.request.urlopen(request, timeout=timeout)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", default="1,4,16", help="Comma-separated client counts")
+    parser.add_argument("--requests", type=int, default=4, help="Requests per client")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--bitrates", default="64,128,160", help="Offered formats in kbps")
+    parser.add_argument("--download-kbps", type=int, default=128)
+    parser.add_argument("--duration", type=float, default=60, help="Track length in seconds")
+    parser.add_argument("--rate-limit", type=int, default=0, help="Media server bytes/s per connection")
+    parser.add_argument("--latency", type=float, default=0.0, help="Media server response latency (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of media requests failing")
+    parser.add_argument("--extract-latency", type=float, default=0.1, help="Simulated video page fetch (s)")
+    parser.add_argument("--search-latency", type=float, default=0.3, help="Simulated search fetch (s)")
+    parser.add_argument("--extract-error-rate", type=float, default=0.0)
+    parser.add_argument("--loudnorm", action="store_true", help="Re-encode with loudnorm in post-processing")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown, 0.2 = 20%%")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="navidrome-toolbox-bench-")
+    library = os.path.join(workdir, "library")
+    os.makedirs(library)
+    # Konfiguracja aplikacji jest czytana przy imporcie
+    os.environ.update(
+        {
+            "DOWNLOAD_DIR": library,
+            "MUSIC_DIR": library,
+            "NAVIDROME_URL": "",
+            "THUMBNAIL_CACHE_DIR": os.path.join(workdir, "thumbnails"),
+            "POSTPROCESS_LOUDNORM": "1" if args.loudnorm else "0",
+            "CATALOG_REFRESH_INTERVAL": "3600",
+        }
+    )
+
+    from benchmarks.offline_youtube import MediaServer, install
+
+    media = MediaServer(
+        rate_limit=args.rate_limit,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        duration=args.duration,
+    ).start()
+    install(
+        media,
+        bitrates=tuple(int(b) for b in args.bitrates.split(",")),
+        extract_latency=args.extract_latency,
+        search_latency=args.search_latency,
+        extract_error_rate=args.extract_error_rate,
+    )
+
+    from app.main import app
+    from app.services import youtube_service
+    from app.services.executors import shutdown_pools
+
+    api = ApiServer(app).start()
+    probe = LoopLagProbe(api.loop)
+    format_id = f"mp3-{args.download_kbps}"
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    results: dict[str, dict] = {}
+    # Każde żądanie dostaje unikalny film, więc cache formatów nie zawyża wyników
+    counter = iter(range(10**9))
+    counter_lock = threading.Lock()
+
+    def next_url() -> str:
+        from benchmarks.offline_youtube import video_id
+
+        with counter_lock:
+            n = next(counter)
+        return f"https://www.youtube.com/watch?v={video_id(f'bench-{n}')}"
+
+    def search(client: int, request: int) -> bool:
+        results, _ = youtube_service.search_youtube(f"query {client} {request}", 10)
+        return len(results) == 10
+
+    def formats(client: int, request: int) -> bool:
+        return bool(youtube_service.get_formats(next_url()).formats)
+
+    def download(client: int, request: int) -> bool:
+        events = []
+        response = youtube_service.download_with_progress(
+            next_url(), format_id, "%(title)s.%(ext)s", events.append
+        )
+        return response.success
+
+    def http_query(client: int, request: int) -> bool:
+        query = urllib.parse.urlencode({"q": f"query {client} {request}", "limit": 10})
+        with urllib.request.urlopen(f"{api.url}/api/youtube/query?{query}", timeout=60) as r:
+            return json.load(r)["count"] == 10
+
+    def http_formats(client: int, request: int) -> bool:
+        with _post_json(f"{api.url}/api/youtube/formats", {"url": next_url()}) as r:
+            return bool(json.load(r)["formats"])
+
+    first_event: list[float] = []
+
+    def http_stream(client: int, request: int) -> bool:
+        started = time.perf_counter()
+        payload = {
+            "url": next_url(),
+            "format_id": format_id,
+            "output_template": "%(title)s.%(ext)s",
+        }
+        with _post_json(f"{api.url}/api/youtube/download/stream", payload) as r:
+            seen_first = False
+            for raw in r:
+                line = raw.decode().strip()
+                if not line.startswith("data: "):
+                    continue
+                if not seen_first:
+                    first_event.append(time.perf_counter() - started)
+                    seen_first = True
+                event = json.loads(line[6:])
+                if event.get("status") == "complete":
+                    return bool(event.get("success"))
+                if event.get("status") == "error":
+                    return False
+        return False
+
+    ops = {
+        "search": search,
+        "formats": formats,
+        "download": download,
+        "http_query": http_query,
+        "http_formats": http_formats,
+        "http_stream": http_stream,
+    }
+
+    try:
+        for scenario in scenarios:
+            for clients in (int(c) for c in args.clients.split(",")):
+                name = f"{scenario}[c={clients}]"
+                bytes_before = media.bytes_sent
+                first_event.clear()
+                if scenario.startswith("http_"):
+                    probe.start()
+                result = run_clients(clients, args.requests, ops[scenario])
+                if scenario.startswith("http_"):
+                    lag = summarize(probe.stop())
+                    result["loop_lag"] = {k: v for k, v in lag.items() if k != "mean_s"}
+                if scenario in ("download", "http_stream"):
+                    transferred = media.bytes_sent - bytes_before
+                    result["mb_s"] = round(transferred / result["wall_s"] / 1e6, 2)
+                if first_event:
+                    result["first_event"] = summarize(first_event)
+                results[name] = result
+                # Krótki scenariusz może się skończyć przed pierwszym pomiarem opóźnienia
+                lag_text = (
+                    f"  lag p99 {result['loop_lag']['p99_s'] * 1000:8.1f} ms"
+                    if result.get("loop_lag", {}).get("count")
+                    else ""
+                )
+                print(
+                    f"{name:22} {result['throughput_ops_s']:8.2f} ops/s  "
+                    f"p50 {result['median_s'] * 1000:9.1f} ms  p95 {result['p95_s'] * 1000:9.1f} ms  "
+                    f"errors {result['errors']}{lag_text}"
+                )
+    finally:
+        api.stop()
+        shutdown_pools(wait=True)
+        media.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    regressions = compare(results, args.compare, args.threshold) if args.compare else []
+    if args.output:
+        meta = {k: v for k, v in vars(args).items() if k not in ("output", "compare")}
+        write_json(args.output, report("youtube", results, config=meta))
+    if regressions:
+        print("\nRegressions:\n  " + "\n  ".join(regressions), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
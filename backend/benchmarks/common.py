@@ -0,0 +1,83 @@
+"""Helpers shared by the benchmark scripts: timing summaries, metadata and baselines."""
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from typing import Optional
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def summarize(timings: list[float]) -> dict:
+    """min/median/p95/p99/max/mean of a list of durations in seconds."""
+    values = sorted(timings)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "min_s": round(values[0], 6),
+        "median_s": round(statistics.median(values), 6),
+        "p95_s": round(percentile(values, 0.95), 6),
+        "p99_s": round(percentile(values, 0.99), 6),
+        "max_s": round(values[-1], 6),
+        "mean_s": round(statistics.fmean(values), 6),
+    }
+
+
+def report(benchmark: str, results: dict, **meta) -> dict:
+    return {
+        "meta": {
+            "benchmark": benchmark,
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            **meta,
+        },
+        "results": results,
+    }
+
+
+def compare(results: dict, baseline_path: str, threshold: float, key: str = "median_s") -> list[str]:
+    """
+    Annotate results with `vs_baseline` and return the cases whose `key`
+    got worse than the baseline by more than `threshold`.
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    for name, current in results.items():
+        before = (baseline.get(name) or {}).get(key)
+        if not before or current.get(key) is None:
+            continue
+        ratio = current[key] / before
+        current["vs_baseline"] = round(ratio, 3)
+        if ratio > 1 + threshold:
+            regressions.append(f"{name}: {ratio:.2f}x slower ({before}s -> {current[key]}s)")
+    return regressions
+
+
+def write_json(path: str, data: dict) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
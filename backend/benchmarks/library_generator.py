@@ -0,0 +1,488 @@
+"""
+Synthetic tagged music library generator for benchmarks.
+
+Builds minimal but valid containers for every extension in SUPPORTED_EXTENSIONS
+in pure Python (no ffmpeg needed), then writes realistic tags and embedded
+covers with mutagen. Audio payloads are tiny; durations come from container
+headers, so a 500k-track library stays small on disk.
+
+    python -m benchmarks.library_generator /tmp/library --size 10000
+"""
+
+import argparse
+import base64
+import json
+import os
+import random
+import struct
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from mutagen.asf import ASF
+from mutagen.asf._util import guid2bytes
+from mutagen.flac import FLAC, Picture
+from mutagen.id3 import APIC, TALB, TCON, TDRC, TIT2, TPE1, TRCK
+from mutagen.mp3 import MP3
+from mutagen.mp4 import MP4, MP4Cover
+from mutagen.ogg import OggPage
+from mutagen.oggopus import OggOpus
+from mutagen.oggvorbis import OggVorbis
+from mutagen.wave import WAVE
+
+FORMATS = (".mp3", ".flac", ".m4a", ".aac", ".ogg", ".opus", ".wma", ".wav")
+MANIFEST = ".benchmark-library.json"
+
+_WORDS = (
+    "night day blue red black white golden silver summer winter river ocean "
+    "fire rain storm light shadow dream heart love lost found city road home "
+    "star moon sun wild quiet electric broken velvet neon paper glass stone "
+    "echo signal horizon midnight morning ghost angel machine garden desert"
+).split()
+_GENRES = (
+    "Rock", "Pop", "Jazz", "Electronic", "Hip-Hop", "Classical", "Metal",
+    "Folk", "Ambient", "Soul", "Punk", "Blues", "Reggae", "Techno",
+)
+
+
+# --- Minimalne kontenery audio ---
+
+
+def _mp3_template(duration: float) -> bytes:
+    """MPEG-1 Layer III frames with a Xing header announcing the full length."""
+    header = b"\xff\xfb\x90\x64"  # 128 kbps, 44.1 kHz, joint stereo
+    frame_size = 417
+    frames = max(1, int(duration * 44100 / 1152))
+    xing = bytearray(frame_size)
+    xing[:4] = header
+    xing[36:40] = b"Xing"
+    xing[40:44] = struct.pack(">I", 0x3)  # frames + bytes
+    xing[44:48] = struct.pack(">I", frames)
+    xing[48:52] = struct.pack(">I", frames * frame_size)
+    silent = header + bytes(frame_size - 4)
+    return bytes(xing) + silent * 8
+
+
+def _flac_template(duration: float) -> bytes:
+    sample_rate, channels, bits = 44100, 2, 16
+    total_samples = int(duration * sample_rate)
+    packed = (
+        (sample_rate << 44)
+        | ((channels - 1) << 41)
+        | ((bits - 1) << 36)
+        | total_samples
+    )
+    streaminfo = (
+        struct.pack(">HH", 4096, 4096)
+        + bytes(6)  # min/max frame size (nieznane)
+        + packed.to_bytes(8, "big")
+        + bytes(16)  # MD5
+    )
+    block_header = bytes([0x80]) + len(streaminfo).to_bytes(3, "big")
+    return b"fLaC" + block_header + streaminfo + bytes(64)
+
+
+def _atom(kind: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I", 8 + len(payload)) + kind + payload
+
+
+def _mp4_template(duration: float) -> bytes:
+    timescale = 44100
+    length = int(duration * timescale)
+    mvhd = _atom(
+        b"mvhd",
+        bytes(4) + struct.pack(">IIII", 0, 0, timescale, length) + bytes(80),
+    )
+    tkhd = _atom(b"tkhd", b"\x00\x00\x00\x07" + bytes(8) + struct.pack(">I", 1) + bytes(68))
+    mdhd = _atom(
+        b"mdhd", bytes(4) + struct.pack(">IIII", 0, 0, timescale, length) + bytes(4)
+    )
+    hdlr = _atom(b"hdlr", bytes(8) + b"soun" + bytes(12) + b"SoundHandler\x00")
+    esds = _atom(
+        b"esds",
+        bytes(4)
+        + b"\x03\x19\x00\x01\x00"
+        + b"\x04\x11\x40\x15"
+        + bytes(3)
+        + struct.pack(">II", 256000, 256000)
+        + b"\x05\x02\x12\x10"
+        + b"\x06\x01\x02",
+    )
+    mp4a = _atom(
+        b"mp4a",
+        bytes(6)
+        + struct.pack(">H", 1)
+        + bytes(8)
+        + struct.pack(">HHHH", 2, 16, 0, 0)
+        + struct.pack(">I", timescale << 16)
+        + esds,
+    )
+    stsd = _atom(b"stsd", bytes(4) + struct.pack(">I", 1) + mp4a)
+    empty_table = bytes(8)
+    stbl = _atom(
+        b"stbl",
+        stsd
+        + _atom(b"stts", empty_table)
+        + _atom(b"stsc", empty_table)
+        + _atom(b"stsz", bytes(12))
+        + _atom(b"stco", empty_table),
+    )
+    minf = _atom(b"minf", _atom(b"smhd", bytes(8)) + stbl)
+    mdia = _atom(b"mdia", mdhd + hdlr + minf)
+    moov = _atom(b"moov", mvhd + _atom(b"trak", tkhd + mdia))
+    ftyp = _atom(b"ftyp", b"M4A \x00\x00\x02\x00M4A mp42isom")
+    return ftyp + moov + _atom(b"mdat", bytes(256))
+
+
+def _ogg_stream(packets: list[bytes], final_granule: int) -> bytes:
+    serial = 0x5EED
+    pages = []
+    head = OggPage()
+    head.serial, head.sequence, head.position = serial, 0, 0
+    head.first = True
+    head.packets = [packets[0]]
+    pages.append(head)
+    tags = OggPage()
+    tags.serial, tags.sequence, tags.position = serial, 1, 0
+    tags.packets = packets[1:]
+    pages.append(tags)
+    audio = OggPage()
+    audio.serial, audio.sequence, audio.position = serial, 2, final_granule
+    audio.last = True
+    audio.packets = [bytes(64)]
+    pages.append(audio)
+    return b"".join(page.write() for page in pages)
+
+
+def _vorbis_template(duration: float) -> bytes:
+    rate = 44100
+    ident = (
+        b"\x01vorbis"
+        + struct.pack("<IBI", 0, 2, rate)
+        + struct.pack("<iii", 0, 160000, 0)
+        + b"\xb8\x01"
+    )
+    comment = b"\x03vorbis" + struct.pack("<I", 0) + struct.pack("<I", 0) + b"\x01"
+    setup = b"\x05vorbis" + bytes(32)
+    return _ogg_stream([ident, comment, setup], int(duration * rate))
+
+
+def _opus_template(duration: float) -> bytes:
+    pre_skip = 312
+    head = b"OpusHead" + struct.pack("<BBHIhB", 1, 2, pre_skip, 48000, 0, 0)
+    tags = b"OpusTags" + struct.pack("<I", 0) + struct.pack("<I", 0)
+    return _ogg_stream([head, tags], int(duration * 48000) + pre_skip)
+
+
+def _asf_object(guid: str, payload: bytes) -> bytes:
+    return guid2bytes(guid) + struct.pack("<Q", 24 + len(payload)) + payload
+
+
+def _asf_template(duration: float) -> bytes:
+    preroll_ms = 3000
+    play_duration = int((duration + preroll_ms / 1000) * 10_000_000)
+    file_properties = _asf_object(
+        "8CABDCA1-A947-11CF-8EE4-00C00C205365",
+        bytes(16)
+        + struct.pack("<QQQQQQ", 0, 0, 0, play_duration, play_duration, preroll_ms)
+        + struct.pack("<IIII", 2, 3200, 3200, 192000),
+    )
+    wave_format = struct.pack("<HHIIHHH", 0x0161, 2, 44100, 24000, 8192, 16, 0)
+    stream_properties = _asf_object(
+        "B7DC0791-A9B7-11CF-8EE6-00C00C205365",
+        guid2bytes("F8699E40-5B4D-11CF-A8FD-00805F5C442B")
+        + guid2bytes("20FB5700-5B55-11CF-A8FD-00805F5C442B")
+        + struct.pack("<QIIHI", 0, len(wave_format), 0, 1, 0)
+        + wave_format,
+    )
+    children = file_properties + stream_properties
+    header = (
+        guid2bytes("75B22630-668E-11CF-A6D9-00AA0062CE6C")
+        + struct.pack("<QIBB", 30 + len(children), 2, 1, 2)
+        + children
+    )
+    data = guid2bytes("75B22636-668E-11CF-A6D9-00AA0062CE6C") + struct.pack(
+        "<Q", 50
+    ) + bytes(26)
+    return header + data
+
+
+def _wav_template(duration: float) -> bytes:
+    # Krótki plik PCM – WAV nie ma nagłówka z długością niezależną od danych
+    rate, samples = 8000, 8000
+    data = bytes(samples)
+    fmt = struct.pack("<HHIIHH", 1, 1, rate, rate, 1, 8)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt
+    body += b"data" + struct.pack("<I", len(data)) + data
+    return b"RIFF" + struct.pack("<I", len(body)) + body
+
+
+TEMPLATES = {
+    ".mp3": _mp3_template,
+    ".flac": _flac_template,
+    ".m4a": _mp4_template,
+    ".aac": _mp4_template,  # file_service czyta .aac jako kontener MP4
+    ".ogg": _vorbis_template,
+    ".opus": _opus_template,
+    ".wma": _asf_template,
+    ".wav": _wav_template,
+}
+
+
+def make_cover(size: int, seed: int) -> bytes:
+    """Noise PNG of size x size pixels – incompressible, like a real photo cover."""
+    rng = random.Random(seed)
+    raw = b"".join(
+        b"\x00" + rng.randbytes(size * 3) for _ in range(size)
+    )
+
+    def chunk(kind: bytes, payload: bytes) -> bytes:
+        return (
+            struct.pack(">I", len(payload))
+            + kind
+            + payload
+            + struct.pack(">I", zlib.crc32(kind + payload) & 0xFFFFFFFF)
+        )
+
+    ihdr = struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", ihdr)
+        + chunk(b"IDAT", zlib.compress(raw, 1))
+        + chunk(b"IEND", b"")
+    )
+
+
+# --- Tagowanie ---
+
+
+def write_tags(path: str, tags: dict, cover: Optional[bytes]) -> None:
+    """Write title/artist/album/year/track/genre and an optional PNG cover."""
+    ext = os.path.splitext(path)[1].lower()
+
+    if ext == ".mp3":
+        audio = MP3(path)
+        audio.add_tags()
+        audio.tags.add(TIT2(encoding=3, text=tags["title"]))
+        audio.tags.add(TPE1(encoding=3, text=tags["artist"]))
+        audio.tags.add(TALB(encoding=3, text=tags["album"]))
+        audio.tags.add(TDRC(encoding=3, text=str(tags["year"])))
+        audio.tags.add(TRCK(encoding=3, text=f"{tags['track']}/{tags['tracks']}"))
+        audio.tags.add(TCON(encoding=3, text=tags["genre"]))
+        if cover:
+            audio.tags.add(APIC(encoding=3, mime="image/png", type=3, desc="", data=cover))
+        audio.save()
+
+    elif ext in (".flac", ".ogg", ".opus"):
+        audio = {".flac": FLAC, ".ogg": OggVorbis, ".opus": OggOpus}[ext](path)
+        if audio.tags is None:
+            audio.add_tags()
+        audio["title"] = tags["title"]
+        audio["artist"] = tags["artist"]
+        audio["album"] = tags["album"]
+        audio["date"] = str(tags["year"])
+        audio["tracknumber"] = str(tags["track"])
+        audio["genre"] = tags["genre"]
+        if cover:
+            picture = Picture()
+            picture.type = 3
+            picture.mime = "image/png"
+            picture.data = cover
+            if ext == ".flac":
+                audio.add_picture(picture)
+            else:
+                audio["METADATA_BLOCK_PICTURE"] = [
+                    base64.b64encode(picture.write()).decode("ascii")
+                ]
+        audio.save()
+
+    elif ext in (".m4a", ".aac"):
+        audio = MP4(path)
+        audio["\xa9nam"] = tags["title"]
+        audio["\xa9ART"] = tags["artist"]
+        audio["\xa9alb"] = tags["album"]
+        audio["\xa9day"] = str(tags["year"])
+        audio["trkn"] = [(tags["track"], tags["tracks"])]
+        audio["\xa9gen"] = tags["genre"]
+        if cover:
+            audio["covr"] = [MP4Cover(cover, imageformat=MP4Cover.FORMAT_PNG)]
+        audio.save()
+
+    elif ext == ".wma":
+        audio = ASF(path)
+        audio["Title"] = tags["title"]
+        audio["Author"] = tags["artist"]
+        audio["WM/AlbumTitle"] = tags["album"]
+        audio["WM/Year"] = str(tags["year"])
+        audio["WM/TrackNumber"] = str(tags["track"])
+        audio["WM/Genre"] = tags["genre"]
+        audio.save()
+
+    elif ext == ".wav":
+        audio = WAVE(path)
+        audio.add_tags()
+        audio.tags.add(TIT2(encoding=3, text=tags["title"]))
+        audio.tags.add(TPE1(encoding=3, text=tags["artist"]))
+        audio.save()
+
+
+# --- Generowanie biblioteki ---
+
+
+def _name(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS).capitalize() for _ in range(words))
+
+
+def plan_library(
+    size: int,
+    formats: tuple[str, ...] = FORMATS,
+    seed: int = 1,
+    untagged_ratio: float = 0.05,
+    cover_ratio: float = 0.8,
+) -> list[dict]:
+    """
+    Deterministic list of tracks laid out as Artist/Album/NN - Title.ext.
+    Each album uses one format and shares one cover, like a real rip.
+    """
+    rng = random.Random(seed)
+    tracks: list[dict] = []
+    album_index = 0
+    while len(tracks) < size:
+        artist = _name(rng, rng.randint(1, 3))
+        for _ in range(rng.randint(1, 4)):
+            album_index += 1
+            album = _name(rng, rng.randint(1, 4))
+            year = rng.randint(1960, 2025)
+            genre = rng.choice(_GENRES)
+            ext = formats[album_index % len(formats)]
+            track_count = rng.randint(6, 16)
+            has_cover = rng.random() < cover_ratio
+            for number in range(1, track_count + 1):
+                if len(tracks) >= size:
+                    break
+                title = _name(rng, rng.randint(1, 5))
+                tracks.append(
+                    {
+                        "relpath": os.path.join(
+                            f"{artist} [{album_index // 100}]",
+                            f"{album} ({year}) [{album_index}]",
+                            f"{number:02d} - {title}{ext}",
+                        ),
+                        "tags": None
+                        if rng.random() < untagged_ratio
+                        else {
+                            "title": title,
+                            "artist": artist,
+                            "album": album,
+                            "year": year,
+                            "track": number,
+                            "tracks": track_count,
+                            "genre": genre,
+                        },
+                        "duration": rng.uniform(90, 420),
+                        "cover_seed": album_index if has_cover else None,
+                    }
+                )
+    return tracks
+
+
+def _write_batch(root: str, batch: list[dict], cover_size: int) -> int:
+    covers: dict[int, bytes] = {}
+    for track in batch:
+        path = os.path.join(root, track["relpath"])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        ext = os.path.splitext(path)[1]
+        with open(path, "wb") as f:
+            f.write(TEMPLATES[ext](track["duration"]))
+        if track["tags"] is None:
+            continue
+        cover = None
+        if track["cover_seed"] is not None and cover_size > 0:
+            cover = covers.get(track["cover_seed"])
+            if cover is None:
+                cover = covers[track["cover_seed"]] = make_cover(
+                    cover_size, track["cover_seed"]
+                )
+        write_tags(path, track["tags"], cover)
+    return len(batch)
+
+
+def generate_library(
+    root: str,
+    size: int,
+    formats: tuple[str, ...] = FORMATS,
+    seed: int = 1,
+    cover_size: int = 128,
+    untagged_ratio: float = 0.05,
+    cover_ratio: float = 0.8,
+    jobs: Optional[int] = None,
+) -> dict:
+    """
+    Generate the library under `root` unless an identical one is already there.
+    Returns the manifest describing the library.
+    """
+    manifest = {
+        "size": size,
+        "formats": list(formats),
+        "seed": seed,
+        "cover_size": cover_size,
+        "untagged_ratio": untagged_ratio,
+        "cover_ratio": cover_ratio,
+    }
+    manifest_path = os.path.join(root, MANIFEST)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            existing = json.load(f)
+        if {k: existing.get(k) for k in manifest} == manifest:
+            return existing
+        raise RuntimeError(f"{root} holds a different benchmark library; pick another dir")
+
+    tracks = plan_library(size, formats, seed, untagged_ratio, cover_ratio)
+    started = time.perf_counter()
+    # Albumy nie są dzielone między batche, więc okładka liczy się raz na album
+    batches: list[list[dict]] = [[]]
+    for track in tracks:
+        if len(batches[-1]) >= 500 and os.path.basename(track["relpath"]).startswith("01 - "):
+            batches.append([])
+        batches[-1].append(track)
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        written = sum(
+            pool.map(_write_batch, [root] * len(batches), batches, [cover_size] * len(batches))
+        )
+
+    manifest["generated_in_s"] = round(time.perf_counter() - started, 3)
+    manifest["files"] = written
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("root", help="Directory to create the library in")
+    parser.add_argument("--size", type=int, default=1000)
+    parser.add_argument("--formats", default=",".join(FORMATS))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--cover-size", type=int, default=128, help="Cover edge in px, 0 = none")
+    parser.add_argument("--untagged-ratio", type=float, default=0.05)
+    parser.add_argument("--cover-ratio", type=float, default=0.8)
+    parser.add_argument("--jobs", type=int, default=None)
+    args = parser.parse_args()
+
+    manifest = generate_library(
+        args.root,
+        args.size,
+        formats=tuple(f if f.startswith(".") else f".{f}" for f in args.formats.split(",")),
+        seed=args.seed,
+        cover_size=args.cover_size,
+        untagged_ratio=args.untagged_ratio,
+        cover_ratio=args.cover_ratio,
+        jobs=args.jobs,
+    )
+    print(json.dumps(manifest, indent=2))
+
+
+if __name__ == "__main__":
+    main()
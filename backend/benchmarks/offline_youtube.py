@@ -0,0 +1,299 @@
+"""
+Offline stand-in for YouTube: a yt-dlp extractor plus a local media server.
+
+`install()` replaces `yt_dlp.YoutubeDL` with a subclass whose only extractor
+answers `ytsearchN:` queries and youtube.com / youtu.be URLs with synthetic
+results. Format URLs point at a local HTTP server that streams CBR MP3 at a
+configurable transfer rate, latency and error rate, so the whole download
+pipeline (yt-dlp HTTP downloader, progress hooks, post-processing, publish)
+runs without network access.
+
+    server = MediaServer(rate_limit=512 * 1024, latency=0.05, error_rate=0.02)
+    server.start()
+    install(server, extract_latency=0.2)
+"""
+
+import hashlib
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import urlparse
+
+import yt_dlp
+from yt_dlp.extractor.common import InfoExtractor
+from yt_dlp.utils import ExtractorError
+
+_RealYoutubeDL = yt_dlp.YoutubeDL
+
+# Indeksy bitrate MPEG-1 Layer III
+_MP3_BITRATES = {32: 1, 40: 2, 48: 3, 56: 4, 64: 5, 80: 6, 96: 7, 112: 8,
+                 128: 9, 160: 10, 192: 11, 224: 12, 256: 13, 320: 14}
+
+
+def mp3_payload(kbps: int, duration: float) -> bytes:
+    """Silent CBR MP3 (44.1 kHz joint stereo) that ffmpeg decodes without complaint."""
+    if kbps not in _MP3_BITRATES:
+        raise ValueError(f"Unsupported MP3 bitrate {kbps} kbps")
+    header = bytes([0xFF, 0xFB, _MP3_BITRATES[kbps] << 4, 0x64])
+    frame_size = 144000 * kbps // 44100
+    frames = max(1, int(duration * 44100 / 1152))
+    return (header + bytes(frame_size - 4)) * frames
+
+
+def video_id(seed: str) -> str:
+    """Deterministic 11-character YouTube-like id."""
+    digest = hashlib.sha256(seed.encode()).digest()
+    alphabet = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_"
+    return "".join(alphabet[b % 64] for b in digest[:11])
+
+
+class MediaServer:
+    """
+    Threaded HTTP server for `/media/<video_id>/<kbps>.mp3`.
+
+    rate_limit  -- bytes per second per connection, 0 = unlimited
+    latency     -- seconds before the response headers are sent
+    error_rate  -- fraction of requests answered with 503 (fails the download, like an expired URL)
+    duration    -- length of every track in seconds
+    """
+
+    def __init__(
+        self,
+        rate_limit: int = 0,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        duration: float = 180.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        seed: int = 1,
+    ):
+        self.rate_limit = rate_limit
+        self.latency = latency
+        self.error_rate = error_rate
+        self.duration = duration
+        self.requests = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self._rng = random.Random(seed)
+        self._payloads: dict[int, bytes] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def payload(self, kbps: int) -> bytes:
+        with self._lock:
+            data = self._payloads.get(kbps)
+            if data is None:
+                data = self._payloads[kbps] = mp3_payload(kbps, self.duration)
+            return data
+
+    def size(self, kbps: int) -> int:
+        return len(self.payload(kbps))
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            failed = self._rng.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            return failed
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                match = re.fullmatch(r"/media/[\w-]{11}/(\d+)\.mp3", urlparse(self.path).path)
+                if not match:
+                    self.send_error(404)
+                    return
+                try:
+                    data = server.payload(int(match.group(1)))
+                except ValueError:
+                    self.send_error(404)
+                    return
+
+                if server.latency:
+                    time.sleep(server.latency)
+                if server._should_fail():
+                    self.send_error(503, "Synthetic failure")
+                    return
+
+                start, end = 0, len(data) - 1
+                range_header = self.headers.get("Range")
+                range_match = re.fullmatch(r"bytes=(\d+)-(\d*)", range_header or "")
+                if range_match:
+                    start = int(range_match.group(1))
+                    if range_match.group(2):
+                        end = min(end, int(range_match.group(2)))
+                    if start > end:
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{len(data)}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Type", "audio/mpeg")
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(end - start + 1))
+                self.end_headers()
+                self._send_body(memoryview(data)[start : end + 1])
+
+            def _send_body(self, body: memoryview) -> None:
+                chunk = 64 * 1024
+                if server.rate_limit:
+                    chunk = max(1024, min(chunk, server.rate_limit // 20))
+                started = time.monotonic()
+                sent = 0
+                try:
+                    while sent < len(body):
+                        part = body[sent : sent + chunk]
+                        self.wfile.write(part)
+                        sent += len(part)
+                        if server.rate_limit:
+                            ahead = sent / server.rate_limit - (time.monotonic() - started)
+                            if ahead > 0:
+                                time.sleep(ahead)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                with server._lock:
+                    server.bytes_sent += sent
+
+        return Handler
+
+    def start(self) -> "MediaServer":
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, name="offline-media", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+class OfflineYouTubeIE(InfoExtractor):
+    """Answers YouTube searches and video URLs with synthetic metadata."""
+
+    IE_NAME = "offline:youtube"
+    _VALID_URL = r"(?:ytsearch(?P<limit>\d*):(?P<query>.+)|https?://(?:www\.|music\.)?(?:youtube\.com/(?:watch\?v=|shorts/)|youtu\.be/)(?P<id>[\w-]{11}))"
+
+    server: Optional[MediaServer] = None
+    bitrates: tuple[int, ...] = (64, 128, 160)
+    extract_latency = 0.0
+    search_latency = 0.0
+    extract_error_rate = 0.0
+    _rng = random.Random(1)
+    _rng_lock = threading.Lock()
+
+    def _maybe_fail(self, what: str) -> None:
+        with self._rng_lock:
+            failed = self._rng.random() < self.extract_error_rate
+        if failed:
+            raise ExtractorError(f"Synthetic {what} failure", expected=True)
+
+    def _real_extract(self, url):
+        match = re.match(self._VALID_URL, url)
+        if match.group("query") is not None:
+            return self._search(match.group("query"), int(match.group("limit") or 1))
+        return self._video(match.group("id"))
+
+    def _search(self, query: str, limit: int) -> dict:
+        time.sleep(self.search_latency)
+        self._maybe_fail("search")
+        entries = []
+        for index in range(limit):
+            vid = video_id(f"{query}#{index}")
+            entries.append(
+                {
+                    "_type": "url",
+                    "ie_key": self.ie_key(),
+                    "id": vid,
+                    "url": f"https://www.youtube.com/watch?v={vid}",
+                    "title": f"{query.title()} {index + 1}",
+                    "uploader": f"Artist {index % 7}",
+                    "duration": self.server.duration if self.server else 180,
+                }
+            )
+        return self.playlist_result(entries, query, query)
+
+    def _video(self, vid: str) -> dict:
+        time.sleep(self.extract_latency)
+        self._maybe_fail("extract")
+        base = self.server.url if self.server else "http://127.0.0.1:9"
+        formats = [
+            {
+                "format_id": f"mp3-{kbps}",
+                "url": f"{base}/media/{vid}/{kbps}.mp3",
+                "ext": "mp3",
+                "acodec": "mp3",
+                "vcodec": "none",
+                "abr": kbps,
+                "tbr": kbps,
+                "asr": 44100,
+                "audio_channels": 2,
+                "format_note": f"{kbps}k",
+                "filesize": self.server.size(kbps) if self.server else None,
+            }
+            for kbps in self.bitrates
+        ]
+        return {
+            "id": vid,
+            "title": f"Offline Track {vid}",
+            "track": f"Offline Track {vid}",
+            "artist": f"Artist {ord(vid[0]) % 7}",
+            "uploader": f"Artist {ord(vid[0]) % 7}",
+            "album": "Offline Sessions",
+            "upload_date": "20240101",
+            "duration": self.server.duration if self.server else 180,
+            "webpage_url": f"https://www.youtube.com/watch?v={vid}",
+            "formats": formats,
+        }
+
+
+class OfflineYoutubeDL(_RealYoutubeDL):
+    """YoutubeDL that only knows the offline extractor."""
+
+    def __init__(self, params=None, auto_init=True):
+        super().__init__(params, auto_init=False)
+        # Pasek postępu yt-dlp zaśmieca wyjście benchmarku; hooki działają dalej
+        self.params["noprogress"] = True
+        self.add_info_extractor(OfflineYouTubeIE())
+
+
+def install(
+    server: MediaServer,
+    bitrates: tuple[int, ...] = (64, 128, 160),
+    extract_latency: float = 0.0,
+    search_latency: float = 0.0,
+    extract_error_rate: float = 0.0,
+) -> None:
+    """Route every `yt_dlp.YoutubeDL(...)` in this process to the stand-in."""
+    OfflineYouTubeIE.server = server
+    OfflineYouTubeIE.bitrates = bitrates
+    OfflineYouTubeIE.extract_latency = extract_latency
+    OfflineYouTubeIE.search_latency = search_latency
+    OfflineYouTubeIE.extract_error_rate = extract_error_rate
+    yt_dlp.YoutubeDL = OfflineYoutubeDL
+
+
+def uninstall() -> None:
+    yt_dlp.YoutubeDL = _RealYoutubeDL
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import time
+import urllib.parse
+
+import pytest
+
+from app.services.navidrome_service import ScanNotifier
+from conftest import wait_for
+
+
+def subsonic(status: str = "ok", message: str = "") -> tuple[int, str, bytes]:
+    body = {"subsonic-response": {"status": status, "version": "1.16.1"}}
+    if message:
+        body["subsonic-response"]["error"] = {"code": 0, "message": message}
+    return 200, "application/json", json.dumps(body).encode()
+
+
+@pytest.fixture
+def notifiers():
+    created: list[ScanNotifier] = []
+
+    def make(url: str, **kwargs) -> ScanNotifier:
+        notifier = ScanNotifier(url, "admin", "secret", timeout=2, **kwargs)
+        created.append(notifier)
+        return notifier
+
+    yield make
+    for notifier in created:
+        notifier.close(flush=False)
+
+
+def test_burst_of_changes_triggers_one_scan(stand_in, notifiers):
+    navidrome = stand_in(lambda path: subsonic())
+    notifier = notifiers(navidrome.url, quiet_period=0.2, max_delay=10)
+
+    for i in range(200):
+        notifier.notify(f"/media/track-{i}.opus")
+
+    assert wait_for(lambda: navidrome.count >= 1)
+    time.sleep(0.5)
+    assert navidrome.count == 1
+    assert notifier.scans_triggered == 1
+    assert notifier.pending == 0
+
+    _, path = navidrome.requests[0]
+    url = urllib.parse.urlsplit(path)
+    params = dict(urllib.parse.parse_qsl(url.query))
+    assert url.path == "/rest/startScan"
+    assert params["u"] == "admin"
+    assert params["t"] == hashlib.md5(("secret" + params["s"]).encode()).hexdigest()
+    assert "fullScan" not in params
+
+
+def test_scan_fires_within_max_delay_of_a_long_import(stand_in, notifiers):
+    navidrome = stand_in(lambda path: subsonic())
+    notifier = notifiers(navidrome.url, quiet_period=0.3, max_delay=0.6)
+
+    started = time.monotonic()
+    # Zmiany co 0,1 s – okres ciszy nigdy nie mija
+    while time.monotonic() - started < 1.5:
+        notifier.notify()
+        time.sleep(0.1)
+
+    assert navidrome.count >= 2
+    first_scan = navidrome.requests[0][0] - started
+    assert 0.5 <= first_scan <= 0.9
+
+
+def test_failed_scan_is_retried_with_backoff(stand_in, notifiers):
+    responses = iter(
+        [
+            (500, "text/plain", b"boom"),
+            subsonic("failed", "Scan already in progress"),
+        ]
+    )
+    navidrome = stand_in(lambda path: next(responses, subsonic()))
+    notifier = notifiers(navidrome.url, quiet_period=0.05, retry_delay=0.2, retry_max_delay=10)
+
+    notifier.notify("/media/new.opus")
+
+    assert wait_for(lambda: notifier.scans_triggered == 1)
+    times = [at for at, _ in navidrome.requests]
+    assert times[1] - times[0] >= 0.18
+    assert times[2] - times[1] >= 0.38
+    assert notifier.scans_failed == 2
+    assert notifier.scans_triggered == 1
+    assert notifier.pending == 0
+
+    time.sleep(0.3)
+    assert navidrome.count == 3
+
+
+def test_retry_backoff_is_capped(stand_in, notifiers):
+    navidrome = stand_in(lambda path: subsonic("failed", "down"))
+    notifier = notifiers(navidrome.url, quiet_period=0.01, retry_delay=0.05, retry_max_delay=0.1)
+
+    notifier.notify()
+
+    assert wait_for(lambda: navidrome.count >= 6)
+    times = [at for at, _ in navidrome.requests]
+    assert max(b - a for a, b in zip(times[2:], times[3:])) < 0.3
+    # Zmiany z nieudanych prób nie giną
+    assert wait_for(lambda: notifier.pending == 1)
@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.services import thumbnail_service
+from app.services.thumbnail_service import ThumbnailNotFound, get_thumbnail
+
+IMAGE_SIZE = 1000
+# Poprawne 11-znakowe ID filmów
+VIDEO_A, VIDEO_B, VIDEO_C = "aaaaaaaaaaa", "bbbbbbbbbbb", "ccccccccccc"
+
+
+def image(path: str) -> bytes:
+    """Fake JPEG whose content depends on the requested path."""
+    return path.encode().ljust(IMAGE_SIZE, b"\0")
+
+
+@pytest.fixture
+def upstream(stand_in, tmp_path, monkeypatch):
+    """Image CDN stand-in (404 for ID "missing"); the cache lives in tmp_path."""
+    delay = {"seconds": 0.0}
+
+    def respond(path: str):
+        time.sleep(delay["seconds"])
+        if "/missing0000/" in path:
+            return 404, "text/plain", b"not found"
+        return 200, "image/jpeg", image(path)
+
+    server = stand_in(respond)
+    server.delay = delay
+    monkeypatch.setattr(thumbnail_service, "THUMBNAIL_UPSTREAM", server.url)
+    monkeypatch.setattr(thumbnail_service, "THUMBNAIL_CACHE_DIR", str(tmp_path / "thumbnails"))
+    monkeypatch.setattr(thumbnail_service, "THUMBNAIL_CACHE_MAX_BYTES", 10 * IMAGE_SIZE)
+    monkeypatch.setattr(thumbnail_service, "_cache_bytes", None)
+    return server
+
+
+def cached_files() -> list[str]:
+    return sorted(os.listdir(thumbnail_service.THUMBNAIL_CACHE_DIR))
+
+
+def test_concurrent_requests_share_one_upstream_fetch(upstream):
+    upstream.delay["seconds"] = 0.3
+    start = threading.Barrier(8)
+
+    def request(_):
+        start.wait()
+        return get_thumbnail(VIDEO_A)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(request, range(8)))
+
+    assert upstream.count == 1
+    assert results == [image(f"/vi/{VIDEO_A}/mqdefault.jpg")] * 8
+    assert not thumbnail_service._inflight
+
+    # Kolejne żądanie idzie z dysku
+    assert get_thumbnail(VIDEO_A) == results[0]
+    assert upstream.count == 1
+
+
+def test_first_stored_thumbnail_is_counted_once(upstream):
+    get_thumbnail(VIDEO_A)
+
+    assert thumbnail_service._cache_bytes == IMAGE_SIZE
+
+
+def test_least_recently_used_thumbnails_are_evicted(upstream, monkeypatch):
+    monkeypatch.setattr(thumbnail_service, "THUMBNAIL_CACHE_MAX_BYTES", int(2.5 * IMAGE_SIZE))
+
+    get_thumbnail(VIDEO_A)
+    time.sleep(0.02)
+    get_thumbnail(VIDEO_B)
+    time.sleep(0.02)
+    # Odczyt A odświeża jego znacznik LRU – najstarszy jest teraz B
+    get_thumbnail(VIDEO_A)
+    time.sleep(0.02)
+    get_thumbnail(VIDEO_C)
+
+    assert cached_files() == [f"{VIDEO_A}_mqdefault.jpg", f"{VIDEO_C}_mqdefault.jpg"]
+    assert thumbnail_service._cache_bytes == 2 * IMAGE_SIZE
+    assert upstream.count == 3
+
+
+def test_missing_upstream_thumbnail_raises_not_found(upstream):
+    with pytest.raises(ThumbnailNotFound):
+        get_thumbnail("missing0000")
+
+    assert not os.path.isdir(thumbnail_service.THUMBNAIL_CACHE_DIR) or not cached_files()
+    assert not thumbnail_service._inflight
+
+
+def test_invalid_ids_and_variants_are_rejected(upstream):
+    with pytest.raises(ValueError):
+        get_thumbnail("../../etc/pa")
+    with pytest.raises(ValueError):
+        get_thumbnail(VIDEO_A, "huge")
+    assert upstream.count == 0
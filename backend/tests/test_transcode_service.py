@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+from app.services import catalog_service
+from app.services.transcode_service import _resolve_per_root, output_path
+
+
+@pytest.fixture
+def roots(tmp_path, monkeypatch):
+    """Two library roots, "a" with a symlink pointing out of the library."""
+    for name in ("a/Rock", "b/Jazz", "outside"):
+        (tmp_path / name).mkdir(parents=True)
+    os.symlink(tmp_path / "outside", tmp_path / "a" / "escape")
+    monkeypatch.setattr(
+        catalog_service, "ROOTS", catalog_service.parse_roots(f"{tmp_path / 'a'};{tmp_path / 'b'}")
+    )
+    return tmp_path
+
+
+def test_output_mirrors_the_root_of_each_source(roots):
+    output_roots = _resolve_per_root("mobile")
+
+    assert output_path(str(roots / "a/Rock/x.flac"), "opus", output_roots) == str(
+        roots / "a/mobile/Rock/x.opus"
+    )
+    assert output_path(str(roots / "b/Jazz/y.flac"), "opus", output_roots) == str(
+        roots / "b/mobile/Jazz/y.opus"
+    )
+
+
+def test_absolute_output_dir_inside_a_root_is_allowed(roots):
+    output_roots = _resolve_per_root(str(roots / "b/mobile"))
+
+    assert output_path(str(roots / "a/Rock/x.flac"), "mp3", output_roots) == str(
+        roots / "b/mobile/Rock/x.mp3"
+    )
+
+
+@pytest.mark.parametrize("path", ["/etc", "../../etc", "../outside", "escape", "escape/deeper"])
+def test_paths_outside_the_library_are_rejected(roots, path):
+    with pytest.raises(ValueError):
+        _resolve_per_root(path)
+
+
+def test_sources_outside_the_library_are_rejected(roots):
+    with pytest.raises(ValueError):
+        output_path(str(roots / "outside/z.flac"), "opus", _resolve_per_root("mobile"))
+
+
+def test_without_output_dir_the_file_stays_next_to_the_source(roots):
+    assert output_path(str(roots / "a/Rock/x.flac"), "opus") == str(roots / "a/Rock/x.opus")
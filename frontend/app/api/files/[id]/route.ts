@@ -9,12 +9,23 @@ export async function GET(
   try {
     const { id } = await params;
 
+    const ifNoneMatch = request.headers.get('if-none-match');
     const res = await fetch(`${BACKEND_URL}/api/files/${id}`, {
       headers: {
         'Accept': 'application/json',
+        ...(ifNoneMatch ? { 'If-None-Match': ifNoneMatch } : {}),
       },
+      cache: 'no-store',
     });
 
+    const etag = res.headers.get('etag');
+    const cacheHeaders: Record<string, string> = etag
+      ? { 'ETag': etag, 'Cache-Control': 'no-cache' }
+      : {};
+    if (res.status === 304) {
+      return new NextResponse(null, { status: 304, headers: cacheHeaders });
+    }
+
     if (!res.ok) {
       if (res.status === 404) {
         return NextResponse.json(
@@ -26,7 +37,7 @@ export async function GET(
     }
 
     const data = await res.json();
-    return NextResponse.json(data);
+    return NextResponse.json(data, { headers: cacheHeaders });
   } catch (error) {
     return NextResponse.json(
       { 
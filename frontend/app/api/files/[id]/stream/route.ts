@@ -0,0 +1,54 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+const BACKEND_URL = process.env.API_URL || 'http://localhost:8000';
+
+// Nagłówki, które przeglądarka musi zobaczyć, żeby przewijać odtwarzacz
+const PASSTHROUGH_HEADERS = [
+  'content-type',
+  'content-length',
+  'content-range',
+  'accept-ranges',
+  'etag',
+  'last-modified',
+  'cache-control',
+  'retry-after',
+];
+
+export async function GET(
+  request: NextRequest,
+  { params }: { params: Promise<{ id: string }> }
+) {
+  try {
+    const { id } = await params;
+    const { searchParams } = new URL(request.url);
+
+    // Range i If-Range idą do backendu – odpowiedź 206 zawiera tylko żądany fragment
+    const forwarded: Record<string, string> = {};
+    for (const name of ['range', 'if-range']) {
+      const value = request.headers.get(name);
+      if (value) forwarded[name] = value;
+    }
+
+    const res = await fetch(
+      `${BACKEND_URL}/api/files/${id}/stream?${searchParams.toString()}`,
+      { headers: forwarded, cache: 'no-store', signal: request.signal }
+    );
+
+    const headers = new Headers();
+    for (const name of PASSTHROUGH_HEADERS) {
+      const value = res.headers.get(name);
+      if (value) headers.set(name, value);
+    }
+
+    // Treść jest przekazywana strumieniowo, bez buforowania całego pliku
+    return new NextResponse(res.body, { status: res.status, headers });
+  } catch (error) {
+    return NextResponse.json(
+      { 
+        error: 'Failed to stream file', 
+        details: error instanceof Error ? error.message : 'Unknown error' 
+      },
+      { status: 500 }
+    );
+  }
+}
@@ -17,18 +17,30 @@ export async function GET(request: NextRequest) {
       backendParams.append('search', search);
     }
 
+    const ifNoneMatch = request.headers.get('if-none-match');
     const res = await fetch(`${BACKEND_URL}/api/files?${backendParams.toString()}`, {
       headers: {
         'Accept': 'application/json',
+        ...(ifNoneMatch ? { 'If-None-Match': ifNoneMatch } : {}),
       },
+      cache: 'no-store',
     });
 
+    // Katalog się nie zmienił – przeglądarka użyje swojej kopii
+    const etag = res.headers.get('etag');
+    const cacheHeaders: Record<string, string> = etag
+      ? { 'ETag': etag, 'Cache-Control': 'no-cache' }
+      : {};
+    if (res.status === 304) {
+      return new NextResponse(null, { status: 304, headers: cacheHeaders });
+    }
+
     if (!res.ok) {
       throw new Error(`Backend returned ${res.status}`);
     }
 
     const data = await res.json();
-    return NextResponse.json(data);
+    return NextResponse.json(data, { headers: cacheHeaders });
   } catch (error) {
     return NextResponse.json(
       { 
@@ -0,0 +1,51 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+const BACKEND_URL = process.env.API_URL || 'http://localhost:8000';
+
+export async function GET(
+  request: NextRequest,
+  { params }: { params: Promise<{ id: string }> }
+) {
+  try {
+    const { id } = await params;
+    const { searchParams } = new URL(request.url);
+    const variant = searchParams.get('variant');
+    const query = variant ? `?variant=${encodeURIComponent(variant)}` : '';
+
+    const res = await fetch(
+      `${BACKEND_URL}/api/youtube/thumbnail/${encodeURIComponent(id)}${query}`,
+      {
+        headers: {
+          'Accept': 'image/jpeg, image/*',
+        },
+      }
+    );
+
+    if (!res.ok) {
+      return NextResponse.json(
+        { error: 'Thumbnail not available' },
+        { status: res.status }
+      );
+    }
+
+    const imageBuffer = await res.arrayBuffer();
+
+    // Miniaturki są niezmienne dla danego wideo – przekazujemy długi cache z backendu
+    return new NextResponse(imageBuffer, {
+      status: 200,
+      headers: {
+        'Content-Type': res.headers.get('content-type') || 'image/jpeg',
+        'Cache-Control':
+          res.headers.get('cache-control') || 'public, max-age=604800, immutable',
+      },
+    });
+  } catch (error) {
+    return NextResponse.json(
+      {
+        error: 'Failed to fetch thumbnail',
+        details: error instanceof Error ? error.message : 'Unknown error'
+      },
+      { status: 500 }
+    );
+  }
+}